@@ -1,8 +1,9 @@
 from flask import Flask, request, abort
-import json
 from functools import wraps
 from jose import jwt
-from urllib.request import urlopen
+
+from jwks import JWKSKeyStore
+from token_cache import VerifiedTokenCache
 
 
 app = Flask(__name__)
@@ -11,6 +12,11 @@ AUTH0_DOMAIN = @TODO_REPLACE_WITH_YOUR_DOMAIN
 ALGORITHMS = ['RS256']
 API_AUDIENCE = @TODO_REPLACE_WITH_YOUR_API_AUDIENCE
 
+# Signing keys are fetched once and refreshed in the background, not per request.
+jwks_store = JWKSKeyStore(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+# Payloads of already verified tokens, keyed by token digest, until their exp.
+token_cache = VerifiedTokenCache()
+
 
 class AuthError(Exception):
     def __init__(self, error, status_code):
@@ -29,7 +35,7 @@ def get_token_auth_header():
         }, 401)
 
     parts = auth.split()
-    if parts[0].lower() != 'bearer':
+    if not parts or parts[0].lower() != 'bearer':
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Authorization header must start with "Bearer".'
@@ -52,25 +58,14 @@ def get_token_auth_header():
 
 
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
     unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
     if 'kid' not in unverified_header:
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    rsa_key = jwks_store.get_key(unverified_header['kid'])
     if rsa_key:
         try:
             payload = jwt.decode(
@@ -110,7 +105,10 @@ def requires_auth(f):
     def wrapper(*args, **kwargs):
         token = get_token_auth_header()
         try:
-            payload = verify_decode_jwt(token)
+            payload = token_cache.get(token)
+            if payload is None:
+                payload = verify_decode_jwt(token)
+                token_cache.put(token, payload)
         except:
             abort(401)
         return f(payload, *args, **kwargs)
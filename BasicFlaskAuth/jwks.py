@@ -0,0 +1,113 @@
+import json
+import threading
+import time
+from urllib.request import urlopen
+
+
+'''
+JWKSKeyStore
+A shared, cached view of an Auth0 /.well-known/jwks.json key set
+
+    the keys are fetched once and indexed by their key id (kid)
+    a daemon thread refreshes them every `ttl` seconds
+    an unknown kid triggers a re-fetch, at most once every `min_refetch_interval` seconds
+    when a fetch fails the last good key set keeps being served
+
+    EXAMPLE
+        store = JWKSKeyStore('https://udacity-fsnd.auth0.com/.well-known/jwks.json')
+        rsa_key = store.get_key(unverified_header['kid'])
+
+    !!NOTE the url can be any urlopen target, e.g. file:///tmp/jwks.json or a local stub server
+'''
+class JWKSKeyStore:
+    def __init__(self, url, ttl=3600, min_refetch_interval=30, timeout=5,
+                 background_refresh=True):
+        self.url = url
+        self.ttl = ttl
+        self.min_refetch_interval = min_refetch_interval
+        self.timeout = timeout
+        self.background_refresh = background_refresh
+        self.fetch_count = 0
+        self.last_error = None
+        self._keys = None
+        self._fetched_at = None
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._refresher = None
+
+    '''
+    fetch_jwks()
+        downloads and parses the raw key set
+        override or replace to change the transport
+    '''
+    def fetch_jwks(self):
+        with urlopen(self.url, timeout=self.timeout) as jsonurl:
+            return json.loads(jsonurl.read())
+
+    '''
+    refresh()
+        re-fetches the key set and swaps it in
+        keeps the last good key set and returns False if the fetch fails
+    '''
+    def refresh(self):
+        try:
+            jwks = self.fetch_jwks()
+            keys = {}
+            for key in jwks['keys']:
+                keys[key['kid']] = {
+                    'kty': key['kty'],
+                    'kid': key['kid'],
+                    'use': key['use'],
+                    'n': key['n'],
+                    'e': key['e']
+                }
+        except Exception as error:
+            self.last_error = error
+            with self._lock:
+                self._fetched_at = time.monotonic()
+            return False
+
+        with self._lock:
+            self._keys = keys
+            self._fetched_at = time.monotonic()
+            self.fetch_count += 1
+            self.last_error = None
+        return True
+
+    '''
+    get_key(kid)
+        returns the rsa key for kid, or None if the key set does not contain it
+    '''
+    def get_key(self, kid):
+        keys = self._keys
+        if keys is None or kid not in keys:
+            # only one caller re-fetches, the others wait and reuse its result
+            with self._fetch_lock:
+                keys = self._keys
+                if (keys is None or kid not in keys) and self._may_refetch():
+                    self.refresh()
+                    keys = self._keys
+            self._start_refresher()
+        return (keys or {}).get(kid)
+
+    def _may_refetch(self):
+        return (self._fetched_at is None or
+                time.monotonic() - self._fetched_at >= self.min_refetch_interval)
+
+    def stop(self):
+        self._stop.set()
+
+    def _start_refresher(self):
+        if not self.background_refresh or self._refresher is not None:
+            return
+        with self._lock:
+            if self._refresher is not None:
+                return
+            self._refresher = threading.Thread(
+                target=self._refresh_loop, name='jwks-refresh', daemon=True)
+            self._refresher.start()
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.ttl):
+            self.refresh()
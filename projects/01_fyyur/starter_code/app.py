@@ -7,23 +7,39 @@ from operator import truediv
 from typing import final
 import dateutil.parser
 from sqlalchemy.orm import query
-import babel
+import babel.dates
 from flask import (Flask,
+                   abort,
                    render_template,
                    request,
                    Response,
                    flash,
                    redirect,
+                   stream_with_context,
                    url_for)
 from flask_moment import Moment
+from jinja2 import FileSystemBytecodeCache
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
 from models import Venue, Artist, Show, db
+import counters
+import exporter
+from fragments import FragmentCache
+from pool import engine_options, pool_metrics
+from query_stats import QueryStats
+import importer
+from search import NameIndexes, ResultCache, escape_like, normalize_query
 from flask_migrate import Migrate
 import sys
-from datetime import datetime
+import time
+import click
+from datetime import datetime, timedelta
+from functools import lru_cache
+from itertools import groupby
+from sqlalchemy.dialects.postgresql import array
+from sqlalchemy.exc import IntegrityError
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -31,8 +47,19 @@ from datetime import datetime
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
+# Pool size, overflow, recycle and pre-ping from the DB_POOL_* environment
+# variables, see pool.py.
+app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options())
 db.init_app(app)
 migrate = Migrate(app, db)
+# X-DB-Queries / X-DB-Time headers, slow query log and query budgets.
+query_stats = QueryStats(app)
+# Rendered page fragments, see fragments.py.
+fragment_cache = FragmentCache(app)
+if app.config.get('TEMPLATE_CACHE_DIR'):
+    # Compiled templates, shared by the workers and kept across restarts.
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(
+        app.config['TEMPLATE_CACHE_DIR'])
 
 
 # TODO: connect to a local postgresql database : Done
@@ -40,17 +67,374 @@ migrate = Migrate(app, db)
 # Filters.
 #----------------------------------------------------------------------------#
 
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma"
+}
+DATETIME_LOCALE = babel.Locale.parse(babel.dates.LC_TIME)
+
+
+@lru_cache(maxsize=None)
+def datetime_pattern(format):
+    # The Babel pattern of a format name (or of a custom pattern), parsed once.
+    return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format))
+
+
+@lru_cache(maxsize=4096)
 def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format)
+    # Show pages repeat the same start times, so the last few thousand
+    # formatted values are kept. Views pass datetimes, only strings are
+    # parsed. The patterns use no time zone field, so naive datetimes are
+    # formatted as they are, like babel.dates.format_datetime does in UTC.
+    date = value if isinstance(value, datetime) else dateutil.parser.parse(value)
+    return datetime_pattern(format).apply(date, DATETIME_LOCALE)
 
 
 app.jinja_env.filters['datetime'] = format_datetime
 
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+SHOWS_PER_PAGE = 30
+SHOWS_EXPORT_BATCH = 1000
+SEARCH_RESULTS_PER_PAGE = 20
+SEARCH_HITS_PER_TYPE = 10
+SEARCH_TYPES = ('venue', 'artist', 'city', 'genre')
+AUTOCOMPLETE_LIMIT = 10
+
+# In-process name indexes: the /autocomplete prefix index, and the search
+# indexes used when SEARCH_BACKEND is 'memory'. Names inserted by other
+# processes are picked up every NAME_INDEX_REFRESH seconds.
+name_indexes = NameIndexes(db, (Venue, Artist),
+                           refresh=app.config.get('NAME_INDEX_REFRESH', 30))
+# /search results by normalized query.
+search_cache = ResultCache(ttl=60)
+search_cache.watch(db, (Venue, Artist))
+# Show counts of venues and artists, kept up to date on show writes.
+counters.watch()
+
+
+@app.before_first_request
+def load_prefix_index():
+    # Build the autocomplete index before serving the first request, under
+    # python app.py, flask run or gunicorn alike.
+    name_indexes.prefixes()
+
+
+def paged_shows(other, show_fk, other_fk, entity, past_page=1, upcoming_page=1):
+    # One page of the upcoming and of the past shows of a venue (or artist),
+    # in a single ordered query. Each row is ranked inside its group, by the
+    # upcoming flag the counters use, so the pages agree with the stored
+    # upcoming_shows_count / past_shows_count of entity, which give the page
+    # counts without counting shows. Upcoming shows are paged from the
+    # soonest, past shows from the latest. other is the model on the other
+    # side of the show (Artist for a venue), show_fk the Show column pointing
+    # at the entity, other_fk at other.
+    ranked = db.session.query(
+        other.id,
+        other.name,
+        other.image_link,
+        Show.start_time,
+        Show.upcoming,
+        db.func.row_number().over(
+            partition_by=Show.upcoming, order_by=(Show.start_time, Show.id)
+        ).label('position'),
+        db.func.row_number().over(
+            partition_by=Show.upcoming,
+            order_by=(Show.start_time.desc(), Show.id.desc())
+        ).label('position_from_end')
+    ).join(other, other_fk == other.id).filter(show_fk == entity.id).subquery()
+
+    upcoming_from = (max(upcoming_page, 1) - 1) * SHOWS_PER_PAGE + 1
+    past_from = (max(past_page, 1) - 1) * SHOWS_PER_PAGE + 1
+    rows = db.session.query(ranked).filter(db.or_(
+        db.and_(
+            ranked.c.upcoming,
+            ranked.c.position.between(upcoming_from, upcoming_from + SHOWS_PER_PAGE - 1)
+        ),
+        db.and_(
+            db.not_(ranked.c.upcoming),
+            ranked.c.position_from_end.between(past_from, past_from + SHOWS_PER_PAGE - 1)
+        )
+    )).order_by(ranked.c.start_time)
+
+    result = {
+        'past_shows': [],
+        'upcoming_shows': [],
+        'past_shows_count': entity.past_shows_count,
+        'upcoming_shows_count': entity.upcoming_shows_count
+    }
+    for row in rows:
+        if row.upcoming:
+            result['upcoming_shows'].append(row)
+        else:
+            result['past_shows'].append(row)
+    result['past_shows'].reverse()
+    result['past_pages'] = -(-result['past_shows_count'] // SHOWS_PER_PAGE)
+    result['upcoming_pages'] = -(-result['upcoming_shows_count'] // SHOWS_PER_PAGE)
+    return result
+
+
+def keyset_shows(after=None, before=None, limit=SHOWS_PER_PAGE):
+    # One page of the shows listing, ordered by (start_time, id).
+    # The page starts right after the `after` key (or ends right before the
+    # `before` key), so the database seeks into ix_shows_start_time_id instead
+    # of counting rows as OFFSET would. Venue and artist names come from the
+    # same joined query, so a page is one round-trip. Rows are plain columns,
+    # not Show instances, which keeps the streamed export cheap.
+    # Returns (rows, more), more telling whether another page follows in the
+    # direction of the walk.
+    key = db.tuple_(Show.start_time, Show.id)
+    query = db.session.query(
+        Show.id,
+        Show.venue_id,
+        Venue.name.label('venue_name'),
+        Show.artist_id,
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'),
+        Show.start_time
+    ).join(Venue, Show.venue_id == Venue.id).join(Artist, Show.artist_id == Artist.id)
+    if before is not None:
+        query = query.filter(key < db.tuple_(*before)).order_by(
+            Show.start_time.desc(), Show.id.desc())
+    else:
+        if after is not None:
+            query = query.filter(key > db.tuple_(*after))
+        query = query.order_by(Show.start_time, Show.id)
+    rows = query.limit(limit + 1).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if before is not None:
+        rows.reverse()
+    return rows, more
+
+
+def encode_cursor(show):
+    return '{}_{}'.format(show.start_time.isoformat(), show.id)
+
+
+def decode_cursor(value):
+    # (start_time, id) from a cursor made by encode_cursor, None if missing
+    # or malformed.
+    try:
+        start_time, id = value.rsplit('_', 1)
+        return datetime.fromisoformat(start_time), int(id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def show_row(show):
+    return {"venue_id": show.venue_id,
+            "venue_name": show.venue_name,
+            "artist_id": show.artist_id,
+            "artist_name": show.artist_name,
+            "artist_image_link": show.artist_image_link,
+            "start_time": show.start_time}
+
+
+def search_names(model, term, page=1):
+    # Case-insensitive substring search on model.name, the closest names
+    # first. Returns (total, [(id, name)]) for one page of results.
+    offset = (max(page, 1) - 1) * SEARCH_RESULTS_PER_PAGE
+    if app.config.get('SEARCH_BACKEND') == 'memory':
+        return name_indexes.get(model).search(
+            term, SEARCH_RESULTS_PER_PAGE, offset)
+
+    # The ILIKE filter is answered by the pg_trgm GIN index on name, so only
+    # matching rows are ranked. The total comes with every row, a page past
+    # the last one has no row and needs its own count.
+    matches = model.name.ilike('%' + escape_like(term) + '%', escape='\\')
+    rows = db.session.query(
+        model.id,
+        model.name,
+        db.func.count().over().label('total')
+    ).filter(matches).order_by(
+        db.func.similarity(model.name, term).desc(), model.id
+    ).limit(SEARCH_RESULTS_PER_PAGE).offset(offset).all()
+    if not rows:
+        total = db.session.query(model.id).filter(matches).count() if offset else 0
+        return total, []
+    return rows[0].total, [(row.id, row.name) for row in rows]
+
+
+def search_genres(term):
+    # Genres whose name contains term. Genres are stored under their form
+    # value ('RocknRoll') or their label ('Rock n Roll'), both are returned.
+    genres = []
+    for genre in Genre:
+        if term in genre.name.lower() or term in genre.value.lower():
+            genres.extend({genre.name, genre.value})
+    return genres
+
+
+def genre_array(genres):
+    # genres as a varchar[] literal, the type of the genres columns.
+    return db.cast(array(genres), db.ARRAY(db.String))
+
+
+def entity_hits(model, kind, term, pattern, genres):
+    # Venues (or artists) matching term by name, by "city, state" or by
+    # genre. Each condition is served by a GIN index, the planner combines
+    # them with a BitmapOr. Name matches rank first, then area matches,
+    # then genre matches.
+    area = model.city + ', ' + model.state
+    byName = model.name.ilike(pattern, escape='\\')
+    byArea = area.ilike(pattern, escape='\\')
+    conditions = [byName, byArea]
+    if genres:
+        conditions.append(model.genres.op('&&')(genre_array(genres)))
+    rank = db.case([
+        (byName, 2 + db.func.similarity(model.name, term)),
+        (byArea, 1 + db.func.similarity(area, term))
+    ], else_=db.literal(0.5))
+    return db.session.query(
+        db.literal(kind).label('type'),
+        model.id.label('id'),
+        model.name.label('name'),
+        area.label('detail'),
+        db.cast(None, db.Integer).label('matches'),
+        db.cast(rank, db.Float).label('rank')
+    ).filter(db.or_(*conditions))
+
+
+def area_hits(term, pattern):
+    # "city, state" areas matching term, with their number of venues and
+    # artists.
+    places = db.union_all(
+        db.select([Venue.city, Venue.state]),
+        db.select([Artist.city, Artist.state])
+    ).alias('places')
+    area = places.c.city + ', ' + places.c.state
+    return db.session.query(
+        db.literal('city').label('type'),
+        db.cast(None, db.Integer).label('id'),
+        area.label('name'),
+        db.cast(None, db.String).label('detail'),
+        db.cast(db.func.count(), db.Integer).label('matches'),
+        db.cast(1 + db.func.similarity(area, term), db.Float).label('rank')
+    ).filter(area.ilike(pattern, escape='\\')).group_by(area)
+
+
+def genre_hits(term, genres):
+    # One hit per matching genre, with its number of venues and artists,
+    # counted from the GIN indexes on the genres columns.
+    hits = []
+    for genre in Genre:
+        stored = [name for name in (genre.name, genre.value) if name in genres]
+        if not stored:
+            continue
+        tagged = genre_array(stored)
+        matches = (
+            db.session.query(db.func.count(Venue.id)).filter(
+                Venue.genres.op('&&')(tagged)).as_scalar()
+            + db.session.query(db.func.count(Artist.id)).filter(
+                Artist.genres.op('&&')(tagged)).as_scalar())
+        hits.append(db.session.query(
+            db.literal('genre').label('type'),
+            db.cast(None, db.Integer).label('id'),
+            db.literal(genre.value).label('name'),
+            db.cast(None, db.String).label('detail'),
+            db.cast(matches, db.Integer).label('matches'),
+            db.cast(1 + db.func.similarity(genre.value, term), db.Float).label('rank')
+        ))
+    return hits
+
+
+def search_all(term):
+    # Venues, artists, areas and genres matching term, in one round-trip:
+    # the typed hits are unioned, ranked inside their type and cut to
+    # SEARCH_HITS_PER_TYPE, each row carrying the full count of its type.
+    # Returns {'counts': {type: count}, 'hits': {type: [hit]}}.
+    result = {'counts': {}, 'hits': {}}
+    for kind in SEARCH_TYPES:
+        result['counts'][kind] = 0
+        result['hits'][kind] = []
+    if not term:
+        return result
+
+    pattern = '%' + escape_like(term) + '%'
+    genres = search_genres(term)
+    parts = [entity_hits(Venue, 'venue', term, pattern, genres),
+             entity_hits(Artist, 'artist', term, pattern, genres),
+             area_hits(term, pattern)] + genre_hits(term, genres)
+    hits = parts[0].union_all(*parts[1:]).subquery()
+    ranked = db.session.query(
+        hits,
+        db.func.row_number().over(
+            partition_by=hits.c.type,
+            order_by=(hits.c.rank.desc(), hits.c.name, hits.c.id)
+        ).label('position'),
+        db.func.count().over(partition_by=hits.c.type).label('total')
+    ).subquery()
+    rows = db.session.query(ranked).filter(
+        ranked.c.position <= SEARCH_HITS_PER_TYPE
+    ).order_by(ranked.c.type, ranked.c.position)
+
+    for row in rows:
+        result['counts'][row.type] = row.total
+        result['hits'][row.type].append({
+            'id': row.id,
+            'name': row.name,
+            'detail': row.detail,
+            'matches': row.matches,
+            'rank': round(row.rank, 4)
+        })
+    return result
+
+
+def venue_areas():
+    # One query: each venue with its stored upcoming show count, ordered by
+    # area so the areas can be built in a single pass.
+    upcoming_shows = db.session.query(
+        Venue.id,
+        Venue.name,
+        Venue.city,
+        Venue.state,
+        Venue.updated_at,
+        Venue.upcoming_shows_count.label('num_upcoming_shows')
+    ).order_by(Venue.state, Venue.city, Venue.id)
+
+    for (city, state), area_venues in groupby(upcoming_shows, key=lambda v: (v.city, v.state)):
+        venues = [{
+            'id': venue.id,
+            'name': venue.name,
+            'updated_at': venue.updated_at,
+            'num_upcoming_shows': venue.num_upcoming_shows
+        } for venue in area_venues]
+        yield {
+            'city': city,
+            'state': state,
+            'version': (len(venues), max(venue['updated_at'] for venue in venues)),
+            'venues': venues
+        }
+
+
+def show_period():
+    # The period a show books: [start_time, end_time), or just its start time
+    # when it has no end_time. Must stay identical to SHOW_PERIOD in migration
+    # 9e2b7c4d1f3a, so the planner answers overlap tests from the GiST indexes
+    # of the exclusion constraints.
+    return db.func.tsrange(
+        Show.start_time,
+        db.func.coalesce(Show.end_time, Show.start_time),
+        db.case([(Show.end_time == None, db.literal_column("'[]'"))],
+                else_=db.literal_column("'[)'"))
+    )
+
+
+def booking_conflicts(venue_id, artist_id, start_time, end_time=None):
+    # Returns (venue booked, artist booked) for a new show, both answered in
+    # one round-trip by index lookups instead of loading the booking history.
+    requested = db.func.tsrange(start_time, end_time or start_time,
+                                '[)' if end_time else '[]')
+    overlaps = show_period().op('&&')(requested)
+    venueBooked = db.session.query(Show.id).filter(
+        Show.venue_id == venue_id, overlaps).exists()
+    artistBooked = db.session.query(Show.id).filter(
+        Show.artist_id == artist_id, overlaps).exists()
+    return db.session.query(venueBooked, artistBooked).one()
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
@@ -61,6 +445,85 @@ def index():
     return render_template('pages/home.html')
 
 
+#  Search
+#  ----------------------------------------------------------------
+
+@app.route('/search', methods=['GET', 'POST'])
+def search():
+    # Venues, artists, cities and genres matching search_term, see
+    # search_all. Results are cached by normalized query, and a GET is
+    # redirected to its normalized URL so HTTP caches share it too.
+    search_term = request.values.get('search_term', '')
+    query = normalize_query(search_term)
+    if request.method == 'GET' and search_term != query:
+        return redirect(url_for('search', search_term=query))
+    try:
+        results = cached_search(query)
+    except:
+        db.session.rollback()
+        print(sys.exc_info())
+        flash('An error occurred')
+        return redirect(url_for('index'))
+    finally:
+        db.session.close()
+    response = app.make_response(render_template(
+        'pages/search.html', results=results, search_term=query))
+    if request.method == 'GET':
+        response.cache_control.private = True
+        response.cache_control.max_age = search_cache.ttl
+    return response
+
+
+@app.route('/search.json')
+def search_json():
+    # The results of /search as JSON, shareable by any cache.
+    search_term = request.args.get('search_term', '')
+    query = normalize_query(search_term)
+    if search_term != query:
+        return redirect(url_for('search_json', search_term=query))
+    try:
+        results = cached_search(query)
+    finally:
+        db.session.close()
+    response = app.response_class(json.dumps(results), mimetype='application/json')
+    response.cache_control.public = True
+    response.cache_control.max_age = search_cache.ttl
+    return response
+
+
+@app.route('/autocomplete')
+def autocomplete():
+    # Venue and artist names with a word starting with ?q=, as JSON, from
+    # the in-process prefix index (no database round-trip once loaded).
+    limit = min(request.args.get('limit', AUTOCOMPLETE_LIMIT, type=int), 50)
+    try:
+        suggestions = name_indexes.prefixes().complete(
+            request.args.get('q', ''), limit)
+    finally:
+        db.session.close()
+    return app.response_class(json.dumps({
+        'suggestions': [{'type': kind, 'id': id, 'name': name}
+                        for (kind, id), name in suggestions]
+    }), mimetype='application/json')
+
+
+@app.route('/metrics/pool')
+def pool_metrics_view():
+    # Checkout latency, waits and connections in use of this worker's pool,
+    # for sizing workers against the database's max_connections.
+    return app.response_class(json.dumps(pool_metrics(db.engine.pool)),
+                              mimetype='application/json')
+
+
+def cached_search(query):
+    results = search_cache.get(query)
+    if results is None:
+        results = search_all(query)
+        results['search_term'] = query
+        search_cache.put(query, results)
+    return results
+
+
 #  Venues
 #  ----------------------------------------------------------------
 
@@ -69,28 +532,20 @@ def venues():
     # TODO: replace with real venues data.
     #       num_shows should be aggregated based on number of upcoming shows per venue.
     try:
-        query = Venue.query.all()
-        places = Venue.query.distinct(Venue.city, Venue.state).all()
-        areas = []
-
-        for place in places:
-            venuesList = []
-            for venue in query:
-                if venue.city == place.city and venue.state == place.state:
-                    showsCount = len(
-                        [show for show in venue.shows if show.start_time > datetime.now()]
-                    )
-                    venuesList.append({
-                        'id': venue.id,
-                        'name': venue.name,
-                        'num_upcoming_shows': showsCount
-                    })
-            areas.append({
-                'city': place.city,
-                'state': place.state,
-                'venues': venuesList
-            })
-        return render_template('pages/venues.html', areas=areas)
+        # The page is cached whole, keyed by the generation bumped by the
+        # venue handlers, the last venue update and the number of venues.
+        # The generation only changes in this process with the memory
+        # backend: the last update covers edits, imports and counter writes
+        # from other processes, the count their deletes. The areas are only
+        # queried on a miss: a generator runs when the template iterates
+        # it. Each area is cached in turn by its number of venues and last
+        # update.
+        version = (fragment_cache.generation('venues'),) + tuple(
+            db.session.query(db.func.max(Venue.updated_at),
+                             db.func.count(Venue.id)).one())
+        areas = venue_areas()
+        return render_template('pages/venues.html', areas=areas,
+                               version=version)
     except:
         db.session.rollback()
         print(sys.exc_info())
@@ -100,25 +555,27 @@ def venues():
         db.session.close()
 
 
-@app.route('/venues/search', methods=['POST'])
+@app.route('/venues/search', methods=['GET', 'POST'])
 def search_venues():
     # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
     # seach for Hop should return "The Musical Hop".
     # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
     try:
-        search_term = request.form["search_term"]
-        venues = Venue.query.filter(
-            Venue.name.ilike("%" + search_term + "%")).all()
+        search_term = request.values.get('search_term', '')
+        page = request.values.get('page', 1, type=int)
+        total, venues = search_names(Venue, search_term, page)
         response = {
-            "count": len(venues),
+            "count": total,
+            "page": page,
+            "pages": -(-total // SEARCH_RESULTS_PER_PAGE),
             "data": []
         }
-        for venue in venues:
+        for id, name in venues:
             response["data"].append({
-                'id': venue.id,
-                'name': venue.name,
+                'id': id,
+                'name': name,
             })
-        return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+        return render_template('pages/search_venues.html', results=response, search_term=search_term)
     except:
         db.session.rollback()
         print(sys.exc_info())
@@ -136,34 +593,22 @@ def show_venue(venue_id):
         venue = Venue.query.get(venue_id)
 
         if venue:
-            past_shows_query = db.session.query(Artist, Show).join(Show).join(Venue).\
-                filter(
-                Show.venue_id == venue_id,
-                Show.artist_id == Artist.id,
-                Show.start_time < datetime.now()
-            ).all()
-            past_shows = []
-            for artist, show in past_shows_query:
-                past_shows.append({
-                    'artist_id': artist.id,
-                    'artist_name': artist.name,
-                    'artist_image_link': artist.image_link,
-                    'start_time': show.start_time.strftime("%m/%d/%Y, %H:%M")
-                })
-
-            upcoming_shows_query = db.session.query(Artist, Show).join(Show).join(Venue).filter(
-                Show.venue_id == venue_id,
-                Show.artist_id == Artist.id,
-                Show.start_time > datetime.now()
-            ).all()
-            upcoming_shows = []
-            for artist, show in upcoming_shows_query:
-                upcoming_shows.append({
-                    'artist_id': artist.id,
-                    'artist_name': artist.name,
-                    'artist_image_link': artist.image_link,
-                    'start_time': show.start_time.strftime("%m/%d/%Y, %H:%M")
-                })
+            past_page = request.args.get('past_page', 1, type=int)
+            upcoming_page = request.args.get('upcoming_page', 1, type=int)
+            shows = paged_shows(Artist, Show.venue_id, Show.artist_id, venue,
+                                past_page, upcoming_page)
+            past_shows = [{
+                'artist_id': show.id,
+                'artist_name': show.name,
+                'artist_image_link': show.image_link,
+                'start_time': show.start_time
+            } for show in shows['past_shows']]
+            upcoming_shows = [{
+                'artist_id': show.id,
+                'artist_name': show.name,
+                'artist_image_link': show.image_link,
+                'start_time': show.start_time
+            } for show in shows['upcoming_shows']]
 
             data = {
                 "id": venue.id,
@@ -177,10 +622,15 @@ def show_venue(venue_id):
                 "website": venue.website,
                 "seeking_talent": venue.seeking_talent,
                 "seeking_description": venue.seeking_description,
+                "updated_at": venue.updated_at,
                 'past_shows': past_shows,
                 'upcoming_shows': upcoming_shows,
-                'past_shows_count': len(past_shows),
-                'upcoming_shows_count': len(upcoming_shows)
+                'past_shows_count': shows['past_shows_count'],
+                'upcoming_shows_count': shows['upcoming_shows_count'],
+                'past_page': past_page,
+                'upcoming_page': upcoming_page,
+                'past_pages': shows['past_pages'],
+                'upcoming_pages': shows['upcoming_pages']
             }
             return render_template('pages/show_venue.html', venue=data)
         else:
@@ -226,6 +676,7 @@ def create_venue_submission():
             )
             db.session.add(newVenue)
             db.session.commit()
+            fragment_cache.invalidate('venues')
             flash('Venue ' + request.form['name'] +
                   ' was successfully listed!')
             return redirect(url_for("show_venue", venue_id=newVenue.id))
@@ -258,6 +709,7 @@ def delete_venue(venue_id):
     try:
         db.session.delete(Venue.query.get(venue_id))
         db.session.commit()
+        fragment_cache.invalidate('venues')
         flash("Venue removed")
         return redirect("/")
     except:
@@ -275,11 +727,14 @@ def delete_venue(venue_id):
 def artists():
     # TODO: replace with real data returned from querying the database
     try:
-        query = Artist.query.all()
-        data = []
-        for a in query:
-            data.append({"id": a.id, "name": a.name})
-        return render_template('pages/artists.html', artists=data)
+        # Cached like the venues page, artists are only queried on a miss.
+        version = (fragment_cache.generation('artists'),) + tuple(
+            db.session.query(db.func.max(Artist.updated_at),
+                             db.func.count(Artist.id)).one())
+        data = ({"id": a.id, "name": a.name} for a in
+                db.session.query(Artist.id, Artist.name).order_by(Artist.id))
+        return render_template('pages/artists.html', artists=data,
+                               version=version)
     except:
         db.session.rollback()
         print(sys.exc_info())
@@ -289,25 +744,27 @@ def artists():
         db.session.close()
 
 
-@app.route('/artists/search', methods=['POST'])
+@app.route('/artists/search', methods=['GET', 'POST'])
 def search_artists():
     # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
     # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
     # search for "band" should return "The Wild Sax Band".
     try:
-        search_term = request.form["search_term"]
-        artists = Artist.query.filter(
-            Artist.name.ilike("%" + search_term + "%")).all()
+        search_term = request.values.get('search_term', '')
+        page = request.values.get('page', 1, type=int)
+        total, artists = search_names(Artist, search_term, page)
         response = {
-            "count": len(artists),
+            "count": total,
+            "page": page,
+            "pages": -(-total // SEARCH_RESULTS_PER_PAGE),
             "data": []
         }
-        for artist in artists:
+        for id, name in artists:
             response["data"].append({
-                'id': artist.id,
-                'name': artist.name,
+                'id': id,
+                'name': name,
             })
-        return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+        return render_template('pages/search_artists.html', results=response, search_term=search_term)
     except:
         db.session.rollback()
         print(sys.exc_info())
@@ -325,35 +782,22 @@ def show_artist(artist_id):
         artist = Artist.query.get(artist_id)
 
         if artist:
-            past_shows_query = db.session.query(Venue, Show).join(Show).join(Artist).\
-                filter(
-                Show.artist_id == artist_id,
-                Show.venue_id == Venue.id,
-                Show.start_time < datetime.now()
-            ).all()
-            past_shows = []
-            for venue, show in past_shows_query:
-                past_shows.append({
-                    'venue_id': venue.id,
-                    'venue_name': venue.name,
-                    'venue_image_link': venue.image_link,
-                    'start_time': show.start_time.strftime("%m/%d/%Y, %H:%M")
-                })
-
-            upcoming_shows_query = db.session.query(Venue, Show).join(Show).join(Artist).\
-                filter(
-                Show.artist_id == artist_id,
-                Show.venue_id == Venue.id,
-                Show.start_time > datetime.now()
-            ).all()
-            upcoming_shows = []
-            for venue, show in upcoming_shows_query:
-                upcoming_shows.append({
-                    'venue_id': venue.id,
-                    'venue_name': venue.name,
-                    'venue_image_link': venue.image_link,
-                    'start_time': show.start_time.strftime("%m/%d/%Y, %H:%M")
-                })
+            past_page = request.args.get('past_page', 1, type=int)
+            upcoming_page = request.args.get('upcoming_page', 1, type=int)
+            shows = paged_shows(Venue, Show.artist_id, Show.venue_id, artist,
+                                past_page, upcoming_page)
+            past_shows = [{
+                'venue_id': show.id,
+                'venue_name': show.name,
+                'venue_image_link': show.image_link,
+                'start_time': show.start_time
+            } for show in shows['past_shows']]
+            upcoming_shows = [{
+                'venue_id': show.id,
+                'venue_name': show.name,
+                'venue_image_link': show.image_link,
+                'start_time': show.start_time
+            } for show in shows['upcoming_shows']]
             data = {
                 "id": artist.id,
                 "name": artist.name,
@@ -366,10 +810,15 @@ def show_artist(artist_id):
                 "website": artist.website,
                 "seeking_venue": artist.seeking_venue,
                 "seeking_description": artist.seeking_description,
+                "updated_at": artist.updated_at,
                 'past_shows': past_shows,
                 'upcoming_shows': upcoming_shows,
-                'past_shows_count': len(past_shows),
-                'upcoming_shows_count': len(upcoming_shows)
+                'past_shows_count': shows['past_shows_count'],
+                'upcoming_shows_count': shows['upcoming_shows_count'],
+                'past_page': past_page,
+                'upcoming_page': upcoming_page,
+                'past_pages': shows['past_pages'],
+                'upcoming_pages': shows['upcoming_pages']
             }
             return render_template('pages/show_artist.html', artist=data)
         else:
@@ -440,6 +889,7 @@ def edit_artist_submission(artist_id):
             artistEdit.seeking_description = form.seeking_description.data
             artistEdit.image_link = form.image_link.data
             db.session.commit()
+            fragment_cache.invalidate('artists')
             flash("Artist have been edited.")
             return redirect(url_for("show_artist", artist_id=artist_id))
         except:
@@ -509,6 +959,7 @@ def edit_venue_submission(venue_id):
             venueEdit.seeking_description = form.seeking_description.data
             venueEdit.image_link = form.image_link.data
             db.session.commit()
+            fragment_cache.invalidate('venues')
             flash("Venue has been edited.")
             return redirect(url_for("show_venue", venue_id=venue_id))
         except:
@@ -559,6 +1010,7 @@ def create_artist_submission():
             )
             db.session.add(newArtist)
             db.session.commit()
+            fragment_cache.invalidate('artists')
             flash('Artist ' + request.form['name'] +
                   ' was successfully listed!')
             return redirect(url_for("show_artist", artist_id=newArtist.id))
@@ -587,23 +1039,24 @@ def create_artist_submission():
 @app.route('/shows')
 def shows():
     # displays list of shows at /shows
-    # TODO: replace with real venues data.
-    #       num_shows should be aggregated based on number of upcoming shows per venue.
+    # One page at a time, see keyset_shows. ?after=<cursor> and
+    # ?before=<cursor> walk forwards and backwards from a page edge.
     try:
-        query = db.session.query(Show).join(Artist).join(Venue)
-        shows = []
-        for show in query:
-            # foundArtist = Artist.query.get(show.artist_id)
-            # foundVenue = Venue.query.get(show.venue_id)
-            shows.append(
-                {"venue_id": show.venue_id,
-                 "venue_name": show.venue.name,
-                 "artist_id": show.artist_id,
-                 "artist_name": show.artist.name,
-                 "artist_image_link": show.artist.image_link,
-                 "start_time": show.start_time}
-            )
-        return render_template('pages/shows.html', shows=shows)
+        after = decode_cursor(request.args.get('after'))
+        before = decode_cursor(request.args.get('before'))
+        page, more = keyset_shows(after=after, before=before)
+        shows = [show_row(show) for show in page]
+
+        # Walking forwards from a cursor there are shows before the page,
+        # walking backwards there are shows after it.
+        if before is not None:
+            hasPrev, hasNext = more, True
+        else:
+            hasPrev, hasNext = after is not None, more
+        prevCursor = encode_cursor(page[0]) if page and hasPrev else None
+        nextCursor = encode_cursor(page[-1]) if page and hasNext else None
+        return render_template('pages/shows.html', shows=shows,
+                               prev_cursor=prevCursor, next_cursor=nextCursor)
     except:
         db.session.rollback()
         print(sys.exc_info())
@@ -613,6 +1066,66 @@ def shows():
         db.session.close()
 
 
+@app.route('/shows.json')
+def shows_export():
+    # Every show (from ?after=<cursor> on) as one JSON array, for exports.
+    # The array is streamed one keyset page of SHOWS_EXPORT_BATCH shows at a
+    # time, so memory stays flat whatever the size of the table.
+    def generate(after):
+        separator = '['
+        while True:
+            page, more = keyset_shows(after=after, limit=SHOWS_EXPORT_BATCH)
+            rows = []
+            for show in page:
+                row = show_row(show)
+                row['start_time'] = row['start_time'].isoformat()
+                rows.append(json.dumps(row))
+            if rows:
+                yield separator + ','.join(rows)
+                separator = ','
+            if not more:
+                break
+            after = (page[-1].start_time, page[-1].id)
+        yield ']' if separator == ',' else '[]'
+        db.session.close()
+
+    after = decode_cursor(request.args.get('after'))
+    return Response(stream_with_context(generate(after)),
+                    mimetype='application/json')
+
+
+@app.route('/export/<any(venues, artists, shows):kind>.<any(jsonl, csv):format>')
+def export(kind, format):
+    # Bulk export: every row of kind, or those matching ?from= and ?to=
+    # (dates bounding the start time of shows), ?city= and ?state=. Rows are
+    # read from a server-side cursor and streamed as they come, gzip
+    # compressed when the client accepts it.
+    try:
+        start, end = (dateutil.parser.parse(request.args[name])
+                      if request.args.get(name) else None
+                      for name in ('from', 'to'))
+    except (ValueError, OverflowError):
+        abort(400)
+    query = exporter.export_query(kind, start, end, request.args.get('city'),
+                                  request.args.get('state'))
+    compress = 'gzip' in request.accept_encodings
+
+    def generate():
+        try:
+            yield from exporter.encode(exporter.batches(query, format), compress)
+        finally:
+            db.session.close()
+
+    response = Response(stream_with_context(generate()),
+                        mimetype=exporter.FORMATS[format])
+    response.headers['Content-Disposition'] = \
+        'attachment; filename={}.{}'.format(kind, format)
+    response.vary.add('Accept-Encoding')
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
 @app.route('/shows/create')
 def create_shows():
     # renders form. do not touch.
@@ -636,32 +1149,28 @@ def create_show_submission():
             flash("Venue not found. Please try again")
             return redirect(url_for('create_show_submission'))
 
-        venueShowList = db.session.query(Show).filter_by(venue_id=venue).all()
-        artistShowList = db.session.query(
-            Show).filter_by(artist_id=artist).all()
-
         start_time = form.start_time.data
 
         if isDate(start_time):
-            d1 = start_time
+            end_time = None
+            if form.duration.data:
+                end_time = start_time + timedelta(minutes=form.duration.data)
+
+            venueBooked, artistBooked = booking_conflicts(
+                venue, artist, start_time, end_time)
             # Check if venue is available for date
-            if venueShowList:
-                for show in venueShowList:
-                    d2 = show.start_time
-                    if d2 == d1:
-                        flash("Sorry venue is already booked at date!")
-                        return redirect(url_for('create_shows'))
+            if venueBooked:
+                flash("Sorry venue is already booked at date!")
+                return redirect(url_for('create_shows'))
             # Check if artist is available for date
-            if artistShowList:
-                for show in artistShowList:
-                    d2 = show.start_time
-                    if d2 == d1:
-                        flash("Sorry artist is already booked at date!")
-                        return redirect(url_for('create_shows'))
+            if artistBooked:
+                flash("Sorry artist is already booked at date!")
+                return redirect(url_for('create_shows'))
             newShow = Show(
                 artist_id=artist,
                 venue_id=venue,
-                start_time=start_time
+                start_time=start_time,
+                end_time=end_time
             )
 
             db.session.add(newShow)
@@ -670,6 +1179,11 @@ def create_show_submission():
         else:
             flash(
                 'Date format is not valid. Please use this syntax Year-Month-Day Hour:Minure:Seconds')
+    except IntegrityError:
+        # Another booking for the same slot was committed since the check
+        # above, the database constraints rejected this one.
+        db.session.rollback()
+        flash('Sorry, the venue or the artist was just booked at that time!')
     except:
         # TODO: on unsuccessful db insert, flash an error instead.
         print(sys.exc_info())
@@ -701,6 +1215,132 @@ if not app.debug:
     app.logger.addHandler(file_handler)
     app.logger.info('errors')
 
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(sorted(importer.KINDS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', type=click.Choice(['csv', 'jsonl']),
+              help='Input format, guessed from the file extension by default.')
+@click.option('--batch-size', default=1000, show_default=True,
+              help='Rows inserted per INSERT statement.')
+@click.option('--rejects', type=click.Path(dir_okay=False),
+              help='Reject file, <path>.rejects.jsonl by default.')
+def import_command(kind, path, format, batch_size, rejects):
+    """Bulk import venues, artists or shows from a CSV or JSON Lines file.
+
+    Rows are validated like the create forms. Invalid rows, and rows the
+    database refuses, go to the reject file.
+
+    \b
+    EXAMPLE
+        flask import venues venues.csv
+        flask import shows shows.jsonl --rejects shows-rejected.jsonl
+    """
+    format = format or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+    rejects = rejects or path + '.rejects.jsonl'
+    nextReport = [0]
+
+    def progress(job):
+        if job.read >= nextReport[0]:
+            click.echo('{} rows read, {:.0f} rows/s'.format(job.read, job.rate()))
+            nextReport[0] = job.read + 50000
+
+    with open(rejects, 'w', encoding='utf-8') as rejectFile:
+        job = importer.Importer(kind, rejectFile, batch_size, progress)
+        try:
+            job.run(importer.read_rows(path, format))
+        finally:
+            db.session.close()
+    click.echo(job.summary())
+    if job.rejected:
+        click.echo('Rejected rows written to ' + rejects)
+
+
+@app.cli.command('export')
+@click.argument('kind', type=click.Choice(sorted(exporter.KINDS)))
+@click.argument('output', type=click.Path(dir_okay=False, allow_dash=True),
+                default='-')
+@click.option('--format', type=click.Choice(sorted(exporter.FORMATS)),
+              help='Output format, guessed from the file extension by default.')
+@click.option('--from', 'start', type=click.DateTime(),
+              help='Only shows starting at or after this date.')
+@click.option('--to', 'end', type=click.DateTime(),
+              help='Only shows starting before this date.')
+@click.option('--city', help='Only rows in this city (of the venue for shows).')
+@click.option('--state', help='Only rows in this state (of the venue for shows).')
+@click.option('--gzip', 'compress', is_flag=True,
+              help='Compress the output, implied by a .gz extension.')
+def export_command(kind, output, format, start, end, city, state, compress):
+    """Export venues, artists or shows as JSON Lines or CSV.
+
+    Rows are streamed from a server-side cursor, OUTPUT defaults to the
+    standard output. Venues and artists filtered with --from and --to are
+    those with a show in the range.
+
+    \b
+    EXAMPLE
+        flask export venues venues.csv --state CA
+        flask export shows shows.jsonl.gz --from 2021-01-01 --to 2022-01-01
+    """
+    name = output.lower()
+    if name.endswith('.gz'):
+        compress = True
+        name = name[:-3]
+    format = format or ('csv' if name.endswith('.csv') else 'jsonl')
+    query = exporter.export_query(kind, start, end, city, state)
+    try:
+        with click.open_file(output, 'wb') as file:
+            for data in exporter.encode(exporter.batches(query, format), compress):
+                file.write(data)
+    finally:
+        db.session.close()
+
+
+@app.cli.command('roll-over-shows')
+@click.option('--every', type=int,
+              help='Keep running, rolling over every this many seconds.')
+def roll_over_command(every):
+    """Move the shows that started from the upcoming to the past counts.
+
+    Run it from cron, every minute or so, or keep it running with --every.
+    Until then, shows that started count as upcoming.
+    """
+    while True:
+        try:
+            with db.engine.begin() as connection:
+                moved = counters.roll_over(connection)
+            click.echo('{} Shows rolled over: {}'.format(
+                datetime.now().isoformat(' ', 'seconds'), moved))
+        finally:
+            db.session.close()
+        if not every:
+            break
+        time.sleep(every)
+
+
+@app.cli.command('reconcile-counters')
+@click.option('--fix', is_flag=True, help='Correct the counters that differ.')
+def reconcile_command(fix):
+    """Check the show counters of venues and artists against the shows.
+
+    Every show is recounted in bulk. With --fix, writes to shows wait until
+    the counters are corrected.
+    """
+    with db.engine.begin() as connection:
+        drift, flags = counters.reconcile(connection, fix)
+    click.echo('Shows with an out of date upcoming flag: {}'.format(flags))
+    for table, rows in drift.items():
+        click.echo('{}: {} with wrong counters'.format(table, len(rows)))
+        for id, upcoming, past, realUpcoming, realPast in rows[:10]:
+            click.echo('  id {}: upcoming {} (real {}), past {} (real {})'.format(
+                id, upcoming, realUpcoming, past, realPast))
+    if fix and (flags or any(drift.values())):
+        click.echo('Fixed.')
+
+
 #----------------------------------------------------------------------------#
 # Launch.
 #----------------------------------------------------------------------------#
@@ -0,0 +1,87 @@
+#----------------------------------------------------------------------------#
+# Benchmark: /autocomplete over 1M venue names.
+#
+#   python bench_autocomplete.py --database-url postgresql://localhost/fyyur_bench
+#
+# Reports the load time and memory of the prefix index, the latency of
+# lookups for prefixes taken from the names (index alone and through the
+# endpoint) and of the incremental updates made when a name changes.
+#----------------------------------------------------------------------------#
+
+import random
+import sys
+import time
+import tracemalloc
+
+import bench_seed
+
+
+def percentiles(label, timings):
+    timings = sorted(timings)
+
+    def at(p):
+        return timings[min(len(timings) - 1, int(len(timings) * p))] * 1e6
+    print('{:<28} p50 {:8.1f} us  p99 {:8.1f} us  max {:8.1f} us'.format(
+        label, at(0.50), at(0.99), timings[-1] * 1e6))
+
+
+def main():
+    parser = bench_seed.parser(__doc__)
+    parser.set_defaults(venues=1000000, artists=1000, shows=1000)
+    parser.add_argument('--lookups', type=int, default=20000)
+    args = parser.parse_args()
+
+    fyyur = bench_seed.load_app(args.database_url)
+    app, db = fyyur.app, fyyur.db
+
+    with app.app_context():
+        if not args.no_seed:
+            bench_seed.seed(db, args.venues, args.artists, args.shows, args.areas)
+        tracemalloc.start()
+        start = time.perf_counter()
+        index = fyyur.name_indexes.prefixes()
+        elapsed = time.perf_counter() - start
+        size, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        db.session.close()
+    print('prefix index: {} names, {} entries, loaded in {:.2f} s'.format(
+        len(index), index.entries, elapsed))
+    print('memory held {:.1f} MB, peak while loading {:.1f} MB'.format(
+        size / 1e6, peak / 1e6))
+
+    # Prefixes of 1 to 8 characters starting at a word of a random name.
+    random.seed(42)
+    names = random.sample(list(index.names.values()), min(1000, len(index)))
+    prefixes = []
+    for _ in range(args.lookups):
+        text = random.choice(index.suffixes(random.choice(names)))
+        prefixes.append(text[:random.randint(1, 8)])
+
+    timings = []
+    for prefix in prefixes:
+        start = time.perf_counter()
+        index.complete(prefix)
+        timings.append(time.perf_counter() - start)
+    percentiles('PrefixIndex.complete', timings)
+
+    client = app.test_client()
+    timings = []
+    for prefix in prefixes[:2000]:
+        start = time.perf_counter()
+        response = client.get('/autocomplete', query_string={'q': prefix})
+        timings.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.status_code
+    percentiles('GET /autocomplete', timings)
+
+    timings = []
+    for i in range(1000):
+        key = ('venue', -i - 1)
+        start = time.perf_counter()
+        index.add(key, 'Bench Rename {} Hall'.format(i))
+        index.remove(key)
+        timings.append(time.perf_counter() - start)
+    percentiles('add + remove', timings)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+#----------------------------------------------------------------------------#
+# Benchmark: rendering a venue page listing 10k shows, with the original
+# `datetime` filter and with the cached one.
+#
+#   python bench_render.py
+#
+# No database is used: the page data is built in memory. "before" renders
+# start times the way the views used to pass them, as strings parsed again
+# by dateutil and formatted by babel.dates.format_datetime. "after" passes
+# datetimes to the cached filter, once with its memo emptied before every
+# render (every start time distinct) and once with it warm.
+#----------------------------------------------------------------------------#
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+from flask import render_template
+
+
+def legacy_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format)
+
+
+def venue_page(shows, as_text):
+    # A venue with `shows` shows, half past, half upcoming, one minute apart.
+    random.seed(42)
+    start = datetime(2030, 1, 1, 20, 0)
+
+    def show(i):
+        start_time = start + timedelta(minutes=i)
+        return {
+            'artist_id': i,
+            'artist_name': 'Artist {}'.format(i),
+            'artist_image_link': '',
+            'start_time': (start_time.strftime("%m/%d/%Y, %H:%M")
+                           if as_text else start_time)
+        }
+    past = [show(i) for i in range(shows // 2)]
+    upcoming = [show(i) for i in range(shows // 2, shows)]
+    return {
+        'id': 1, 'name': 'The Musical Hop', 'city': 'San Francisco',
+        'state': 'CA', 'address': '1015 Folsom Street', 'phone': '123-123-1234',
+        'image_link': '', 'facebook_link': '', 'website': '',
+        'seeking_talent': True, 'seeking_description': '',
+        'past_shows': past, 'upcoming_shows': upcoming,
+        'past_shows_count': len(past), 'upcoming_shows_count': len(upcoming),
+        'past_page': 1, 'upcoming_page': 1, 'past_pages': 1, 'upcoming_pages': 1
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--shows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    import app as fyyur
+    app = fyyur.app
+
+    def run(label, filter, venue, before=None):
+        app.jinja_env.filters['datetime'] = filter
+        # Compiled templates hold on to the filters they were built with.
+        app.jinja_env.cache.clear()
+        timings = []
+        with app.test_request_context('/venues/1'):
+            for _ in range(args.repeat):
+                if before:
+                    before()
+                start = time.perf_counter()
+                render_template('pages/show_venue.html', venue=venue)
+                timings.append(time.perf_counter() - start)
+        print('{:<32} median {:9.2f} ms  best {:9.2f} ms'.format(
+            label, statistics.median(timings) * 1000, min(timings) * 1000))
+
+    print('{} shows per page'.format(args.shows))
+    run('before: parse + format', legacy_format_datetime,
+        venue_page(args.shows, as_text=True))
+    venue = venue_page(args.shows, as_text=False)
+    run('after:  cached, cold memo', fyyur.format_datetime, venue,
+        fyyur.format_datetime.cache_clear)
+    run('after:  cached, warm memo', fyyur.format_datetime, venue)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
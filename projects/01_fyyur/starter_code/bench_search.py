@@ -0,0 +1,104 @@
+#----------------------------------------------------------------------------#
+# Benchmark: venue name search, ILIKE scan vs pg_trgm index vs the
+# in-process trigram index, over 1M generated venue names.
+#
+#   python bench_search.py --database-url postgresql://localhost/fyyur_bench
+#
+# "before" is the original view, registered on a scratch route: an unindexed
+# ILIKE returning every match. The pg_trgm run creates the extension and the
+# index of migration d4a8e6f0b2c1, it is skipped when the server does not
+# ship pg_trgm.
+#----------------------------------------------------------------------------#
+
+import sys
+import time
+import tracemalloc
+
+from flask import render_template, request
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+import bench_seed
+
+TERMS = ['Hop', 'jazz sax', 'Velvet Echo 1', 'oon 4242', 'Cellar Static 99',
+         'no such venue']
+
+
+def main():
+    parser = bench_seed.parser(__doc__)
+    parser.set_defaults(venues=1000000, artists=1000, shows=1000)
+    args = parser.parse_args()
+
+    fyyur = bench_seed.load_app(args.database_url)
+    app, db, Venue = fyyur.app, fyyur.db, fyyur.Venue
+
+    @app.route('/bench/venues-search-legacy')
+    def search_venues_legacy():
+        search_term = request.args['search_term']
+        venues = Venue.query.filter(
+            Venue.name.ilike("%" + search_term + "%")).all()
+        response = {
+            "count": len(venues),
+            "page": 1,
+            "pages": 1,
+            "data": [{'id': venue.id, 'name': venue.name} for venue in venues]
+        }
+        db.session.close()
+        return render_template('pages/search_venues.html', results=response,
+                               search_term=search_term)
+
+    with app.app_context():
+        if not args.no_seed:
+            bench_seed.seed(db, args.venues, args.artists, args.shows, args.areas)
+        engine = db.engine
+        trigram = True
+        try:
+            with engine.begin() as connection:
+                connection.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+                connection.execute(text(
+                    'CREATE INDEX IF NOT EXISTS ix_venues_name_trgm '
+                    'ON venues USING gin (name gin_trgm_ops)'))
+                connection.execute(text('ANALYZE venues'))
+        except DBAPIError as error:
+            trigram = False
+            print('pg_trgm unavailable, skipping the indexed run: {}'.format(
+                error.orig).splitlines()[0])
+
+    client = app.test_client()
+
+    def get(url, term):
+        def call():
+            response = client.get(url, query_string={'search_term': term})
+            assert response.status_code == 200, response.status_code
+        return call
+
+    def run(label, url):
+        timings = []
+        for term in TERMS:
+            count, runs = bench_seed.measure(
+                '{} {!r}'.format(label, term), get(url, term), engine,
+                args.repeat)
+            timings.append(min(runs))
+        print('{:<28} worst best-of-run {:9.2f} ms\n'.format(
+            label, max(timings) * 1000))
+
+    run('before: ILIKE', '/bench/venues-search-legacy')
+    if trigram:
+        app.config['SEARCH_BACKEND'] = 'database'
+        run('after:  pg_trgm', '/venues/search')
+
+    app.config['SEARCH_BACKEND'] = 'memory'
+    tracemalloc.start()
+    start = time.perf_counter()
+    with app.app_context():
+        size = len(fyyur.name_indexes.get(Venue))
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print('memory index: {} names loaded in {:.2f} s, peak Python memory '
+          '{:.1f} MB'.format(size, elapsed, peak / 1e6))
+    run('after:  memory', '/venues/search')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+#----------------------------------------------------------------------------#
+# Benchmark helpers.
+#
+# Every bench_*.py script runs against its own database, given with
+# --database-url. Seeding DROPS AND RECREATES all Fyyur tables in that
+# database, never point it at real data.
+#----------------------------------------------------------------------------#
+
+import argparse
+import statistics
+import time
+
+from sqlalchemy import event, text
+
+import counters
+
+WORDS = ['Musical', 'Hop', 'Park', 'Square', 'Live', 'Coffee', 'Wild', 'Sax',
+         'Band', 'Petals', 'Dueling', 'Pianos', 'Bar', 'Jazz', 'Blue',
+         'Note', 'Red', 'Room', 'Hall', 'Garden', 'Velvet', 'Echo', 'Lounge',
+         'Stage', 'Cellar', 'Rooftop', 'Union', 'Harbor', 'Moon', 'Static']
+GENRES = ['Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk',
+          'Funk', 'Hip-Hop', 'Heavy Metal', 'Jazz', 'Pop', 'Punk', 'R&B',
+          'Reggae', 'Rock n Roll', 'Soul']
+STATES = ['CA', 'NY', 'TX', 'WA', 'IL', 'FL', 'GA', 'MA', 'CO', 'OR']
+
+
+def parser(description):
+    p = argparse.ArgumentParser(description=description)
+    p.add_argument('--database-url', required=True,
+                   help='scratch PostgreSQL database, its tables are recreated')
+    p.add_argument('--venues', type=int, default=50000)
+    p.add_argument('--artists', type=int, default=20000)
+    p.add_argument('--shows', type=int, default=1000000)
+    p.add_argument('--areas', type=int, default=500)
+    p.add_argument('--repeat', type=int, default=5)
+    p.add_argument('--no-seed', action='store_true',
+                   help='reuse the data left by a previous run')
+    return p
+
+
+def load_app(database_url):
+    # config.py is imported by app.py through app.config.from_object('config'),
+    # overriding it first binds the whole app to the benchmark database.
+    import config
+    config.SQLALCHEMY_DATABASE_URI = database_url
+    config.DEBUG = True
+    import app as fyyur
+    return fyyur
+
+
+def word_sql(column, offset):
+    return "(ARRAY[{}])[(({} * {}) % {}) + 1]".format(
+        ', '.join("'{}'".format(w) for w in WORDS), column, offset, len(WORDS))
+
+
+def seed(db, venues, artists, shows, areas):
+    # Data is generated server side with generate_series, so seeding a million
+    # shows takes seconds. Every show gets its own start minute, spread over
+    # two years around now, so no venue or artist is ever double booked.
+    db.drop_all()
+    db.create_all()
+    genres = "ARRAY[(ARRAY[{}])[(g % {}) + 1]]".format(
+        ', '.join("'{}'".format(genre) for genre in GENRES), len(GENRES))
+    state = "(ARRAY[{}])[((g % {}) % {}) + 1]".format(
+        ', '.join("'{}'".format(s) for s in STATES), areas, len(STATES))
+    statements = [
+        """INSERT INTO venues (id, name, city, state, address, phone, genres,
+                              seeking_talent)
+           SELECT g, 'The ' || {w1} || ' ' || {w2} || ' ' || g,
+                  'City ' || (g % {areas}), {state}, g || ' Main St',
+                  '555-555-5555', {genres}, g % 2 = 0
+           FROM generate_series(1, {venues}) AS g""",
+        """INSERT INTO artists (id, name, city, state, phone, genres,
+                               seeking_venue)
+           SELECT g, {w2} || ' ' || {w1} || ' ' || g,
+                  'City ' || (g % {areas}), {state}, '555-555-5555', {genres},
+                  g % 3 = 0
+           FROM generate_series(1, {artists}) AS g""",
+        """INSERT INTO shows (id, venue_id, artist_id, start_time)
+           SELECT g + 1, (g % {venues}) + 1, (g % {artists}) + 1,
+                  date_trunc('minute', now())
+                    - ({shows} / 2) * interval '1 minute'
+                    + g * interval '1 minute'
+           FROM generate_series(0, {shows} - 1) AS g""",
+    ]
+    with db.engine.begin() as connection:
+        for statement in statements:
+            connection.execute(text(statement.format(
+                w1=word_sql('g', 7), w2=word_sql('g', 13), areas=areas,
+                state=state, genres=genres, venues=venues, artists=artists,
+                shows=shows)))
+        # Sets the upcoming flags and the show counters of the new rows.
+        counters.reconcile(connection, fix=True)
+        for table in ('venues', 'artists', 'shows'):
+            connection.execute(text(
+                "SELECT setval(pg_get_serial_sequence('{0}', 'id'), "
+                "(SELECT max(id) FROM {0}))".format(table)))
+            connection.execute(text('ANALYZE {}'.format(table)))
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _count(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._count)
+
+
+def measure(label, fn, engine, repeat):
+    # The first call warms caches and is the one whose queries are counted.
+    with QueryCounter(engine) as counter:
+        fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    print('{:<28} queries {:>7}  median {:9.2f} ms  best {:9.2f} ms'.format(
+        label, counter.count, statistics.median(timings) * 1000,
+        min(timings) * 1000))
+    return counter.count, timings
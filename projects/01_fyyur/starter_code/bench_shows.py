@@ -0,0 +1,98 @@
+#----------------------------------------------------------------------------#
+# Benchmark: the /shows page, full listing vs keyset pages, and the
+# streaming /shows.json export.
+#
+#   python bench_shows.py --database-url postgresql://localhost/fyyur_bench
+#
+# "before" is the original view, registered on a scratch route: it renders
+# every show and lazy loads show.venue and show.artist for each of them.
+#----------------------------------------------------------------------------#
+
+import sys
+import time
+import tracemalloc
+
+from flask import render_template
+
+import bench_seed
+
+
+def main():
+    parser = bench_seed.parser(__doc__)
+    parser.add_argument('--skip-legacy', action='store_true',
+                        help='only time the new views (the original one '
+                             'renders every show)')
+    parser.add_argument('--skip-export', action='store_true',
+                        help='do not stream the full /shows.json export')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='report the peak Python memory of the export '
+                             '(tracemalloc makes it several times slower)')
+    args = parser.parse_args()
+
+    fyyur = bench_seed.load_app(args.database_url)
+    app, db, Show = fyyur.app, fyyur.db, fyyur.Show
+    Artist, Venue = fyyur.Artist, fyyur.Venue
+
+    @app.route('/bench/shows-legacy')
+    def shows_legacy():
+        query = db.session.query(Show).join(Artist).join(Venue)
+        shows = []
+        for show in query:
+            shows.append(
+                {"venue_id": show.venue_id,
+                 "venue_name": show.venue.name,
+                 "artist_id": show.artist_id,
+                 "artist_name": show.artist.name,
+                 "artist_image_link": show.artist.image_link,
+                 "start_time": show.start_time}
+            )
+        db.session.close()
+        return render_template('pages/shows.html', shows=shows)
+
+    with app.app_context():
+        if not args.no_seed:
+            bench_seed.seed(db, args.venues, args.artists, args.shows, args.areas)
+        engine = db.engine
+        # A cursor deep into the table: keyset pages cost the same anywhere.
+        middle = Show.query.order_by(Show.start_time, Show.id).offset(
+            Show.query.count() // 2).first()
+        middle = fyyur.encode_cursor(middle)
+        db.session.close()
+
+    client = app.test_client()
+
+    def get(url):
+        def call():
+            response = client.get(url)
+            assert response.status_code == 200, response.status_code
+        return call
+
+    if not args.skip_legacy:
+        bench_seed.measure('before: /shows (legacy)', get('/bench/shows-legacy'),
+                           engine, 1)
+    bench_seed.measure('after:  /shows', get('/shows'), engine, args.repeat)
+    bench_seed.measure('after:  /shows?after=<middle>',
+                       get('/shows?after=' + middle), engine, args.repeat)
+    bench_seed.measure('after:  /shows?before=<middle>',
+                       get('/shows?before=' + middle), engine, args.repeat)
+
+    if not args.skip_export:
+        if args.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        size = 0
+        with bench_seed.QueryCounter(engine) as counter:
+            response = client.get('/shows.json', buffered=False)
+            for chunk in response.response:
+                size += len(chunk)
+            response.close()
+        elapsed = time.perf_counter() - start
+        print('{:<28} queries {:>7}  {:9.2f} s  {:.1f} MB streamed'.format(
+            'export: /shows.json', counter.count, elapsed, size / 1e6))
+        if args.trace_memory:
+            print('{:<28} peak Python memory {:.1f} MB'.format(
+                '', tracemalloc.get_traced_memory()[1] / 1e6))
+            tracemalloc.stop()
+
+if __name__ == '__main__':
+    sys.exit(main())
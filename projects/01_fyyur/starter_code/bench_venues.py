@@ -0,0 +1,75 @@
+#----------------------------------------------------------------------------#
+# Benchmark: the /venues page, per-venue Python loop vs one grouped query.
+#
+#   python bench_venues.py --database-url postgresql://localhost/fyyur_bench
+#
+# "before" is the original view, registered on a scratch route: it walks every
+# venue once per area and lazy loads venue.shows for each of them.
+#----------------------------------------------------------------------------#
+
+import sys
+from datetime import datetime
+
+from flask import render_template
+
+import bench_seed
+
+
+def main():
+    parser = bench_seed.parser(__doc__)
+    parser.add_argument('--legacy-repeat', type=int, default=1,
+                        help='the original view is slow, time it fewer times')
+    parser.add_argument('--skip-legacy', action='store_true',
+                        help='only time the new view (the original one takes '
+                             'many minutes at 50k venues)')
+    args = parser.parse_args()
+
+    fyyur = bench_seed.load_app(args.database_url)
+    app, db, Venue = fyyur.app, fyyur.db, fyyur.Venue
+
+    @app.route('/bench/venues-legacy')
+    def venues_legacy():
+        query = Venue.query.all()
+        places = Venue.query.distinct(Venue.city, Venue.state).all()
+        areas = []
+        for place in places:
+            venuesList = []
+            for venue in query:
+                if venue.city == place.city and venue.state == place.state:
+                    showsCount = len(
+                        [show for show in venue.shows if show.start_time > datetime.now()]
+                    )
+                    venuesList.append({
+                        'id': venue.id,
+                        'name': venue.name,
+                        'num_upcoming_shows': showsCount
+                    })
+            areas.append({
+                'city': place.city,
+                'state': place.state,
+                'venues': venuesList
+            })
+        db.session.close()
+        return render_template('pages/venues.html', areas=areas)
+
+    with app.app_context():
+        if not args.no_seed:
+            bench_seed.seed(db, args.venues, args.artists, args.shows, args.areas)
+        engine = db.engine
+
+    client = app.test_client()
+
+    def get(url):
+        def call():
+            response = client.get(url)
+            assert response.status_code == 200, response.status_code
+        return call
+
+    if not args.skip_legacy:
+        bench_seed.measure('before: /venues (legacy)', get('/bench/venues-legacy'),
+                           engine, args.legacy_repeat)
+    bench_seed.measure('after:  /venues', get('/venues'), engine, args.repeat)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,174 @@
+#----------------------------------------------------------------------------#
+# Show counters.
+#
+# Venue and Artist carry upcoming_shows_count and past_shows_count, so the
+# listings and detail pages read them instead of counting shows. Every show
+# has an `upcoming` flag recording which of the two counters it is in:
+#
+# - creating, moving or deleting a show through the ORM updates the counters
+#   in the same transaction (watch()), bulk inserts call add_shows();
+# - roll_over(), run periodically (flask roll-over-shows), moves the shows
+#   whose start time has passed from the upcoming to the past counters;
+# - reconcile() recounts every show in bulk and reports, or fixes, the
+#   counters that drifted (flask reconcile-counters).
+#
+# Between two roll-overs a show that just started is still upcoming. Every
+# writer of the counters also sets updated_at, which keys the cached
+# fragments showing them (fragments.py).
+#----------------------------------------------------------------------------#
+
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import event, inspect, text
+
+from models import Artist, Show, Venue
+
+# (model, the Show column pointing at it)
+COUNTED = ((Venue, 'venue_id'), (Artist, 'artist_id'))
+
+
+def shift(connection, model, id, upcoming, delta):
+    table = model.__table__
+    column = table.c.upcoming_shows_count if upcoming else table.c.past_shows_count
+    connection.execute(table.update().where(table.c.id == id).values(
+        {column.name: column + delta}))
+
+
+def count_show(connection, venue_id, artist_id, upcoming, delta):
+    shift(connection, Venue, venue_id, upcoming, delta)
+    shift(connection, Artist, artist_id, upcoming, delta)
+
+
+def stored_show(connection, show_id):
+    # The show as the counters know it, locked until the end of the
+    # transaction so a concurrent roll-over can not move it meanwhile.
+    return connection.execute(text(
+        'SELECT venue_id, artist_id, upcoming FROM shows '
+        'WHERE id = :id FOR UPDATE'), {'id': show_id}).first()
+
+
+def before_insert(mapper, connection, show):
+    show.upcoming = show.start_time > datetime.now()
+    count_show(connection, show.venue_id, show.artist_id, show.upcoming, 1)
+
+
+def before_update(mapper, connection, show):
+    changed = inspect(show).attrs
+    if not any(changed[name].history.has_changes()
+               for name in ('venue_id', 'artist_id', 'start_time')):
+        return
+    stored = stored_show(connection, show.id)
+    count_show(connection, stored.venue_id, stored.artist_id, stored.upcoming, -1)
+    show.upcoming = show.start_time > datetime.now()
+    count_show(connection, show.venue_id, show.artist_id, show.upcoming, 1)
+
+
+def before_delete(mapper, connection, show):
+    stored = stored_show(connection, show.id)
+    if stored:
+        count_show(connection, stored.venue_id, stored.artist_id,
+                   stored.upcoming, -1)
+
+
+def watch():
+    # Keeps the counters in step with the shows written through the ORM.
+    event.listen(Show, 'before_insert', before_insert)
+    event.listen(Show, 'before_update', before_update)
+    event.listen(Show, 'before_delete', before_delete)
+
+
+def add_shows(connection, shows):
+    # Counts shows, (venue_id, artist_id, upcoming) tuples inserted in bulk,
+    # with one UPDATE per table whatever their number.
+    for index, (model, fk) in enumerate(COUNTED):
+        upcoming, past = Counter(), Counter()
+        for show in shows:
+            (upcoming if show[2] else past)[show[index]] += 1
+        ids = sorted(set(upcoming) | set(past))
+        if not ids:
+            continue
+        connection.execute(text(
+            'UPDATE {table} t '
+            'SET upcoming_shows_count = t.upcoming_shows_count + d.upcoming, '
+            '    past_shows_count = t.past_shows_count + d.past, '
+            '    updated_at = now() '
+            'FROM unnest(CAST(:ids AS integer[]), CAST(:upcoming AS integer[]), '
+            '            CAST(:past AS integer[])) AS d(id, upcoming, past) '
+            'WHERE t.id = d.id'.format(table=model.__tablename__)), {
+                'ids': ids,
+                'upcoming': [upcoming[id] for id in ids],
+                'past': [past[id] for id in ids]
+        })
+
+
+def roll_over(connection, now=None):
+    # Moves the shows started by now from the upcoming to the past counters,
+    # in one statement: the flags and both tables change together. Returns
+    # the number of shows moved. The partial index ix_shows_upcoming_start_time
+    # finds them without scanning the past shows.
+    rolled = ['''
+        WITH rolled AS (
+            UPDATE shows SET upcoming = false
+            WHERE upcoming AND start_time <= :now
+            RETURNING venue_id, artist_id
+        )''']
+    for model, fk in COUNTED:
+        rolled.append('''
+        {table}_rolled AS (
+            UPDATE {table} t
+            SET upcoming_shows_count = t.upcoming_shows_count - r.shows,
+                past_shows_count = t.past_shows_count + r.shows,
+                updated_at = now()
+            FROM (SELECT {fk} AS id, count(*) AS shows
+                  FROM rolled GROUP BY {fk}) AS r
+            WHERE t.id = r.id
+        )'''.format(table=model.__tablename__, fk=fk))
+    statement = ','.join(rolled) + '\n        SELECT count(*) FROM rolled'
+    return connection.execute(text(statement),
+                              {'now': now or datetime.now()}).scalar()
+
+
+def reconcile(connection, fix=False, now=None):
+    # Checks every counter against the shows, counted in one grouped query
+    # per table, after a roll-over to now. Returns {table: [(id, stored
+    # upcoming, stored past, real upcoming, real past)]} for the rows that
+    # differ, and the number of show flags out of date. With fix, the flags
+    # and counters are corrected; shows are locked against writes meanwhile.
+    now = now or datetime.now()
+    if fix:
+        connection.execute(text('LOCK TABLE shows IN SHARE MODE'))
+    roll_over(connection, now)
+    params = {'now': now}
+    wrongFlags = "upcoming IS DISTINCT FROM (start_time > :now)"
+    flags = connection.execute(text(
+        'SELECT count(*) FROM shows WHERE ' + wrongFlags), params).scalar()
+    if fix and flags:
+        connection.execute(text(
+            'UPDATE shows SET upcoming = start_time > :now WHERE ' + wrongFlags),
+            params)
+
+    drift = {}
+    for model, fk in COUNTED:
+        real = '''
+            SELECT t.id, t.upcoming_shows_count, t.past_shows_count,
+                   coalesce(s.upcoming, 0) AS upcoming, coalesce(s.past, 0) AS past
+            FROM {table} t LEFT JOIN (
+                SELECT {fk} AS id,
+                       count(*) FILTER (WHERE start_time > :now) AS upcoming,
+                       count(*) FILTER (WHERE start_time <= :now) AS past
+                FROM shows GROUP BY {fk}
+            ) AS s ON s.id = t.id
+            WHERE (t.upcoming_shows_count, t.past_shows_count)
+                  IS DISTINCT FROM (coalesce(s.upcoming, 0), coalesce(s.past, 0))
+        '''.format(table=model.__tablename__, fk=fk)
+        rows = [tuple(row) for row in connection.execute(text(real), params)]
+        drift[model.__tablename__] = rows
+        if fix and rows:
+            connection.execute(text('''
+                UPDATE {table} t SET upcoming_shows_count = d.upcoming,
+                                     past_shows_count = d.past,
+                                     updated_at = now()
+                FROM ({real}) AS d WHERE t.id = d.id
+            '''.format(table=model.__tablename__, real=real)), params)
+    return drift, flags
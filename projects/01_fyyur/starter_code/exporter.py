@@ -0,0 +1,125 @@
+#----------------------------------------------------------------------------#
+# Bulk export.
+#
+# Streams venues, artists or shows as JSON Lines or CSV, the formats read by
+# importer.py. Rows come from a server-side cursor (Query.yield_per) and are
+# encoded, and gzip compressed if asked, one batch at a time, so an export
+# of millions of rows holds a single batch in memory.
+#----------------------------------------------------------------------------#
+
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+
+from models import Artist, Show, Venue, db
+
+# Rows fetched from the cursor, and encoded, at a time.
+EXPORT_BATCH = 5000
+
+FORMATS = {
+    'jsonl': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def show_columns():
+    return [Show.id, Show.venue_id, Venue.name.label('venue_name'),
+            Show.artist_id, Artist.name.label('artist_name'),
+            Show.start_time, Show.end_time]
+
+
+# kind: (model, its exported columns, the Show column referencing it)
+KINDS = {
+    'venues': (Venue, lambda: list(Venue.__table__.columns), Show.venue_id),
+    'artists': (Artist, lambda: list(Artist.__table__.columns), Show.artist_id),
+    'shows': (Show, show_columns, None),
+}
+
+
+def export_query(kind, start=None, end=None, city=None, state=None):
+    # Rows of kind in id order. start and end bound Show.start_time
+    # (start <= start_time < end): the shows themselves, or the venues and
+    # artists with a show in that range. city and state, matched without
+    # case, filter venues and artists by their own area and shows by the
+    # area of their venue.
+    model, columns, show_fk = KINDS[kind]
+    query = db.session.query(*columns())
+    if model is Show:
+        query = query.join(Venue, Show.venue).join(Artist, Show.artist)
+        area = Venue
+    else:
+        area = model
+    if city:
+        query = query.filter(db.func.lower(area.city) == city.lower())
+    if state:
+        query = query.filter(db.func.lower(area.state) == state.lower())
+
+    period = []
+    if start:
+        period.append(Show.start_time >= start)
+    if end:
+        period.append(Show.start_time < end)
+    if period and model is Show:
+        query = query.filter(*period)
+    elif period:
+        shows = db.session.query(Show.id).filter(show_fk == model.id, *period)
+        query = query.filter(shows.exists())
+    return query.order_by(model.id).yield_per(EXPORT_BATCH)
+
+
+def json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def csv_value(value):
+    # Lists as the comma separated text importer.py splits again, booleans
+    # as the 'true' / 'false' a BooleanField reads back.
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, list):
+        return ', '.join(value)
+    return json_value(value)
+
+
+def batches(query, format):
+    # Yields the export as text, one chunk per EXPORT_BATCH rows.
+    names = [column['name'] for column in query.column_descriptions]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    if format == 'csv':
+        writer.writerow(names)
+    count = 0
+    for row in query:
+        if format == 'csv':
+            writer.writerow([csv_value(value) for value in row])
+        else:
+            buffer.write(json.dumps(
+                {name: json_value(value) for name, value in zip(names, row)}))
+            buffer.write('\n')
+        count += 1
+        if count == EXPORT_BATCH:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            count = 0
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def encode(chunks, compress=False):
+    # chunks as UTF-8 bytes, gzip compressed on the fly if compress.
+    if not compress:
+        for chunk in chunks:
+            yield chunk.encode('utf-8')
+        return
+    # wbits=31: deflate with a gzip header and trailer.
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -1,8 +1,8 @@
 from datetime import datetime
 from flask_wtf import FlaskForm
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, IntegerField
 from wtforms import validators
-from wtforms.validators import DataRequired, AnyOf, URL
+from wtforms.validators import DataRequired, AnyOf, URL, NumberRange, Optional
 from enum import Enum
 import re
 
@@ -108,6 +108,11 @@ class ShowForm(FlaskForm):
         validators=[DataRequired()],
         default=datetime.today()
     )
+    # Optional length of the show in minutes. Without it the show only books
+    # its start time.
+    duration = IntegerField(
+        'duration', validators=[Optional(), NumberRange(min=1, max=7 * 24 * 60)]
+    )
 
 
 class VenueForm(FlaskForm):
@@ -0,0 +1,209 @@
+#----------------------------------------------------------------------------#
+# Fragment cache.
+#
+# Templates wrap the blocks worth keeping in
+#
+#   {% cache 'venue', venue.id, venue.updated_at %} ... {% endcache %}
+#
+# and the rendered HTML is stored under the joined arguments. Entities are
+# keyed by their id and updated_at, so an edit makes their old fragments
+# unreachable. Lists add a generation, changed by invalidate() from the
+# create/edit/delete handlers, to their key. With the memory backend the
+# generation only changes in the process that handled the write, so list
+# keys also hold their rows' last updated_at and count.
+#
+# FRAGMENT_CACHE in config.py picks the backend: 'memory' for an LRU held by
+# each process, 'disk' for files under FRAGMENT_CACHE_DIR, shared by every
+# worker of the host (point it at /dev/shm to keep them in shared memory),
+# or None to render everything each time.
+#----------------------------------------------------------------------------#
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+
+class LRUBackend:
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] and entry[0] <= time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        with self.lock:
+            self.entries[key] = (time.time() + ttl if ttl else 0, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class DiskBackend:
+    # One file per entry, named after the hash of its key: the expiry time
+    # (0 for none) on the first line, the value after it. Files are written
+    # to a temporary name then renamed, so readers in other processes never
+    # see half an entry. Past maxsize files, the oldest written are removed.
+
+    def __init__(self, directory, maxsize=10000):
+        self.directory = directory
+        self.maxsize = maxsize
+        self.writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory,
+                            hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self.path(key), encoding='utf-8') as file:
+                expires = float(file.readline())
+                if expires and expires <= time.time():
+                    return None
+                return file.read()
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key, value, ttl=None):
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory,
+                                                 suffix='.tmp')
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as file:
+            file.write('{}\n'.format(time.time() + ttl if ttl else 0))
+            file.write(value)
+        os.replace(temporary, self.path(key))
+        self.writes += 1
+        if self.writes % 100 == 0:
+            self.prune()
+
+    def prune(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except OSError:
+                pass
+        if len(entries) <= self.maxsize:
+            return
+        entries.sort()
+        # Down to 90% of maxsize, so pruning does not run on every write.
+        for mtime, path in entries[:len(entries) - self.maxsize * 9 // 10]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+class FragmentCache:
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.ttl = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.get('FRAGMENT_CACHE')
+        size = app.config.get('FRAGMENT_CACHE_SIZE', 10000)
+        if backend == 'memory':
+            self.backend = LRUBackend(size)
+        elif backend == 'disk':
+            self.backend = DiskBackend(app.config['FRAGMENT_CACHE_DIR'], size)
+        elif backend is not None:
+            raise ValueError('Unknown FRAGMENT_CACHE {!r}'.format(backend))
+        self.ttl = app.config.get('FRAGMENT_CACHE_TTL')
+        app.jinja_env.add_extension(CacheExtension)
+        app.jinja_env.fragment_cache = self
+
+    @staticmethod
+    def key(parts):
+        return ':'.join(str(part) for part in parts)
+
+    def generation(self, name):
+        # The current generation of a list, part of the keys of its fragments.
+        if self.backend is None:
+            return 0
+        return self.backend.get('generation:' + name) or 0
+
+    def invalidate(self, *names):
+        # Makes the fragments keyed by the generation of names unreachable.
+        # A new unique value, rather than an increment, so concurrent workers
+        # never race on a read-modify-write.
+        if self.backend is not None:
+            for name in names:
+                self.backend.set('generation:' + name, str(time.time_ns()))
+
+    def fragment(self, parts, render):
+        # The cached fragment of parts, rendered by render() on a miss.
+        if self.backend is None:
+            return render()
+        key = 'fragment:' + self.key(parts)
+        value = self.backend.get(key)
+        if value is None:
+            value = render()
+            self.backend.set(key, value, self.ttl)
+        return value
+
+
+class CacheExtension(Extension):
+    # {% cache part, ... %}body{% endcache %}, after the fragment cache
+    # example of the Jinja documentation.
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method('_cache', [nodes.List(parts)]), [], [], body
+        ).set_lineno(lineno)
+
+    def _cache(self, parts, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        return cache.fragment(parts, caller)
@@ -0,0 +1,222 @@
+#----------------------------------------------------------------------------#
+# Bulk import.
+#
+# Streams venues, artists or shows from a CSV or JSON Lines file, validates
+# every row with the form of the matching create view (VenueForm, ArtistForm,
+# ShowForm) and inserts the valid rows by batches, one multi-row INSERT per
+# batch. Rows failing validation, or refused by the database, are written to
+# a JSON Lines reject file with their line number and errors. Only one batch
+# is held at a time, so memory use does not grow with the input.
+#----------------------------------------------------------------------------#
+
+import csv
+import json
+import time
+from datetime import datetime, timedelta
+
+import psycopg2
+from psycopg2.extras import execute_values
+from sqlalchemy.exc import DataError, IntegrityError
+from werkzeug.datastructures import MultiDict
+
+import counters
+from forms import ArtistForm, ShowForm, VenueForm
+from models import Artist, Show, Venue, db
+from query_stats import timed
+
+# Fields holding several values: a JSON array in JSON Lines, a comma
+# separated list in CSV.
+LIST_FIELDS = ('genres',)
+
+
+def read_rows(path, format):
+    # Yields (line number, row dict) from a CSV file with a header line or
+    # from a JSON Lines file.
+    with open(path, newline='', encoding='utf-8') as file:
+        if format == 'csv':
+            reader = csv.DictReader(file)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line, text in enumerate(file, 1):
+                if text.strip():
+                    try:
+                        row = json.loads(text)
+                    except ValueError:
+                        row = None
+                    yield line, row
+
+
+def form_data(row):
+    data = MultiDict()
+    for key, value in row.items():
+        if key in LIST_FIELDS and isinstance(value, str):
+            value = [item.strip() for item in value.split(',') if item.strip()]
+        if isinstance(value, bool):
+            # BooleanField is false when absent.
+            if value:
+                data.add(key, 'y')
+        elif isinstance(value, list):
+            for item in value:
+                data.add(key, str(item))
+        elif value is not None:
+            data.add(key, value if isinstance(value, str) else str(value))
+    return data
+
+
+def entity_values(model):
+    # The create views store every form field that is a column of the model.
+    columns = model.__table__.columns
+
+    def values(form):
+        return {field.name: field.data for field in form if field.name in columns}
+    return values
+
+
+def show_values(form):
+    start_time = form.start_time.data
+    end_time = None
+    if form.duration.data:
+        end_time = start_time + timedelta(minutes=form.duration.data)
+    return {
+        'artist_id': int(form.artist_id.data),
+        'venue_id': int(form.venue_id.data),
+        'start_time': start_time,
+        'end_time': end_time,
+        'upcoming': start_time > datetime.now()
+    }
+
+
+def show_errors(row):
+    # ShowForm falls back to today for a missing start_time, an imported
+    # show must give one. The ids must be integers to reach the database.
+    errors = {}
+    if not row.get('start_time'):
+        errors['start_time'] = ['This field is required.']
+    for field in ('artist_id', 'venue_id'):
+        try:
+            int(row.get(field) or '')
+        except (TypeError, ValueError):
+            errors[field] = ['Must be an integer id.']
+    return errors
+
+
+KINDS = {
+    'venues': (VenueForm, Venue, entity_values(Venue), None),
+    'artists': (ArtistForm, Artist, entity_values(Artist), None),
+    'shows': (ShowForm, Show, show_values, show_errors),
+}
+
+
+class Importer:
+    # Imports the rows of one kind ('venues', 'artists' or 'shows'), writing
+    # rejected rows to the rejects file object. progress, if given, is called
+    # with the importer after every batch.
+
+    def __init__(self, kind, rejects, batch_size=1000, progress=None):
+        formClass, model, self.values, self.check = KINDS[kind]
+        # One form, reprocessed for every row, saves binding its fields again.
+        self.form = formClass(MultiDict(), meta={'csrf': False})
+        self.table = model.__table__
+        self.columns = None
+        self.rejects = rejects
+        self.batch_size = batch_size
+        self.progress = progress
+        self.read = 0
+        self.inserted = 0
+        self.rejected = 0
+        self.started = None
+
+    def validate(self, line, row):
+        # Returns the column values of row, or None once it is rejected.
+        if not isinstance(row, dict):
+            self.reject(line, row, {'row': ['Not a JSON object.']})
+            return None
+        errors = self.check(row) if self.check else {}
+        if not errors:
+            self.form.process(form_data(row))
+            if self.form.validate():
+                return self.values(self.form)
+            errors = {name: list(errs) for name, errs in self.form.errors.items()}
+        self.reject(line, row, errors)
+        return None
+
+    def reject(self, line, row, errors):
+        self.rejected += 1
+        self.rejects.write(json.dumps(
+            {'line': line, 'row': row, 'errors': errors}, default=str) + '\n')
+
+    def run(self, rows):
+        self.started = time.perf_counter()
+        batch = []
+        for line, row in rows:
+            self.read += 1
+            values = self.validate(line, row)
+            if values is not None:
+                batch.append((line, row, values))
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+                batch = []
+        if batch:
+            self.flush(batch)
+        return self
+
+    def flush(self, batch):
+        # One INSERT for the whole batch. If the database refuses it (a
+        # missing venue, a booking conflict...), the batch is replayed row by
+        # row, each in a savepoint, to reject only the offending rows.
+        try:
+            self.insert([values for line, row, values in batch])
+            db.session.commit()
+            self.inserted += len(batch)
+        except (IntegrityError, DataError):
+            db.session.rollback()
+            for line, row, values in batch:
+                try:
+                    with db.session.begin_nested():
+                        self.insert([values])
+                    self.inserted += 1
+                except (IntegrityError, DataError) as error:
+                    self.reject(line, row, {
+                        'database': [str(error.orig).strip().splitlines()[0]]})
+            db.session.commit()
+        if self.progress:
+            self.progress(self)
+
+    def insert(self, rows):
+        # A multi-row INSERT built by psycopg2's execute_values, much cheaper
+        # than compiling a SQLAlchemy insert with one bind set per row.
+        # Errors are wrapped like SQLAlchemy's so callers handle them alike,
+        # and the statement is recorded in the query stats by hand, as the
+        # cursor events never see it.
+        if self.columns is None:
+            self.columns = list(rows[0])
+        statement = 'INSERT INTO {} ({}) VALUES %s'.format(
+            self.table.name, ', '.join(self.columns))
+        connection = db.session.connection()
+        cursor = connection.connection.cursor()
+        try:
+            with timed(statement):
+                execute_values(cursor, statement,
+                               [[row[column] for column in self.columns] for row in rows],
+                               page_size=len(rows))
+        except psycopg2.IntegrityError as error:
+            raise IntegrityError(statement, None, error)
+        except psycopg2.DataError as error:
+            raise DataError(statement, None, error)
+        finally:
+            cursor.close()
+        if self.table is Show.__table__:
+            # Bulk inserts skip the ORM events that count shows.
+            counters.add_shows(connection, [
+                (row['venue_id'], row['artist_id'], row['upcoming'])
+                for row in rows])
+
+    def rate(self):
+        elapsed = time.perf_counter() - self.started
+        return self.read / elapsed if elapsed else 0.0
+
+    def summary(self):
+        return '{} rows read, {} inserted, {} rejected in {:.1f} s ({:.0f} rows/s)'.format(
+            self.read, self.inserted, self.rejected,
+            time.perf_counter() - self.started, self.rate())
@@ -0,0 +1,26 @@
+"""add (venue_id, start_time) and (artist_id, start_time) indexes on shows
+
+Revision ID: 5c1d6e8f2a4b
+Revises: 3b8aa9c2fa8f
+Create Date: 2026-10-18 18:10:24.118406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1d6e8f2a4b'
+down_revision = '3b8aa9c2fa8f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_shows_venue_id_start_time', 'shows', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_shows_artist_id_start_time', 'shows', ['artist_id', 'start_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_shows_artist_id_start_time', table_name='shows')
+    op.drop_index('ix_shows_venue_id_start_time', table_name='shows')
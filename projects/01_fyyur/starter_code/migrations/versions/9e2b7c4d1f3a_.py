@@ -0,0 +1,80 @@
+"""reject double bookings in the database: unique start times and
+non-overlapping show periods per venue and per artist
+
+Revision ID: 9e2b7c4d1f3a
+Revises: 5c1d6e8f2a4b
+Create Date: 2026-10-18 18:42:51.602913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e2b7c4d1f3a'
+down_revision = '5c1d6e8f2a4b'
+branch_labels = None
+depends_on = None
+
+# Must stay identical to show_period() in app.py so that the overlap check
+# there is answered from these constraints' GiST indexes.
+SHOW_PERIOD = ("tsrange(start_time, COALESCE(end_time, start_time), "
+               "CASE WHEN end_time IS NULL THEN '[]' ELSE '[)' END)")
+
+
+# Conflicting shows listed by the pre-check, per venue and per artist.
+REPORTED_CONFLICTS = 20
+
+
+def check_double_bookings():
+    # Stops the upgrade with a report of the shows the constraints would
+    # refuse. Existing shows have no end time yet, so their periods are
+    # single instants: they overlap exactly when a venue or an artist has
+    # two shows starting at the same time. Which of them to keep is left to
+    # a person, nothing is deleted here.
+    connection = op.get_bind()
+    report = []
+    for fk in ('venue_id', 'artist_id'):
+        rows = connection.execute(sa.text(
+            'SELECT {fk}, start_time, array_agg(id ORDER BY id) AS ids, '
+            '       count(*) OVER () AS conflicts '
+            'FROM shows GROUP BY {fk}, start_time HAVING count(*) > 1 '
+            'ORDER BY {fk}, start_time LIMIT :limit'.format(fk=fk)),
+            {'limit': REPORTED_CONFLICTS}).fetchall()
+        if rows:
+            report.append('Start times booked more than once by the same {} ({}):'.format(
+                fk[:-3], rows[0].conflicts))
+            report.extend('  {} {} at {}: shows {}'.format(
+                fk, row[0], row.start_time, ', '.join(map(str, row.ids)))
+                for row in rows)
+    if report:
+        raise RuntimeError(
+            'Double booked shows, delete or move them before upgrading:\n'
+            + '\n'.join(report))
+
+
+def upgrade():
+    check_double_bookings()
+    op.add_column('shows', sa.Column('end_time', sa.DateTime(), nullable=True))
+
+    # The unique indexes replace the plain ones added in 5c1d6e8f2a4b.
+    op.drop_index('ix_shows_venue_id_start_time', table_name='shows')
+    op.drop_index('ix_shows_artist_id_start_time', table_name='shows')
+    op.create_unique_constraint('uq_shows_venue_id_start_time', 'shows', ['venue_id', 'start_time'])
+    op.create_unique_constraint('uq_shows_artist_id_start_time', 'shows', ['artist_id', 'start_time'])
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.execute('ALTER TABLE shows ADD CONSTRAINT ex_shows_venue_id_period '
+               'EXCLUDE USING gist (venue_id WITH =, {} WITH &&)'.format(SHOW_PERIOD))
+    op.execute('ALTER TABLE shows ADD CONSTRAINT ex_shows_artist_id_period '
+               'EXCLUDE USING gist (artist_id WITH =, {} WITH &&)'.format(SHOW_PERIOD))
+
+
+def downgrade():
+    op.drop_constraint('ex_shows_artist_id_period', 'shows')
+    op.drop_constraint('ex_shows_venue_id_period', 'shows')
+    op.drop_constraint('uq_shows_artist_id_start_time', 'shows', type_='unique')
+    op.drop_constraint('uq_shows_venue_id_start_time', 'shows', type_='unique')
+    op.create_index('ix_shows_venue_id_start_time', 'shows', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_shows_artist_id_start_time', 'shows', ['artist_id', 'start_time'], unique=False)
+    op.drop_column('shows', 'end_time')
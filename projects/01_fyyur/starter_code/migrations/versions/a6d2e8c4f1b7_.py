@@ -0,0 +1,31 @@
+"""add updated_at on venues and artists, versioning their cached fragments
+
+Revision ID: a6d2e8c4f1b7
+Revises: f3b9d2a6c8e4
+Create Date: 2026-10-19 11:02:51.773120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6d2e8c4f1b7'
+down_revision = 'f3b9d2a6c8e4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venues', 'artists'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(),
+                                       server_default=sa.func.now(),
+                                       nullable=False))
+        op.create_index(op.f('ix_{}_updated_at'.format(table)), table,
+                        ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table in ('artists', 'venues'):
+        op.drop_index(op.f('ix_{}_updated_at'.format(table)), table_name=table)
+        op.drop_column(table, 'updated_at')
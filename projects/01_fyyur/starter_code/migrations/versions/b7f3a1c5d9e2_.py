@@ -0,0 +1,24 @@
+"""add (start_time, id) index on shows for the keyset paginated /shows
+
+Revision ID: b7f3a1c5d9e2
+Revises: 9e2b7c4d1f3a
+Create Date: 2026-10-18 20:42:07.530912
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7f3a1c5d9e2'
+down_revision = '9e2b7c4d1f3a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_shows_start_time_id', 'shows', ['start_time', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_shows_start_time_id', table_name='shows')
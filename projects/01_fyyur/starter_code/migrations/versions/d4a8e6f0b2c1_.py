@@ -0,0 +1,33 @@
+"""add pg_trgm GIN indexes on venues.name and artists.name for search
+
+Revision ID: d4a8e6f0b2c1
+Revises: b7f3a1c5d9e2
+Create Date: 2026-10-18 21:36:51.204877
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4a8e6f0b2c1'
+down_revision = 'b7f3a1c5d9e2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The trigram operator class lets the planner answer name ILIKE '%term%'
+    # from the index, whatever the position of term in the name.
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_venues_name_trgm', 'venues', ['name'], unique=False,
+                    postgresql_using='gin',
+                    postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_artists_name_trgm', 'artists', ['name'], unique=False,
+                    postgresql_using='gin',
+                    postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_artists_name_trgm', table_name='artists')
+    op.drop_index('ix_venues_name_trgm', table_name='venues')
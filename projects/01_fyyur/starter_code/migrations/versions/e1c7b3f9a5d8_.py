@@ -0,0 +1,35 @@
+"""add GIN indexes on genres and "city, state" for the /search endpoint
+
+Revision ID: e1c7b3f9a5d8
+Revises: d4a8e6f0b2c1
+Create Date: 2026-10-18 22:58:13.661349
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1c7b3f9a5d8'
+down_revision = 'd4a8e6f0b2c1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_venues_genres', 'venues', ['genres'], unique=False,
+                    postgresql_using='gin')
+    op.create_index('ix_artists_genres', 'artists', ['genres'], unique=False,
+                    postgresql_using='gin')
+    # Must match the area expression of app.entity_hits.
+    op.execute("CREATE INDEX ix_venues_area_trgm ON venues "
+               "USING gin ((city || ', ' || state) gin_trgm_ops)")
+    op.execute("CREATE INDEX ix_artists_area_trgm ON artists "
+               "USING gin ((city || ', ' || state) gin_trgm_ops)")
+
+
+def downgrade():
+    op.drop_index('ix_artists_area_trgm', table_name='artists')
+    op.drop_index('ix_venues_area_trgm', table_name='venues')
+    op.drop_index('ix_artists_genres', table_name='artists')
+    op.drop_index('ix_venues_genres', table_name='venues')
@@ -0,0 +1,52 @@
+"""add upcoming/past show counters on venues and artists
+
+Revision ID: f3b9d2a6c8e4
+Revises: e1c7b3f9a5d8
+Create Date: 2026-10-19 09:14:36.208417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b9d2a6c8e4'
+down_revision = 'e1c7b3f9a5d8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venues', 'artists'):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(),
+                                       server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(),
+                                       server_default='0', nullable=False))
+    op.add_column('shows', sa.Column('upcoming', sa.Boolean(),
+                                     server_default=sa.false(), nullable=False))
+
+    # Counts the existing shows. The app compares start times with its local
+    # naive datetime.now(), hence LOCALTIMESTAMP.
+    op.execute('UPDATE shows SET upcoming = true '
+               'WHERE start_time > LOCALTIMESTAMP')
+    for table, fk in (('venues', 'venue_id'), ('artists', 'artist_id')):
+        op.execute('''
+            UPDATE {table} t SET upcoming_shows_count = s.upcoming,
+                                 past_shows_count = s.past
+            FROM (SELECT {fk} AS id,
+                         count(*) FILTER (WHERE upcoming) AS upcoming,
+                         count(*) FILTER (WHERE NOT upcoming) AS past
+                  FROM shows GROUP BY {fk}) AS s
+            WHERE t.id = s.id
+        '''.format(table=table, fk=fk))
+
+    op.create_index('ix_shows_upcoming_start_time', 'shows', ['start_time'],
+                    unique=False, postgresql_where=sa.text('upcoming'))
+
+
+def downgrade():
+    op.drop_index('ix_shows_upcoming_start_time', table_name='shows')
+    op.drop_column('shows', 'upcoming')
+    for table in ('artists', 'venues'):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
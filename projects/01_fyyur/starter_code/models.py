@@ -6,6 +6,13 @@ db = SQLAlchemy()
 
 class Venue(db.Model):
     __tablename__ = 'venues'
+    # name is searched through the pg_trgm GIN index ix_venues_name_trgm,
+    # created in migration d4a8e6f0b2c1, and "city, state" through
+    # ix_venues_area_trgm of migration e1c7b3f9a5d8 (they need pg_trgm).
+    __table_args__ = (
+        # /search matches genres with the array overlap operator &&.
+        db.Index('ix_venues_genres', 'genres', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
@@ -19,12 +26,29 @@ class Venue(db.Model):
     seeking_talent = db.Column(db.Boolean, default=False)
     website = db.Column(db.String())
     seeking_description = db.Column(db.String)
+    # Part of the keys of the cached fragments (fragments.py). Set by the
+    # database clock, server side, so rows imported in bulk get one too.
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+                           default=db.func.now(), onupdate=db.func.now(),
+                           server_default=db.func.now())
+    # Maintained by counters.py, see there.
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0,
+                                     server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0,
+                                 server_default='0')
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
 
 class Artist(db.Model):
     __tablename__ = 'artists'
+    # name is searched through the pg_trgm GIN index ix_artists_name_trgm,
+    # created in migration d4a8e6f0b2c1, and "city, state" through
+    # ix_artists_area_trgm of migration e1c7b3f9a5d8 (they need pg_trgm).
+    __table_args__ = (
+        # /search matches genres with the array overlap operator &&.
+        db.Index('ix_artists_genres', 'genres', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
@@ -38,15 +62,48 @@ class Artist(db.Model):
     facebook_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String())
+    # Part of the keys of the cached fragments (fragments.py). Set by the
+    # database clock, server side, so rows imported in bulk get one too.
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+                           default=db.func.now(), onupdate=db.func.now(),
+                           server_default=db.func.now())
+    # Maintained by counters.py, see there.
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0,
+                                     server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0,
+                                 server_default='0')
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
 
 class Show(db.Model):
     __tablename__ = 'shows'
+    __table_args__ = (
+        # A venue or an artist can't be booked twice at the same time. The
+        # unique indexes also serve the per venue / per artist show lists,
+        # ordered by start_time, from an index range scan.
+        db.UniqueConstraint('venue_id', 'start_time',
+                            name='uq_shows_venue_id_start_time'),
+        db.UniqueConstraint('artist_id', 'start_time',
+                            name='uq_shows_artist_id_start_time'),
+        # The /shows listing pages through all shows by (start_time, id).
+        db.Index('ix_shows_start_time_id', 'start_time', 'id'),
+        # The roll-over of counters.py looks for upcoming shows that started.
+        db.Index('ix_shows_upcoming_start_time', 'start_time',
+                 postgresql_where=db.text('upcoming')),
+        # Overlapping bookings are rejected by the GiST exclusion constraints
+        # ex_shows_venue_id_period and ex_shows_artist_id_period, created in
+        # migration 9e2b7c4d1f3a (they need the btree_gist extension).
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     start_time = db.Column(db.DateTime, nullable=False)
+    # NULL for a show booked at its start time only.
+    end_time = db.Column(db.DateTime, nullable=True)
+    # Whether the show is counted in the upcoming_shows_count of its venue
+    # and artist, or in their past_shows_count. Set by counters.py.
+    upcoming = db.Column(db.Boolean, nullable=False, default=False,
+                         server_default=db.false())
 
     venue_id = db.Column(db.Integer, db.ForeignKey(
         'venues.id'), nullable=False)
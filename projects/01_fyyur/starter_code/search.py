@@ -0,0 +1,416 @@
+#----------------------------------------------------------------------------#
+# Name search.
+#
+# The database backend (app.search_names) filters names with ILIKE, served by
+# the pg_trgm GIN indexes of migration d4a8e6f0b2c1, and ranks them with
+# pg_trgm's similarity(). NgramIndex answers the same searches in process,
+# for databases without pg_trgm (SEARCH_BACKEND = 'memory' in config.py).
+# PrefixIndex serves /autocomplete. ResultCache holds the results of the
+# cross-entity /search by normalized query.
+#----------------------------------------------------------------------------#
+
+import bisect
+import heapq
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from functools import lru_cache
+
+from sqlalchemy import event, inspect
+
+WORD = re.compile(r'[^\W_]+')
+
+
+def escape_like(term):
+    # term as a literal inside a LIKE pattern escaped with '\'.
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def grams(text, n=3):
+    # Every substring of n characters of text, which is lower cased already.
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+@lru_cache(maxsize=65536)
+def padded_trigrams(word):
+    return frozenset(grams('  ' + word + ' '))
+
+
+def word_trigrams(text):
+    # Trigrams the way pg_trgm extracts them: per word, lower cased, padded
+    # with two spaces in front and one behind. Names share most of their
+    # words, so the trigrams of a word are cached.
+    trigrams = set()
+    for word in WORD.findall(text.lower()):
+        trigrams |= padded_trigrams(word)
+    return trigrams
+
+
+def similarity(a, b):
+    # pg_trgm's similarity(): shared trigrams over all trigrams of a and b.
+    return trigram_similarity(word_trigrams(a), word_trigrams(b))
+
+
+def trigram_similarity(a, b):
+    if not a or not b:
+        return 0.0
+    shared = len(a & b)
+    return shared / (len(a) + len(b) - shared)
+
+
+class NgramIndex:
+    # Case-insensitive substring search over (key, name) pairs.
+    # Every trigram of a lower cased name points at the keys of the names it
+    # appears in. The names containing a term are among those holding all of
+    # the term's trigrams; that intersection, started from the rarest
+    # trigram, is then checked for the term itself. Terms shorter than three
+    # characters are checked against every name.
+
+    def __init__(self, n=3):
+        self.n = n
+        self.names = {}
+        self.lowered = {}
+        self.postings = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, key, name):
+        with self.lock:
+            self._remove(key)
+            lowered = name.lower()
+            self.names[key] = name
+            self.lowered[key] = lowered
+            for gram in grams(lowered, self.n):
+                self.postings[gram].add(key)
+
+    def remove(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        lowered = self.lowered.pop(key, None)
+        if lowered is None:
+            return
+        del self.names[key]
+        for gram in grams(lowered, self.n):
+            keys = self.postings[gram]
+            keys.discard(key)
+            if not keys:
+                del self.postings[gram]
+
+    def search(self, term, limit=None, offset=0):
+        # Returns (total, [(key, name)]): the number of names containing term
+        # and the requested slice of them, most similar to term first.
+        needle = term.lower()
+        with self.lock:
+            termGrams = grams(needle, self.n)
+            if termGrams:
+                postings = sorted((self.postings.get(gram, set())
+                                   for gram in termGrams), key=len)
+                candidates = set(postings[0]).intersection(*postings[1:])
+            else:
+                candidates = list(self.lowered)
+            matches = [(key, self.names[key]) for key in candidates
+                       if needle in self.lowered[key]]
+
+        termTrigrams = word_trigrams(term)
+
+        def rank(match):
+            return (-trigram_similarity(word_trigrams(match[1]), termTrigrams),
+                    match[0])
+
+        if limit is None:
+            return len(matches), sorted(matches, key=rank)[offset:]
+        return len(matches), heapq.nsmallest(offset + limit, matches, key=rank)[offset:]
+
+
+class PrefixIndex:
+    # Autocompletion over (key, name) pairs: the names with a word starting
+    # with a prefix, in alphabetical order of the matching text.
+    # Every word of a normalized name starts one entry, the text from that
+    # word to the end of the name. Entries are sorted, so the entries
+    # starting with a prefix are a contiguous run found by bisection. They
+    # are held in chunks of at most 2 * CHUNK entries, so adding or removing
+    # a name moves a few thousand entries instead of the whole array.
+    # Names are lower cased with whitespace collapsed, like normalize_query.
+
+    CHUNK = 1000
+
+    def __init__(self):
+        self.names = {}
+        self.texts = []
+        self.keys = []
+        self.maxes = []
+        self.entries = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.names)
+
+    @staticmethod
+    def suffixes(name):
+        normalized = normalize_query(name)
+        return [normalized[match.start():]
+                for match in re.finditer(r'\S+', normalized)]
+
+    def load(self, pairs):
+        # Replaces the content of the index with pairs, sorted once.
+        names = dict(pairs)
+        entries = sorted((text, key) for key, name in names.items()
+                         for text in self.suffixes(name))
+        texts, keys = [], []
+        for start in range(0, len(entries), self.CHUNK):
+            chunk = entries[start:start + self.CHUNK]
+            texts.append([text for text, key in chunk])
+            keys.append([key for text, key in chunk])
+        with self.lock:
+            self.names = names
+            self.texts, self.keys = texts, keys
+            self.maxes = [chunk[-1] for chunk in texts]
+            self.entries = len(entries)
+
+    def add(self, key, name):
+        with self.lock:
+            self._remove(key)
+            self.names[key] = name
+            for text in self.suffixes(name):
+                self._insert(text, key)
+
+    def remove(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def _insert(self, text, key):
+        if not self.texts:
+            self.texts.append([])
+            self.keys.append([])
+            self.maxes.append(text)
+        i = min(bisect.bisect_left(self.maxes, text), len(self.maxes) - 1)
+        texts, keys = self.texts[i], self.keys[i]
+        position = bisect.bisect_right(texts, text)
+        texts.insert(position, text)
+        keys.insert(position, key)
+        self.maxes[i] = texts[-1]
+        self.entries += 1
+        if len(texts) > 2 * self.CHUNK:
+            self.texts[i:i + 1] = [texts[:self.CHUNK], texts[self.CHUNK:]]
+            self.keys[i:i + 1] = [keys[:self.CHUNK], keys[self.CHUNK:]]
+            self.maxes[i:i + 1] = [texts[self.CHUNK - 1], texts[-1]]
+
+    def _remove(self, key):
+        name = self.names.pop(key, None)
+        if name is None:
+            return
+        for text in self.suffixes(name):
+            # Equal texts may run over several chunks.
+            i = bisect.bisect_left(self.maxes, text)
+            position = bisect.bisect_left(self.texts[i], text)
+            while True:
+                if position == len(self.keys[i]):
+                    i, position = i + 1, 0
+                elif self.keys[i][position] == key:
+                    break
+                else:
+                    position += 1
+            texts, keys = self.texts[i], self.keys[i]
+            del texts[position]
+            del keys[position]
+            self.entries -= 1
+            if texts:
+                self.maxes[i] = texts[-1]
+            else:
+                del self.texts[i], self.keys[i], self.maxes[i]
+
+    def complete(self, prefix, limit=10):
+        # Returns [(key, name)] of at most limit names.
+        prefix = normalize_query(prefix)
+        found = {}
+        if not prefix:
+            return []
+        with self.lock:
+            i = bisect.bisect_left(self.maxes, prefix)
+            if i < len(self.maxes):
+                position = bisect.bisect_left(self.texts[i], prefix)
+            while len(found) < limit and i < len(self.maxes):
+                texts = self.texts[i]
+                if position == len(texts):
+                    i, position = i + 1, 0
+                    continue
+                if not texts[position].startswith(prefix):
+                    break
+                key = self.keys[i][position]
+                if key not in found:
+                    found[key] = self.names[key]
+                position += 1
+        return list(found.items())
+
+
+def watch_session(session, models, on_commit, attributes=()):
+    # Calls on_commit(changes) after each commit of session that inserted,
+    # updated or deleted instances of models. changes lists (model, id,
+    # values) in flush order, values mapping each of attributes to its value
+    # when flushed, None for a deleted instance. With attributes, updates
+    # leaving them all unchanged are left out. The values are read at flush
+    # time, as the commit expires the instances; changes rolled back never
+    # reach on_commit.
+    models = tuple(models)
+    key = object()
+
+    def snapshot(instance):
+        return {name: getattr(instance, name) for name in attributes}
+
+    def collect(session, flush_context):
+        changes = session.info.setdefault(key, [])
+        for instance in session.new:
+            if isinstance(instance, models):
+                changes.append((type(instance), instance.id, snapshot(instance)))
+        for instance in session.dirty:
+            if isinstance(instance, models) and (not attributes or any(
+                    inspect(instance).attrs[name].history.has_changes()
+                    for name in attributes)):
+                changes.append((type(instance), instance.id, snapshot(instance)))
+        for instance in session.deleted:
+            if isinstance(instance, models):
+                changes.append((type(instance), instance.id, None))
+
+    def apply(session):
+        changes = session.info.pop(key, None)
+        if changes:
+            on_commit(changes)
+
+    def discard(session):
+        session.info.pop(key, None)
+
+    event.listen(session, 'after_flush', collect)
+    event.listen(session, 'after_commit', apply)
+    event.listen(session, 'after_rollback', discard)
+
+
+class NameIndexes:
+    # One NgramIndex per model over model.name, and one PrefixIndex over the
+    # names of all models keyed by (model name in lower case, id), each
+    # loaded from the database on first use. Committed inserts, renames and
+    # deletes are applied to the loaded indexes, changes rolled back never
+    # reach them. Rows inserted by other processes (flask import, the other
+    # workers) skip this process's session events: every refresh seconds
+    # the rows past the highest id each index loaded are added to it.
+    # Renames and deletes made elsewhere still wait for a restart.
+
+    def __init__(self, db, models, refresh=30):
+        self.db = db
+        self.models = tuple(models)
+        self.refresh = refresh
+        self.indexes = {}
+        self.prefix_index = None
+        # (index, model) -> the highest id of model read into index
+        self.highest = {}
+        self.next_refresh = time.monotonic() + (refresh or 0)
+        self.lock = threading.Lock()
+        watch_session(db.session, self.models, self._apply, ('name',))
+
+    def get(self, model):
+        index = self.indexes.get(model)
+        if index is None:
+            with self.lock:
+                index = self.indexes.get(model)
+                if index is None:
+                    index = NgramIndex()
+                    for id, name in self._names(index, model):
+                        index.add(id, name)
+                    self.indexes[model] = index
+        self.catch_up()
+        return index
+
+    def prefixes(self):
+        if self.prefix_index is None:
+            with self.lock:
+                if self.prefix_index is None:
+                    index = PrefixIndex()
+                    index.load(
+                        ((model.__name__.lower(), id), name)
+                        for model in self.models
+                        for id, name in self._names(index, model))
+                    self.prefix_index = index
+        self.catch_up()
+        return self.prefix_index
+
+    def _names(self, index, model, after=0):
+        # The (id, name) rows of model with an id past after, recording the
+        # highest id read for index once they are all read.
+        highest = after
+        query = self.db.session.query(model.id, model.name).filter(model.id > after)
+        for id, name in query.yield_per(10000):
+            highest = max(highest, id)
+            yield id, name
+        self.highest[index, model] = highest
+
+    def catch_up(self):
+        # Adds the rows inserted since the last refresh, by any process.
+        # Ids come from a sequence, so a row committed after a higher id was
+        # read is missed; imports commit by batches, in id order.
+        if self.refresh is None or time.monotonic() < self.next_refresh:
+            return
+        with self.lock:
+            if time.monotonic() < self.next_refresh:
+                return
+            for (index, model), after in list(self.highest.items()):
+                prefix = model.__name__.lower() if index is self.prefix_index else None
+                for id, name in self._names(index, model, after):
+                    index.add(id if prefix is None else (prefix, id), name)
+            self.next_refresh = time.monotonic() + self.refresh
+
+    def _apply(self, changes):
+        for model, id, values in changes:
+            name = None if values is None else values['name']
+            for index, key in ((self.indexes.get(model), id),
+                               (self.prefix_index, (model.__name__.lower(), id))):
+                if index is None:
+                    continue
+                if name is None:
+                    index.remove(key)
+                else:
+                    index.add(key, name)
+
+
+def normalize_query(term):
+    # The cache key of a search: lower cased, with runs of whitespace
+    # collapsed, so 'Jazz  Bar' and 'jazz bar' share their results.
+    return ' '.join(term.lower().split())
+
+
+class ResultCache:
+    # Search results by normalized query, least recently used ones evicted
+    # past maxsize, each kept for at most ttl seconds. Any committed change
+    # to one of the watched models empties the cache.
+
+    def __init__(self, maxsize=512, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                self.entries.pop(key, None)
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def watch(self, db, models):
+        watch_session(db.session, models, lambda changes: self.clear())
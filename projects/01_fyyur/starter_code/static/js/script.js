@@ -2,3 +2,34 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// Suggest venue and artist names in the search boxes, from /autocomplete.
+document.querySelectorAll('form.search input[name="search_term"]').forEach(function(input, i) {
+  var list = document.createElement('datalist');
+  var timer = null;
+  list.id = 'search-suggestions-' + i;
+  input.setAttribute('list', list.id);
+  input.setAttribute('autocomplete', 'off');
+  input.parentNode.appendChild(list);
+
+  input.addEventListener('input', function() {
+    clearTimeout(timer);
+    timer = setTimeout(function() {
+      var query = input.value.trim();
+      if (!query) {
+        list.innerHTML = '';
+        return;
+      }
+      fetch('/autocomplete?q=' + encodeURIComponent(query))
+        .then(function(response) { return response.json(); })
+        .then(function(data) {
+          list.innerHTML = '';
+          data.suggestions.forEach(function(suggestion) {
+            var option = document.createElement('option');
+            option.value = suggestion.name;
+            list.appendChild(option);
+          });
+        });
+    }, 100);
+  });
+});
@@ -0,0 +1,149 @@
+'''
+Benchmark: GET /questions on page 1 and on a deep page of 1M questions.
+
+    python bench_questions.py --database-url postgresql://localhost:5432/trivia_bench
+
+Seeding DROPS AND RECREATES the questions and categories tables of the
+database given with --database-url, never point it at real data.
+
+"before" pages the way a naive endpoint does, loading every question and
+slicing the page out of the list; "offset" uses LIMIT/OFFSET alone; "after"
+is the endpoint: OFFSET for the first SHALLOW_PAGES pages, then the cached
+page anchors. "keyset" follows the next_cursor of the previous page.
+'''
+
+import argparse
+import statistics
+import sys
+import time
+
+import flaskr
+from models import db, Question, question_cache
+
+CATEGORIES = ['Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports']
+WORDS = ['river', 'painter', 'planet', 'empire', 'novel', 'olympic', 'element',
+         'capital', 'composer', 'mountain', 'dynasty', 'galaxy', 'volcano',
+         'island', 'symphony', 'molecule', 'treaty', 'desert', 'sculptor',
+         'champion', 'ocean', 'pharaoh', 'comet', 'opera', 'glacier',
+         'inventor', 'kingdom', 'poet', 'stadium', 'fossil', 'cathedral',
+         'goalkeeper', 'telescope', 'monarch', 'canyon', 'ballet', 'reactor',
+         'marathon', 'tribe', 'orbit']
+
+
+def word_sql(digit):
+    # one of WORDS picked by a digit of the row number written in base
+    # len(WORDS), so the four words of a question repeat only every 2.56M rows
+    return "(ARRAY[{}])[((g / {}) % {}) + 1]".format(
+        ', '.join("'{}'".format(word) for word in WORDS),
+        len(WORDS) ** digit, len(WORDS))
+
+
+def seed(questions):
+    # generated server side with generate_series, a million rows take seconds;
+    # every question holds four of WORDS and its answer two
+    db.drop_all()
+    db.create_all()
+    db.session.execute(
+        "INSERT INTO categories (id, type) VALUES " + ', '.join(
+            "({}, '{}')".format(id, type) for id, type in enumerate(CATEGORIES, 1)))
+    db.session.execute(
+        """INSERT INTO questions (id, question, answer, category, difficulty)
+           SELECT g, 'Which ' || {} || ' ' || {} || ' of the ' || {} || ' ' || {}
+                         || ' number ' || g || '?',
+                  {} || ' ' || {}, (g % {}) + 1, (g % 5) + 1
+           FROM generate_series(1, :questions) AS g""".format(
+            word_sql(0), word_sql(1), word_sql(2), word_sql(3),
+            word_sql(2), word_sql(0), len(CATEGORIES)),
+        {'questions': questions})
+    db.session.execute("SELECT setval('questions_id_seq', :questions)",
+                       {'questions': questions})
+    db.session.commit()
+    db.session.execute('ANALYZE questions')
+    db.session.commit()
+
+
+def legacy_page(page):
+    questions = Question.query.order_by(Question.id).all()
+    start = (page - 1) * flaskr.QUESTIONS_PER_PAGE
+    return questions[start:start + flaskr.QUESTIONS_PER_PAGE]
+
+
+def offset_page(page):
+    return (Question.query.order_by(Question.id)
+            .offset((page - 1) * flaskr.QUESTIONS_PER_PAGE)
+            .limit(flaskr.QUESTIONS_PER_PAGE).all())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database-url', required=True,
+                        help='scratch PostgreSQL database, its tables are recreated')
+    parser.add_argument('--questions', type=int, default=1000000)
+    parser.add_argument('--deep-page', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--no-seed', action='store_true',
+                        help='reuse the data left by a previous run')
+    parser.add_argument('--skip-legacy', action='store_true',
+                        help='leave out the load-everything pages')
+    args = parser.parse_args()
+
+    app = flaskr.create_app({'SQLALCHEMY_DATABASE_URI': args.database_url})
+    client = app.test_client()
+
+    def timed(run):
+        timings = []
+        for _ in range(args.repeat):
+            db.session.expunge_all()
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings) * 1000, min(timings) * 1000
+
+    def report(label, run):
+        median, best = timed(run)
+        print('{:<32} median {:9.2f} ms  best {:9.2f} ms'.format(label, median, best))
+
+    with app.app_context():
+        if not args.no_seed:
+            start = time.perf_counter()
+            seed(args.questions)
+            print('seeded {} questions in {:.1f} s'.format(
+                args.questions, time.perf_counter() - start))
+
+        start = time.perf_counter()
+        question_cache.anchors(flaskr.SHALLOW_PAGES * flaskr.QUESTIONS_PER_PAGE)
+        question_cache.total()
+        print('page anchors and total computed in {:.1f} ms'.format(
+            (time.perf_counter() - start) * 1000))
+
+        pages = [1, args.deep_page]
+        for page in pages:
+            print('-- page {}'.format(page))
+            if not args.skip_legacy:
+                report('before: load all, slice', lambda: legacy_page(page))
+            report('offset: LIMIT/OFFSET', lambda: offset_page(page))
+            report('after:  page_questions', lambda: flaskr.page_questions(page))
+            report('after:  GET /questions',
+                   lambda: client.get('/questions?page={}'.format(page)))
+
+        cursor = client.get('/questions?page={}'.format(args.deep_page - 1)).get_json()
+        report('keyset: GET /questions?after',
+               lambda: client.get('/questions?after={}'.format(cursor['next_cursor'])))
+
+        # the deep page with the cache emptied before every request
+        report('after:  GET deep page, no cache',
+               lambda: (question_cache.invalidate(),
+                        client.get('/questions?page={}'.format(args.deep_page))))
+
+        # the questions of one category: a range of the (category, id) index,
+        # counted by categories.question_count
+        print('-- category 1')
+        report('before: COUNT of the category',
+               lambda: Question.query.filter(Question.category == 1).count())
+        for page in (1, args.deep_page // 100):
+            report('after:  GET page {}'.format(page),
+                   lambda: client.get('/categories/1/questions?page={}'.format(page)))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+'''
+Benchmark: POST /questions/search over 1M questions.
+
+    python bench_search.py --database-url postgresql://localhost:5432/trivia_bench
+
+Seeding DROPS AND RECREATES the questions and categories tables of the
+database given with --database-url (see bench_questions.py), never point it
+at real data.
+
+"before" is the substring search the endpoint was specified with, an
+unindexed ILIKE '%term%' over the questions; "database" the full text
+search on the GIN index of migrations/0001_question_search.sql; "memory"
+the in-process QuestionIndex, whose load time and memory are reported too.
+Every term is timed on its first page and on page 10.
+'''
+
+import argparse
+import statistics
+import sys
+import time
+import resource
+
+import flaskr
+from bench_questions import seed
+from models import db, Question
+
+TERMS = ['volcano', 'river painter', 'galaxy comet opera', 'mar', 'number 123456']
+
+
+def legacy_search(term, page):
+    return (Question.query.filter(Question.question.ilike('%{}%'.format(term)))
+            .order_by(Question.id)
+            .offset((page - 1) * flaskr.QUESTIONS_PER_PAGE)
+            .limit(flaskr.QUESTIONS_PER_PAGE).all())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database-url', required=True,
+                        help='scratch PostgreSQL database, its tables are recreated')
+    parser.add_argument('--questions', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--no-seed', action='store_true',
+                        help='reuse the data left by a previous run')
+    parser.add_argument('--skip-memory', action='store_true',
+                        help='leave out the in-process index')
+    args = parser.parse_args()
+
+    app = flaskr.create_app({'SQLALCHEMY_DATABASE_URI': args.database_url,
+                             'SLOW_QUERY_MS': None})
+
+    def report(label, run):
+        timings = []
+        for _ in range(args.repeat):
+            db.session.expunge_all()
+            start = time.perf_counter()
+            result = run()
+            timings.append(time.perf_counter() - start)
+        # the ILIKE search is not counted, only its page
+        found = ('{} found'.format(result[0]) if isinstance(result, tuple)
+                 else '{} on the page'.format(len(result)))
+        print('{:<34} median {:9.2f} ms  best {:9.2f} ms  ({})'.format(
+            label, statistics.median(timings) * 1000, min(timings) * 1000, found))
+
+    with app.app_context():
+        if not args.no_seed:
+            start = time.perf_counter()
+            seed(args.questions)
+            print('seeded {} questions in {:.1f} s'.format(
+                args.questions, time.perf_counter() - start))
+
+        if not args.skip_memory:
+            # the growth of the peak resident size, in kB on Linux
+            before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            start = time.perf_counter()
+            flaskr.question_search.get()
+            elapsed = time.perf_counter() - start
+            after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            print('memory index loaded in {:.1f} s, {:.0f} MB'.format(
+                elapsed, (after - before) / 1024))
+
+        for term in TERMS:
+            for page in (1, 10):
+                print('-- {!r}, page {}'.format(term, page))
+                report('before:   ILIKE', lambda: legacy_search(term, page))
+                report('database: tsvector + GIN',
+                       lambda: flaskr.search_questions(term, page))
+                report('database: with answers',
+                       lambda: flaskr.search_questions(term, page, answers=True))
+                if not args.skip_memory:
+                    report('memory:   QuestionIndex',
+                           lambda: flaskr.search_questions(term, page, backend='memory'))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,14 +4,99 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 import random
 
-from models import setup_db, Question, Category
+from models import (setup_db, Question, Category, db, question_cache,
+                    question_sampler, database_path)
+from pool import pool_metrics
+from query_stats import QueryStats
+from quiz_sessions import session_store
+from search import QuestionSearch, tsquery
 
 QUESTIONS_PER_PAGE = 10
+# pages up to SHALLOW_PAGES are read with OFFSET, deeper pages start from the
+# cached id of every SHALLOW_PAGES * QUESTIONS_PER_PAGE th question so the
+# database never skips more than that many rows
+SHALLOW_PAGES = 100
+
+'''
+page_questions(page, after)
+    the questions of page, ordered by id; with after (the last id of the
+    previous page) a keyset page of the questions following that id
+'''
+def page_questions(page, after=None):
+  query = Question.query.order_by(Question.id)
+  if after is not None:
+    return query.filter(Question.id > after).limit(QUESTIONS_PER_PAGE).all()
+
+  skip = (page - 1) * QUESTIONS_PER_PAGE
+  if page > SHALLOW_PAGES:
+    stride = SHALLOW_PAGES * QUESTIONS_PER_PAGE
+    anchors = question_cache.anchors(stride)
+    if not anchors:
+      return []
+    index = min(skip // stride, len(anchors) - 1)
+    query = query.filter(Question.id >= anchors[index])
+    skip -= index * stride
+  return query.offset(skip).limit(QUESTIONS_PER_PAGE).all()
+
+# the in-process index of QUESTION_SEARCH = 'memory', loaded on first use
+question_search = QuestionSearch(db, Question)
+
+'''
+search_questions(term, page, answers, backend)
+    (total, [Question]) for one page of the questions holding every word of
+    term as a word prefix, the best matches first; with answers the words
+    of the answers count too, see search.py
+'''
+def search_questions(term, page=1, answers=False, backend='database'):
+  offset = (page - 1) * QUESTIONS_PER_PAGE
+  if backend == 'memory':
+    total, ids = question_search.get().search(term, answers, QUESTIONS_PER_PAGE, offset)
+    found = {question.id: question
+             for question in Question.query.filter(Question.id.in_(ids))} if ids else {}
+    return total, [found[id] for id in ids if id in found]
+
+  terms = tsquery(term, answers)
+  if terms is None:
+    return 0, []
+  # the match is answered by the GIN index on search_vector, so only
+  # matching rows are ranked; the total comes with every row, a page past
+  # the last one has no row and needs its own count
+  query = db.func.to_tsquery('simple', terms)
+  matches = Question.search_vector.op('@@')(query)
+  rows = db.session.query(
+    Question,
+    db.func.count().over().label('total')
+  ).filter(matches).order_by(
+    db.func.ts_rank(Question.search_vector, query).desc(),
+    Question.id
+  ).limit(QUESTIONS_PER_PAGE).offset(offset).all()
+  if not rows:
+    total = Question.query.filter(matches).count() if offset else 0
+    return total, []
+  return rows[0].total, [row.Question for row in rows]
 
 def create_app(test_config=None):
   # create and configure the app
   app = Flask(__name__)
-  setup_db(app)
+  if test_config:
+    app.config.update(test_config)
+  setup_db(app, app.config.get('SQLALCHEMY_DATABASE_URI', database_path))
+  # X-DB-Queries / X-DB-Time headers, slow query log and QUERY_BUDGET
+  QueryStats(app)
+  # 'database': the full text index of the questions, 'memory': search.py
+  app.config.setdefault('QUESTION_SEARCH', 'memory' if app.testing else 'database')
+  quiz_sessions = session_store(app.config)
+
+  '''
+  GET /metrics/pool
+    the connection pool metrics of this worker, see pool.py
+  '''
+  @app.route('/metrics/pool')
+  def get_pool_metrics():
+    return jsonify({
+      'success': True,
+      'pool': pool_metrics(db.engine.pool)
+    })
   
   '''
   @TODO: Set up CORS. Allow '*' for origins. Delete the sample route after completing the TODOs
@@ -22,24 +107,54 @@ def create_app(test_config=None):
   '''
 
   '''
-  @TODO: 
-  Create an endpoint to handle GET requests 
-  for all available categories.
+  GET /categories
+    the categories map, with the number of questions of every category
+    read from categories.question_count
+    EXAMPLE
+      {"success": true, "categories": {"1": "Science", ...},
+       "question_counts": {"1": 3, ...}}
   '''
+  @app.route('/categories')
+  def get_categories():
+    categories = Category.query.order_by(Category.id).all()
+    return jsonify({
+      'success': True,
+      'categories': {category.id: category.type for category in categories},
+      'question_counts': {category.id: category.question_count
+                          for category in categories}
+    })
 
 
   '''
-  @TODO: 
-  Create an endpoint to handle GET requests for questions, 
-  including pagination (every 10 questions). 
-  This endpoint should return a list of questions, 
-  number of total questions, current category, categories. 
-
-  TEST: At this point, when you start the application
-  you should see questions and categories generated,
-  ten questions per page and pagination at the bottom of the screen for three pages.
-  Clicking on the page numbers should update the questions. 
+  GET /questions?page=<page>
+    ten questions of page (1 by default) with the number of questions and
+    the categories map, both cached until a question is added or deleted
+    GET /questions?after=<id> returns the ten questions following id, as
+    given in next_cursor, for clients walking through every question
+    EXAMPLE
+      {"success": true, "questions": [...], "total_questions": 19,
+       "categories": {"1": "Science", ...}, "current_category": null,
+       "next_cursor": 12}
   '''
+  @app.route('/questions')
+  def get_questions():
+    page = request.args.get('page', 1, type=int)
+    after = request.args.get('after', None, type=int)
+    if page < 1:
+      abort(400)
+
+    questions = page_questions(page, after)
+    if not questions and (page > 1 or after is not None):
+      abort(404)
+
+    return jsonify({
+      'success': True,
+      'questions': [question.format() for question in questions],
+      'total_questions': question_cache.total(),
+      'categories': question_cache.categories(),
+      'current_category': None,
+      'next_cursor': questions[-1].id if questions else None
+    })
 
   '''
   @TODO: 
@@ -61,43 +176,179 @@ def create_app(test_config=None):
   '''
 
   '''
-  @TODO: 
-  Create a POST endpoint to get questions based on a search term. 
-  It should return any questions for whom the search term 
-  is a substring of the question. 
-
-  TEST: Search by any phrase. The questions list will update to include 
-  only question that include that string within their question. 
-  Try using the word "title" to start. 
+  POST /questions/search
+    ten questions of page (1 by default) holding every word of searchTerm
+    at the start of one of their words, the best matches first; with
+    search_answers the answers are searched too
+    EXAMPLE
+      {"searchTerm": "title", "page": 1, "search_answers": false}
+      -> {"success": true, "questions": [...], "total_questions": 2,
+          "current_category": null}
   '''
+  @app.route('/questions/search', methods=['POST'])
+  def search():
+    body = request.get_json(silent=True) or {}
+    term = body.get('searchTerm')
+    if not isinstance(term, str):
+      abort(400)
+    try:
+      page = int(body.get('page', request.args.get('page', 1)))
+    except (TypeError, ValueError):
+      abort(422)
+    if page < 1:
+      abort(400)
+
+    total, questions = search_questions(
+      term, page, bool(body.get('search_answers', False)),
+      app.config['QUESTION_SEARCH'])
+    if not questions and page > 1:
+      abort(404)
+
+    return jsonify({
+      'success': True,
+      'questions': [question.format() for question in questions],
+      'total_questions': total,
+      'current_category': None
+    })
 
   '''
-  @TODO: 
-  Create a GET endpoint to get questions based on category. 
+  GET /categories/<category_id>/questions?page=<page>
+    ten questions of the category, in id order, read from the
+    (category, id) index; total_questions is categories.question_count
+    GET /categories/<category_id>/questions?after=<id> returns the ten
+    questions following id, as given in next_cursor
+  '''
+  @app.route('/categories/<int:category_id>/questions')
+  def get_category_questions(category_id):
+    page = request.args.get('page', 1, type=int)
+    after = request.args.get('after', None, type=int)
+    if page < 1:
+      abort(400)
+    category = Category.query.get(category_id)
+    if category is None:
+      abort(404)
+
+    query = Question.query.filter(Question.category == category_id).order_by(Question.id)
+    if after is not None:
+      query = query.filter(Question.id > after)
+    else:
+      query = query.offset((page - 1) * QUESTIONS_PER_PAGE)
+    questions = query.limit(QUESTIONS_PER_PAGE).all()
+    if not questions and (page > 1 or after is not None):
+      abort(404)
+
+    return jsonify({
+      'success': True,
+      'questions': [question.format() for question in questions],
+      'total_questions': category.question_count,
+      'current_category': category.type,
+      'next_cursor': questions[-1].id if questions else None
+    })
+
 
-  TEST: In the "List" tab / main screen, clicking on one of the 
-  categories in the left column will cause only questions of that 
-  category to be shown. 
   '''
+  POST /quizzes
+    a random question of quiz_category (id 0: all categories) that is none
+    of previous_questions, drawn by models.question_sampler; question is
+    null once every question was played
+    EXAMPLE
+      {"previous_questions": [20, 21], "quiz_category": {"type": "Science", "id": 1}}
+      -> {"success": true, "question": {"id": 22, ...}}
+  '''
+  @app.route('/quizzes', methods=['POST'])
+  def play_quiz():
+    body = request.get_json(silent=True) or {}
+    previous = body.get('previous_questions', [])
+    quiz_category = body.get('quiz_category') or {}
+    if not isinstance(previous, list) or not isinstance(quiz_category, dict):
+      abort(400)
+    try:
+      previous = [int(id) for id in previous]
+      category_id = int(quiz_category.get('id', 0))
+    except (TypeError, ValueError):
+      abort(422)
 
+    question = question_sampler.sample(category_id or None, previous)
+    return jsonify({
+      'success': True,
+      'question': question.format() if question else None
+    })
 
   '''
-  @TODO: 
-  Create a POST endpoint to get questions to play the quiz. 
-  This endpoint should take category and previous question parameters 
-  and return a random questions within the given category, 
-  if provided, and that is not one of the previous questions. 
+  POST /quizzes/sessions
+    starts a quiz of quiz_category (id 0: all categories): its questions
+    are dealt and shuffled once and kept on the server, see quiz_sessions.py
+    EXAMPLE
+      {"quiz_category": {"type": "Science", "id": 1}}
+      -> {"success": true, "session_id": "4kHq...", "total_questions": 3}
 
-  TEST: In the "Play" tab, after a user selects "All" or a category,
-  one question at a time is displayed, the user is allowed to answer
-  and shown whether they were correct or not. 
+  POST /quizzes/sessions/<session_id>/next
+    the next question of the session, null once every one was played;
+    404 for an unknown or expired session
   '''
+  @app.route('/quizzes/sessions', methods=['POST'])
+  def create_quiz_session():
+    body = request.get_json(silent=True) or {}
+    quiz_category = body.get('quiz_category') or {}
+    if not isinstance(quiz_category, dict):
+      abort(400)
+    try:
+      category_id = int(quiz_category.get('id', 0))
+    except (TypeError, ValueError):
+      abort(422)
+
+    ids = question_sampler.deal(category_id or None,
+                                app.config['QUIZ_SESSION_QUESTIONS'])
+    return jsonify({
+      'success': True,
+      'session_id': quiz_sessions.create(ids),
+      'total_questions': len(ids)
+    })
+
+  @app.route('/quizzes/sessions/<session_id>/next', methods=['POST'])
+  def next_quiz_question(session_id):
+    while True:
+      try:
+        id = quiz_sessions.next(session_id)
+      except KeyError:
+        abort(404)
+      # a question deleted since the quiz started is skipped
+      question = Question.query.get(id) if id is not None else None
+      if id is None or question is not None:
+        break
+    return jsonify({
+      'success': True,
+      'question': question.format() if question else None
+    })
 
   '''
-  @TODO: 
-  Create error handlers for all expected errors 
-  including 404 and 422. 
+  error handlers
+    every error is returned as {"success": false, "error": <status>,
+    "message": <text>}
   '''
+  @app.errorhandler(400)
+  def bad_request(error):
+    return jsonify({
+      'success': False,
+      'error': 400,
+      'message': 'bad request'
+    }), 400
+
+  @app.errorhandler(404)
+  def not_found(error):
+    return jsonify({
+      'success': False,
+      'error': 404,
+      'message': 'resource not found'
+    }), 404
+
+  @app.errorhandler(422)
+  def unprocessable(error):
+    return jsonify({
+      'success': False,
+      'error': 422,
+      'message': 'unprocessable'
+    }), 422
   
   return app
 
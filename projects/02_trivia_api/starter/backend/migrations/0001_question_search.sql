@@ -0,0 +1,30 @@
+-- Full text search of the questions (search.py): a tsvector of the question
+-- (weight A) and its answer (weight B) in questions.search_vector, kept up to
+-- date by a trigger and searched through a GIN index. The index is built
+-- without blocking writes:
+--
+--   psql trivia < migrations/0001_question_search.sql
+
+ALTER TABLE questions ADD COLUMN IF NOT EXISTS search_vector tsvector;
+
+CREATE OR REPLACE FUNCTION questions_search_vector() RETURNS trigger AS $$
+BEGIN
+  NEW.search_vector :=
+    setweight(to_tsvector('english', coalesce(NEW.question, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(NEW.answer, '')), 'B');
+  RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS questions_search_vector ON questions;
+CREATE TRIGGER questions_search_vector
+BEFORE INSERT OR UPDATE OF question, answer ON questions
+FOR EACH ROW EXECUTE PROCEDURE questions_search_vector();
+
+-- the trigger fills search_vector of the updated rows
+UPDATE questions SET question = question WHERE search_vector IS NULL;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_questions_search ON questions
+USING gin (search_vector);
+
+ANALYZE questions;
@@ -0,0 +1,94 @@
+-- questions.category as an integer foreign key into categories, an index of
+-- (category, id) for the questions of a category page by page, and
+-- categories.question_count kept by statement triggers (see models.py).
+--
+--   psql trivia < migrations/0002_question_category.sql
+--
+-- A database restored from trivia.psql has the integer column and its
+-- foreign key already; one created by db.create_all() before this change
+-- holds the category ids as text, which are converted. Text that is no
+-- category id becomes NULL.
+
+DO $$
+BEGIN
+  IF (SELECT data_type FROM information_schema.columns
+      WHERE table_name = 'questions' AND column_name = 'category') <> 'integer' THEN
+    ALTER TABLE questions ALTER COLUMN category TYPE integer
+    USING CASE WHEN category ~ '^\s*[0-9]{1,9}\s*$' THEN trim(category)::integer END;
+  END IF;
+END
+$$;
+
+UPDATE questions SET category = NULL
+WHERE category IS NOT NULL AND category NOT IN (SELECT id FROM categories);
+
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM pg_constraint
+                 WHERE conrelid = 'questions'::regclass AND contype = 'f') THEN
+    ALTER TABLE questions ADD CONSTRAINT category FOREIGN KEY (category)
+    REFERENCES categories (id) ON UPDATE CASCADE ON DELETE SET NULL;
+  END IF;
+END
+$$;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_questions_category_id
+ON questions (category, id);
+
+ALTER TABLE categories ADD COLUMN IF NOT EXISTS question_count integer NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION categories_question_count() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    UPDATE categories SET question_count = question_count + added.count
+    FROM (SELECT category, count(*) AS count FROM new_questions
+          WHERE category IS NOT NULL GROUP BY category) added
+    WHERE categories.id = added.category;
+  ELSIF TG_OP = 'DELETE' THEN
+    UPDATE categories SET question_count = question_count - removed.count
+    FROM (SELECT category, count(*) AS count FROM old_questions
+          WHERE category IS NOT NULL GROUP BY category) removed
+    WHERE categories.id = removed.category;
+  ELSE
+    -- only the categories questions moved out of or into
+    UPDATE categories SET question_count = question_count + moved.count
+    FROM (SELECT category, sum(change) AS count
+          FROM (SELECT category, 1 AS change FROM new_questions
+                UNION ALL
+                SELECT category, -1 AS change FROM old_questions) changes
+          WHERE category IS NOT NULL GROUP BY category
+          HAVING sum(change) <> 0) moved
+    WHERE categories.id = moved.category;
+  END IF;
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+-- the triggers and the first count in one transaction, with the questions
+-- locked against writes, so no question is counted twice or missed
+BEGIN;
+LOCK TABLE questions IN SHARE ROW EXCLUSIVE MODE;
+
+DROP TRIGGER IF EXISTS questions_count_insert ON questions;
+CREATE TRIGGER questions_count_insert AFTER INSERT ON questions
+REFERENCING NEW TABLE AS new_questions
+FOR EACH STATEMENT EXECUTE PROCEDURE categories_question_count();
+
+DROP TRIGGER IF EXISTS questions_count_update ON questions;
+CREATE TRIGGER questions_count_update AFTER UPDATE ON questions
+REFERENCING OLD TABLE AS old_questions NEW TABLE AS new_questions
+FOR EACH STATEMENT EXECUTE PROCEDURE categories_question_count();
+
+DROP TRIGGER IF EXISTS questions_count_delete ON questions;
+CREATE TRIGGER questions_count_delete AFTER DELETE ON questions
+REFERENCING OLD TABLE AS old_questions
+FOR EACH STATEMENT EXECUTE PROCEDURE categories_question_count();
+
+UPDATE categories SET question_count = counted.count
+FROM (SELECT categories.id, count(questions.id) AS count
+      FROM categories LEFT JOIN questions ON questions.category = categories.id
+      GROUP BY categories.id) counted
+WHERE categories.id = counted.id;
+COMMIT;
+
+ANALYZE questions;
@@ -0,0 +1,22 @@
+-- questions.search_vector split into words like search.py: the runs of
+-- letters and digits, lowercased, neither stemmed nor dropped as stop words
+-- (the 'simple' configuration), so the database and the in-process search
+-- find the same questions. The vectors of every question are rebuilt:
+--
+--   psql trivia < migrations/0003_question_search_words.sql
+
+CREATE OR REPLACE FUNCTION questions_search_vector() RETURNS trigger AS $$
+BEGIN
+  NEW.search_vector :=
+    setweight(to_tsvector('simple', regexp_replace(coalesce(NEW.question, ''),
+                                                   '[^[:alnum:]]+', ' ', 'g')), 'A') ||
+    setweight(to_tsvector('simple', regexp_replace(coalesce(NEW.answer, ''),
+                                                   '[^[:alnum:]]+', ' ', 'g')), 'B');
+  RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+-- the trigger rebuilds search_vector of the updated rows
+UPDATE questions SET question = question;
+
+ANALYZE questions;
@@ -1,13 +1,239 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+import random
+import threading
+import time
+from sqlalchemy import Column, String, Integer, DDL, create_engine, event
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from flask_sqlalchemy import SQLAlchemy
 import json
 
+from pool import engine_options
+from query_stats import timed
+
 database_name = "trivia"
 database_path = "postgres://{}/{}".format('localhost:5432', database_name)
 
 db = SQLAlchemy()
 
+'''
+QuestionCache
+the values GET /questions needs on every page but that change only with
+the questions: their total number, the categories map and the ids starting
+every stride-th question (page anchors), computed on first use and reset by
+Question.insert() and Question.delete()
+
+    !!NOTE the values live in this process; with several workers a write in
+    one of them is seen by the others once their values are older than
+    max_age seconds
+    EXAMPLE
+        question_cache.total()         -> 19
+        question_cache.categories()    -> {1: 'Science', 2: 'Art', ...}
+        question_cache.anchors(1000)   -> [2, 1457, 2501, ...]
+'''
+class QuestionCache:
+  def __init__(self, max_age=60):
+    self.max_age = max_age
+    self._values = {}
+    self._generation = 0
+    self._lock = threading.Lock()
+
+  def _get(self, key, compute):
+    entry = self._values.get(key)
+    if entry is None or entry[0] <= time.monotonic():
+      generation = self._generation
+      value = compute()
+      with self._lock:
+        # a write committed while computing makes the value stale already
+        if generation == self._generation:
+          self._values[key] = (time.monotonic() + self.max_age, value)
+      return value
+    return entry[1]
+
+  def total(self):
+    return self._get(('total',), lambda: Question.query.count())
+
+  def categories(self):
+    return self._get(('categories',), lambda: {
+      category.id: category.type
+      for category in Category.query.order_by(Category.id)})
+
+  def anchors(self, stride):
+    # the id of the 1st, (stride + 1)th, (2 * stride + 1)th... question
+    # by id, from one pass over the primary key index
+    def compute():
+      numbered = db.session.query(
+        Question.id,
+        db.func.row_number().over(order_by=Question.id).label('position')
+      ).subquery()
+      return [id for id, in db.session.query(numbered.c.id).filter(
+        (numbered.c.position - 1) % stride == 0).order_by(numbered.c.id)]
+    return self._get(('anchors', stride), compute)
+
+  def invalidate(self, anchors=True):
+    # new questions take the next ids, after every anchor: only deletes
+    # move the questions starting each stride
+    with self._lock:
+      self._generation += 1
+      for key in list(self._values):
+        if anchors or key[0] != 'anchors':
+          del self._values[key]
+
+question_cache = QuestionCache()
+
+'''
+Deck
+the ids of the questions of one category, in a list for uniform picks and
+a dict of their positions in it for O(1) adds, removes and swaps
+'''
+class Deck:
+  def __init__(self, ids=()):
+    self.ids = list(ids)
+    self.positions = dict(zip(self.ids, range(len(self.ids))))
+
+  def __len__(self):
+    return len(self.ids)
+
+  def add(self, id):
+    if id not in self.positions:
+      self.positions[id] = len(self.ids)
+      self.ids.append(id)
+
+  def discard(self, id):
+    # the last id takes the place of the removed one
+    position = self.positions.pop(id, None)
+    if position is not None:
+      last = self.ids.pop()
+      if last != id:
+        self.ids[position] = last
+        self.positions[last] = position
+
+  def _swap(self, i, j):
+    ids = self.ids
+    ids[i], ids[j] = ids[j], ids[i]
+    self.positions[ids[i]] = i
+    self.positions[ids[j]] = j
+
+  def pick(self, excluded, rng):
+    # the excluded ids of the deck are swapped to its tail and the draw is
+    # an index into the rest: O(len(excluded)) however much of the deck
+    # is excluded; excluded is a set, so each id moves once
+    end = len(self.ids)
+    for id in excluded:
+      position = self.positions.get(id)
+      if position is not None:
+        end -= 1
+        self._swap(position, end)
+    return self.ids[rng.randrange(end)] if end else None
+
+'''
+QuestionSampler
+a random question of a category, or of all of them, that is none of the
+previous questions, without loading the category or ORDER BY random()
+
+    the ids are loaded on first use into one Deck per category and one of
+    all questions; Question.insert(), update() and delete() keep the decks
+    of this process up to date, questions added by other workers are read
+    every max_age seconds (the ids past the largest one loaded) and the ids
+    of questions deleted or moved by other workers are dropped when drawn
+    EXAMPLE
+        question_sampler.sample(1, [20, 21])    -> <Question 22>
+        question_sampler.sample(None, all_ids)  -> None
+        question_sampler.deal(1, 3)             -> [22, 5, 21]
+'''
+class QuestionSampler:
+  def __init__(self, max_age=60, rng=None):
+    self.max_age = max_age
+    self.rng = rng or random.Random()
+    self._decks = None
+    self._last_id = 0
+    self._refreshed = 0
+    self._lock = threading.Lock()
+
+  def _read(self, after):
+    # a million rows: straight from the psycopg2 cursor, the ORM is 8x slower;
+    # the cursor events never see it, so it is recorded in the query stats
+    statement = 'SELECT id, category FROM questions WHERE id > %s ORDER BY id'
+    cursor = db.session.connection().connection.cursor()
+    try:
+      with timed(statement):
+        cursor.execute(statement, (after,))
+        rows = cursor.fetchall()
+    finally:
+      cursor.close()
+    return rows
+
+  def _refresh(self):
+    if self._decks is None:
+      rows = self._read(0)
+      by_category = {}
+      for id, category in rows:
+        by_category.setdefault(category, []).append(id)
+      decks = {category: Deck(ids) for category, ids in by_category.items()}
+      decks[None] = Deck(id for id, category in rows)
+      with self._lock:
+        if self._decks is None:
+          self._decks = decks
+          self._last_id = rows[-1][0] if rows else 0
+          self._refreshed = time.monotonic()
+    elif self._refreshed + self.max_age <= time.monotonic():
+      rows = self._read(self._last_id)
+      with self._lock:
+        for id, category in rows:
+          self._add(id, category)
+        if rows:
+          self._last_id = max(self._last_id, rows[-1][0])
+        self._refreshed = time.monotonic()
+
+  def _add(self, id, category):
+    self._decks[None].add(id)
+    deck = self._decks.get(category)
+    if deck is None:
+      deck = self._decks[category] = Deck()
+    deck.add(id)
+
+  def _discard(self, id):
+    for deck in self._decks.values():
+      deck.discard(id)
+
+  def add(self, question):
+    if self._decks is not None:
+      with self._lock:
+        self._discard(question.id)
+        self._add(question.id, question.category)
+
+  def discard(self, id):
+    if self._decks is not None:
+      with self._lock:
+        self._discard(id)
+
+  def deal(self, category, count):
+    # count distinct ids of category in random order, O(count)
+    self._refresh()
+    with self._lock:
+      deck = self._decks.get(category)
+      if deck is None:
+        return []
+      return self.rng.sample(deck.ids, min(count, len(deck)))
+
+  def sample(self, category, previous):
+    self._refresh()
+    excluded = set(previous)
+    while True:
+      with self._lock:
+        deck = self._decks.get(category)
+        id = deck.pick(excluded, self.rng) if deck is not None else None
+      if id is None:
+        return None
+      question = Question.query.get(id)
+      if question is None:
+        self.discard(id)
+      elif category is not None and question.category != category:
+        self.add(question)
+      else:
+        return question
+
+question_sampler = QuestionSampler()
+
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
@@ -15,6 +241,7 @@ setup_db(app)
 def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options()
     db.app = app
     db.init_app(app)
     db.create_all()
@@ -29,8 +256,18 @@ class Question(db.Model):
   id = Column(Integer, primary_key=True)
   question = Column(String)
   answer = Column(String)
-  category = Column(String)
+  category = Column(Integer, db.ForeignKey(
+    'categories.id', onupdate='CASCADE', ondelete='SET NULL'))
   difficulty = Column(Integer)
+  # the words of the question (weight A) and of the answer (weight B) for
+  # full text search, set by the questions_search_vector trigger
+  search_vector = db.deferred(Column(TSVECTOR))
+
+  __table_args__ = (
+    db.Index('ix_questions_search', 'search_vector', postgresql_using='gin'),
+    # the questions of a category in id order, a range of this index
+    db.Index('ix_questions_category_id', 'category', 'id'),
+  )
 
   def __init__(self, question, answer, category, difficulty):
     self.question = question
@@ -41,13 +278,19 @@ class Question(db.Model):
   def insert(self):
     db.session.add(self)
     db.session.commit()
+    question_cache.invalidate(anchors=False)
+    question_sampler.add(self)
   
   def update(self):
     db.session.commit()
+    question_sampler.add(self)
 
   def delete(self):
+    id = self.id
     db.session.delete(self)
     db.session.commit()
+    question_cache.invalidate()
+    question_sampler.discard(id)
 
   def format(self):
     return {
@@ -58,6 +301,29 @@ class Question(db.Model):
       'difficulty': self.difficulty
     }
 
+'''
+the trigger keeping questions.search_vector up to date, created with the
+table (migrations/0001_question_search.sql and 0003 for existing
+databases); the text is split into words like search.words() before the
+'simple' configuration lowercases them, without stemming or stop words
+'''
+event.listen(Question.__table__, 'after_create', DDL('''
+CREATE OR REPLACE FUNCTION questions_search_vector() RETURNS trigger AS $$
+BEGIN
+  NEW.search_vector :=
+    setweight(to_tsvector('simple', regexp_replace(coalesce(NEW.question, ''),
+                                                   '[^[:alnum:]]+', ' ', 'g')), 'A') ||
+    setweight(to_tsvector('simple', regexp_replace(coalesce(NEW.answer, ''),
+                                                   '[^[:alnum:]]+', ' ', 'g')), 'B');
+  RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER questions_search_vector
+BEFORE INSERT OR UPDATE OF question, answer ON questions
+FOR EACH ROW EXECUTE PROCEDURE questions_search_vector();
+''').execute_if(dialect='postgresql'))
+
 '''
 Category
 
@@ -67,6 +333,9 @@ class Category(db.Model):
 
   id = Column(Integer, primary_key=True)
   type = Column(String)
+  # the questions of the category, kept by the triggers of
+  # categories_question_count: read instead of a COUNT of the questions
+  question_count = Column(Integer, nullable=False, server_default='0')
 
   def __init__(self, type):
     self.type = type
@@ -74,5 +343,53 @@ class Category(db.Model):
   def format(self):
     return {
       'id': self.id,
-      'type': self.type
-    }
\ No newline at end of file
+      'type': self.type,
+      'question_count': self.question_count
+    }
+
+'''
+the statement triggers keeping categories.question_count up to date, from
+the questions each INSERT, UPDATE or DELETE of questions wrote, created
+with the questions table (migrations/0002_question_category.sql for
+existing databases)
+'''
+event.listen(Question.__table__, 'after_create', DDL('''
+CREATE OR REPLACE FUNCTION categories_question_count() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    UPDATE categories SET question_count = question_count + added.count
+    FROM (SELECT category, count(*) AS count FROM new_questions
+          WHERE category IS NOT NULL GROUP BY category) added
+    WHERE categories.id = added.category;
+  ELSIF TG_OP = 'DELETE' THEN
+    UPDATE categories SET question_count = question_count - removed.count
+    FROM (SELECT category, count(*) AS count FROM old_questions
+          WHERE category IS NOT NULL GROUP BY category) removed
+    WHERE categories.id = removed.category;
+  ELSE
+    -- only the categories questions moved out of or into
+    UPDATE categories SET question_count = question_count + moved.count
+    FROM (SELECT category, sum(change) AS count
+          FROM (SELECT category, 1 AS change FROM new_questions
+                UNION ALL
+                SELECT category, -1 AS change FROM old_questions) changes
+          WHERE category IS NOT NULL GROUP BY category
+          HAVING sum(change) <> 0) moved
+    WHERE categories.id = moved.category;
+  END IF;
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER questions_count_insert AFTER INSERT ON questions
+REFERENCING NEW TABLE AS new_questions
+FOR EACH STATEMENT EXECUTE PROCEDURE categories_question_count();
+
+CREATE TRIGGER questions_count_update AFTER UPDATE ON questions
+REFERENCING OLD TABLE AS old_questions NEW TABLE AS new_questions
+FOR EACH STATEMENT EXECUTE PROCEDURE categories_question_count();
+
+CREATE TRIGGER questions_count_delete AFTER DELETE ON questions
+REFERENCING OLD TABLE AS old_questions
+FOR EACH STATEMENT EXECUTE PROCEDURE categories_question_count();
+''').execute_if(dialect='postgresql'))
\ No newline at end of file
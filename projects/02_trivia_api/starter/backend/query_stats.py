@@ -0,0 +1,159 @@
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+'''
+Per request database statistics of the trivia API, configured by
+create_app(test_config).
+
+    QueryStats(app)
+        counts the statements every request runs and the time spent in them,
+        returned in the X-DB-Queries and X-DB-Time (milliseconds) response
+        headers, and logs the statements slower than SLOW_QUERY_MS
+
+    app config
+        SLOW_QUERY_MS       log statements slower than this (100), None: off
+        QUERY_BUDGET        most statements a request may run, None: no limit
+        QUERY_BUDGETS       budgets by endpoint name, over QUERY_BUDGET
+        QUERY_BUDGET_RAISE  raise QueryBudgetExceeded past the budget instead
+                            of logging a warning; by default when
+                            app.testing is set
+    EXAMPLE
+        app = create_app({'TESTING': True, 'QUERY_BUDGETS': {'get_categories': 1}})
+        client.get('/categories')   -> raises QueryBudgetExceeded past 1 query
+
+    timed(statement)
+        records a statement run on a raw DBAPI cursor, which the SQLAlchemy
+        cursor events never see
+'''
+
+# the statistics of the request running in this context
+current = ContextVar('query_stats', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class RequestStats:
+    def __init__(self, route):
+        self.route = route
+        self.queries = 0
+        self.seconds = 0.0
+
+
+'''
+the start time of a statement is kept on its execution context, where it goes
+away with the statement when it fails and after_cursor_execute never runs; a
+stack, as the column defaults of a statement may run inside its context.
+Statements without a context, run while a dialect initializes, are not timed
+'''
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        vars(context).setdefault('_query_stats_start', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is None:
+        return
+    record(statement, time.perf_counter() - context._query_stats_start.pop())
+
+
+'''
+record(statement, seconds)
+    counts a statement in the request running in this context, and logs it
+    when slower than SLOW_QUERY_MS of the app in context; the engine is
+    shared by every app using db, so the settings are looked up per statement
+'''
+def record(statement, seconds):
+    stats = current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.seconds += seconds
+    if not has_app_context() or 'query_stats' not in current_app.extensions:
+        return
+    threshold = current_app.config['SLOW_QUERY_MS']
+    if threshold is not None and seconds * 1000 >= threshold:
+        current_app.logger.warning(
+            'Slow query, %.1f ms on %s: %s', seconds * 1000,
+            stats.route if stats else '(no request)',
+            re.sub(r'\s+', ' ', statement).strip())
+
+
+'''
+timed(statement)
+    records the statement run in the block, when it does not raise
+    EXAMPLE
+        with timed(sql):
+            cursor.execute(sql, parameters)
+'''
+@contextmanager
+def timed(statement):
+    start = time.perf_counter()
+    yield
+    record(statement, time.perf_counter() - start)
+
+
+'''
+the listeners are registered once, on every engine, so they also cover the
+engines Flask-SQLAlchemy creates later
+'''
+_listening = []
+
+
+def listen():
+    if not _listening:
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+        _listening.append(True)
+
+
+class QueryStats:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SLOW_QUERY_MS', 100)
+        app.config.setdefault('QUERY_BUDGET', None)
+        app.config.setdefault('QUERY_BUDGETS', {})
+        app.config.setdefault('QUERY_BUDGET_RAISE', None)
+        app.extensions['query_stats'] = self
+        listen()
+        app.before_request(self.start)
+        app.after_request(self.finish)
+        app.teardown_request(self.stop)
+
+    def start(self):
+        route = '{} {}'.format(request.method,
+                               request.url_rule.rule if request.url_rule else request.path)
+        stats = RequestStats(route)
+        g.query_stats_token = current.set(stats)
+
+    def finish(self, response):
+        stats = current.get()
+        if stats is None:
+            return response
+        response.headers['X-DB-Queries'] = str(stats.queries)
+        response.headers['X-DB-Time'] = '{:.2f}'.format(stats.seconds * 1000)
+
+        config = current_app.config
+        budget = config['QUERY_BUDGETS'].get(request.endpoint, config['QUERY_BUDGET'])
+        if budget is not None and stats.queries > budget:
+            message = '{} ran {} queries, over its budget of {}'.format(
+                stats.route, stats.queries, budget)
+            strict = config['QUERY_BUDGET_RAISE']
+            if strict or (strict is None and current_app.testing):
+                raise QueryBudgetExceeded(message)
+            current_app.logger.warning(message)
+        return response
+
+    def stop(self, exception=None):
+        token = g.pop('query_stats_token', None) if has_request_context() else None
+        if token is not None:
+            current.reset(token)
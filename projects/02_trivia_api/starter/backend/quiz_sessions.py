@@ -0,0 +1,184 @@
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+'''
+Quiz sessions: the questions of a quiz, dealt and shuffled once when it
+starts, and how many of them were played, so the client only sends the
+session id to get the next question instead of every previous question.
+
+    store.create(ids)       -> a new session id
+    store.next(session_id)  -> the next question id of the session, None
+                               once they were all played; raises KeyError
+                               for an unknown or expired session
+
+    MemoryStore     the sessions of this process, at most max_sessions of
+                    them, each dropped ttl seconds after it was last used
+    SQLiteStore     the sessions in a SQLite file, shared by the workers of
+                    one host, each dropped ttl seconds after it was last used
+
+    app config
+        QUIZ_SESSIONS           'memory' (default) or 'sqlite'
+        QUIZ_SESSIONS_PATH      the SQLite file ('quiz_sessions.db')
+        QUIZ_SESSIONS_TTL       seconds a session is kept unused (3600)
+        QUIZ_SESSIONS_MAX       sessions kept in memory (10000)
+        QUIZ_SESSION_QUESTIONS  questions dealt to a session (100)
+    EXAMPLE
+        store = session_store(app.config)
+        session_id = store.create([22, 5, 21])
+        store.next(session_id)  -> 22
+'''
+
+DEFAULTS = {
+    'QUIZ_SESSIONS': 'memory',
+    'QUIZ_SESSIONS_PATH': 'quiz_sessions.db',
+    'QUIZ_SESSIONS_TTL': 3600,
+    'QUIZ_SESSIONS_MAX': 10000,
+    'QUIZ_SESSION_QUESTIONS': 100
+}
+
+# question ids are stored as 64 bit integers, 8 bytes each
+ID_TYPE = 'q'
+ID_SIZE = array(ID_TYPE).itemsize
+
+
+def new_session_id():
+    return secrets.token_urlsafe(16)
+
+
+class MemoryStore:
+    def __init__(self, max_sessions=10000, ttl=3600):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        # session id -> [expires, ids, position], the least recently used first
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        # the ttl is the same for every session, so the least recently used
+        # session is the first to expire
+        sessions = self._sessions
+        while sessions and (len(sessions) > self.max_sessions
+                            or next(iter(sessions.values()))[0] <= now):
+            sessions.popitem(last=False)
+
+    def create(self, ids):
+        session_id = new_session_id()
+        now = time.monotonic()
+        with self._lock:
+            self._sessions[session_id] = [now + self.ttl, array(ID_TYPE, ids), 0]
+            self._evict(now)
+        return session_id
+
+    def next(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session[0] <= now:
+                raise KeyError(session_id)
+            session[0] = now + self.ttl
+            self._sessions.move_to_end(session_id)
+            ids, position = session[1], session[2]
+            if position >= len(ids):
+                return None
+            session[2] = position + 1
+            return ids[position]
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+'''
+SQLiteStore
+one row per session holding its ids as a blob; next() reads the 8 bytes of
+the next id with substr() and moves the position in one IMMEDIATE
+transaction, so two workers never deal the same position twice
+
+    !!NOTE a file on local disk: workers on other hosts do not see it
+'''
+class SQLiteStore:
+    SCHEMA = [
+        '''CREATE TABLE IF NOT EXISTS quiz_sessions (
+               id TEXT PRIMARY KEY,
+               ids BLOB NOT NULL,
+               position INTEGER NOT NULL DEFAULT 0,
+               expires REAL NOT NULL)''',
+        'CREATE INDEX IF NOT EXISTS ix_quiz_sessions_expires ON quiz_sessions (expires)'
+    ]
+
+    def __init__(self, path, ttl=3600):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        connection = self._connection()
+        for statement in self.SCHEMA:
+            connection.execute(statement)
+
+    def _connection(self):
+        # sqlite3 connections belong to the thread that opened them
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or getattr(self._local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def create(self, ids):
+        session_id = new_session_id()
+        # wall clock time, shared by every worker
+        now = time.time()
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('DELETE FROM quiz_sessions WHERE expires <= ?', (now,))
+            connection.execute(
+                'INSERT INTO quiz_sessions (id, ids, expires) VALUES (?, ?, ?)',
+                (session_id, array(ID_TYPE, ids).tobytes(), now + self.ttl))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return session_id
+
+    def next(self, session_id):
+        now = time.time()
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                '''SELECT substr(ids, position * ? + 1, ?), position
+                   FROM quiz_sessions WHERE id = ? AND expires > ?''',
+                (ID_SIZE, ID_SIZE, session_id, now)).fetchone()
+            if row is None:
+                raise KeyError(session_id)
+            id_bytes, position = row
+            connection.execute(
+                'UPDATE quiz_sessions SET position = ?, expires = ? WHERE id = ?',
+                (position + 1 if id_bytes else position, now + self.ttl, session_id))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return array(ID_TYPE, id_bytes)[0] if id_bytes else None
+
+    def __len__(self):
+        return self._connection().execute(
+            'SELECT count(*) FROM quiz_sessions WHERE expires > ?',
+            (time.time(),)).fetchone()[0]
+
+
+def session_store(config):
+    for name, value in DEFAULTS.items():
+        config.setdefault(name, value)
+    if config['QUIZ_SESSIONS'] == 'sqlite':
+        return SQLiteStore(config['QUIZ_SESSIONS_PATH'], config['QUIZ_SESSIONS_TTL'])
+    if config['QUIZ_SESSIONS'] == 'memory':
+        return MemoryStore(config['QUIZ_SESSIONS_MAX'], config['QUIZ_SESSIONS_TTL'])
+    raise ValueError('QUIZ_SESSIONS must be memory or sqlite, not {!r}'.format(
+        config['QUIZ_SESSIONS']))
@@ -0,0 +1,227 @@
+import bisect
+import heapq
+import re
+import sys
+import threading
+from collections import defaultdict
+
+from sqlalchemy import event, inspect
+
+'''
+Question search.
+
+The database backend (QUESTION_SEARCH = 'database') matches the words of
+the search term, each as a prefix, against questions.search_vector, the
+tsvector of the question and its answer searched through the GIN index of
+migrations/0001_question_search.sql, and ranks the questions with
+ts_rank(). QuestionIndex answers the same searches in process
+(QUESTION_SEARCH = 'memory'), for the tests and for databases without the
+index.
+
+    words are the runs of letters and digits, lowercased, neither stemmed
+    nor dropped as stop words: the trigger of models.py splits the text
+    with the same pattern before to_tsvector('simple'), so both backends
+    find the same questions
+
+    words in the question weigh A and words in the answer B, so one index
+    serves both searches: a search of the questions only asks for A words
+    EXAMPLE
+        tsquery('Whose autobiography', answers=False)
+            -> 'whose:*A & autobiography:*A'
+'''
+
+WORD = re.compile(r'[^\W_]+')
+
+# the weight of a word of the answer against a word of the question, as
+# ts_rank weighs B against A
+ANSWER_WEIGHT = 0.4
+
+
+def words(text):
+    # interned: a million questions share a few thousand distinct words
+    return [sys.intern(word) for word in WORD.findall(text.lower())] if text else []
+
+
+def tsquery(term, answers=False):
+    # the words of term for to_tsquery(), each a prefix; None without words
+    weight = '' if answers else 'A'
+    terms = ['{}:*{}'.format(word, weight) for word in words(term)]
+    return ' & '.join(terms) or None
+
+
+'''
+QuestionIndex
+an inverted index of the words of every question and answer: each word
+points at the ids of the questions holding it, and each question keeps how
+many times every one of its words appears in the question and in the
+answer. The words are also kept sorted, so a word of the search term finds
+every word it is a prefix of by bisection.
+
+    search(term, answers, limit, offset) -> (total, [id, ...])
+        the questions holding a word starting with every word of term,
+        the most occurrences first, the lowest ids first among equals
+
+    only the questions of the rarest word of term are scored, against
+    their own words, so a common word costs nothing next to a rare one
+'''
+class QuestionIndex:
+    def __init__(self):
+        self.postings = defaultdict(set)
+        self.vocabulary = []
+        self.documents = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, id, question, answer):
+        counts = defaultdict(lambda: [0, 0])
+        for word in words(question):
+            counts[word][0] += 1
+        for word in words(answer):
+            counts[word][1] += 1
+        document = {word: tuple(count) for word, count in counts.items()}
+        with self.lock:
+            self._remove(id)
+            for word in document:
+                postings = self.postings[word]
+                if not postings:
+                    bisect.insort(self.vocabulary, word)
+                postings.add(id)
+            self.documents[id] = document
+
+    def remove(self, id):
+        with self.lock:
+            self._remove(id)
+
+    def _remove(self, id):
+        for word in self.documents.pop(id, ()):
+            postings = self.postings[word]
+            postings.discard(id)
+            if not postings:
+                del self.postings[word]
+                del self.vocabulary[bisect.bisect_left(self.vocabulary, word)]
+
+    def _expand(self, prefix):
+        # the words starting with prefix
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        end = bisect.bisect_left(self.vocabulary, prefix + '\U0010ffff', start)
+        return self.vocabulary[start:end]
+
+    def search(self, term, answers=False, limit=None, offset=0):
+        prefixes = words(term)
+        if not prefixes:
+            return 0, []
+        answer_weight = ANSWER_WEIGHT if answers else 0
+        scores = {}
+        with self.lock:
+            expanded = [self._expand(prefix) for prefix in prefixes]
+            rarest = min(expanded, key=lambda found: sum(
+                len(self.postings[word]) for word in found))
+            candidates = set().union(*(self.postings[word] for word in rarest))
+            for id in candidates:
+                document = self.documents[id]
+                total = 0
+                for prefix, found in zip(prefixes, expanded):
+                    # look the few words of a long prefix up, or test the
+                    # few words of the question against a short one
+                    if len(found) <= len(document):
+                        counts = [document[word] for word in found if word in document]
+                    else:
+                        counts = [count for word, count in document.items()
+                                  if word.startswith(prefix)]
+                    score = sum(in_question + answer_weight * in_answer
+                                for in_question, in_answer in counts)
+                    if not score:
+                        break
+                    total += score
+                else:
+                    scores[id] = total
+
+        def rank(id):
+            return (-scores[id], id)
+
+        if limit is None:
+            return len(scores), sorted(scores, key=rank)[offset:]
+        return len(scores), heapq.nsmallest(offset + limit, scores, key=rank)[offset:]
+
+
+'''
+watch_session(session, models, on_commit, attributes)
+    calls on_commit(changes) after each commit of session that inserted,
+    updated or deleted instances of models; changes lists (model, id,
+    values) in flush order, values mapping each of attributes to its value
+    when flushed, None for a deleted instance
+
+    with attributes, updates leaving them all unchanged are left out; the
+    values are read at flush time, as the commit expires the instances, and
+    changes rolled back never reach on_commit
+'''
+def watch_session(session, models, on_commit, attributes=()):
+    models = tuple(models)
+    key = object()
+
+    def snapshot(instance):
+        return {name: getattr(instance, name) for name in attributes}
+
+    def collect(session, flush_context):
+        changes = session.info.setdefault(key, [])
+        for instance in session.new:
+            if isinstance(instance, models):
+                changes.append((type(instance), instance.id, snapshot(instance)))
+        for instance in session.dirty:
+            if isinstance(instance, models) and (not attributes or any(
+                    inspect(instance).attrs[name].history.has_changes()
+                    for name in attributes)):
+                changes.append((type(instance), instance.id, snapshot(instance)))
+        for instance in session.deleted:
+            if isinstance(instance, models):
+                changes.append((type(instance), instance.id, None))
+
+    def apply(session):
+        changes = session.info.pop(key, None)
+        if changes:
+            on_commit(changes)
+
+    def discard(session):
+        session.info.pop(key, None)
+
+    event.listen(session, 'after_flush', collect)
+    event.listen(session, 'after_commit', apply)
+    event.listen(session, 'after_rollback', discard)
+
+
+'''
+QuestionSearch
+the QuestionIndex of the questions, loaded from the database on first use;
+committed inserts, edits and deletes are applied to it, changes rolled back
+never reach it
+'''
+class QuestionSearch:
+    def __init__(self, db, model):
+        self.db = db
+        self.model = model
+        self.index = None
+        self.lock = threading.Lock()
+        watch_session(db.session, (model,), self._apply, ('question', 'answer'))
+
+    def get(self):
+        if self.index is None:
+            with self.lock:
+                if self.index is None:
+                    index = QuestionIndex()
+                    model = self.model
+                    query = self.db.session.query(model.id, model.question, model.answer)
+                    for id, question, answer in query.yield_per(10000):
+                        index.add(id, question, answer)
+                    self.index = index
+        return self.index
+
+    def _apply(self, changes):
+        if self.index is None:
+            return
+        for model, id, values in changes:
+            if values is None:
+                self.index.remove(id)
+            else:
+                self.index.add(id, values['question'], values['answer'])
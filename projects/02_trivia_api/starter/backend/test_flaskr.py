@@ -1,9 +1,10 @@
 import os
+import re
 import unittest
 import json
 from flask_sqlalchemy import SQLAlchemy
 
-from flaskr import create_app
+from flaskr import create_app, search_questions
 from models import setup_db, Question, Category
 
 
@@ -12,7 +13,8 @@ class TriviaTestCase(unittest.TestCase):
 
     def setUp(self):
         """Define test variables and initialize app."""
-        self.app = create_app()
+        # a route running more than QUERY_BUDGET statements fails its test
+        self.app = create_app({'TESTING': True, 'QUERY_BUDGET': 5})
         self.client = self.app.test_client
         self.database_name = "trivia_test"
         self.database_path = "postgres://{}/{}".format('localhost:5432', self.database_name)
@@ -34,6 +36,211 @@ class TriviaTestCase(unittest.TestCase):
     Write at least one test for each test for successful operation and for expected errors.
     """
 
+    def test_get_paginated_questions(self):
+        res = self.client().get('/questions')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['total_questions'])
+        self.assertTrue(len(data['questions']))
+        self.assertTrue(len(data['categories']))
+
+    def test_get_questions_after_cursor(self):
+        first = json.loads(self.client().get('/questions').data)
+        res = self.client().get('/questions?after={}'.format(first['next_cursor']))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(all(question['id'] > first['next_cursor']
+                            for question in data['questions']))
+
+    def test_404_sent_requesting_beyond_valid_page(self):
+        res = self.client().get('/questions?page=1000')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'resource not found')
+
+    def test_play_quiz(self):
+        res = self.client().post('/quizzes', json={
+            'previous_questions': [],
+            'quiz_category': {'type': 'Science', 'id': 1}})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['question']['category'], 1)
+
+    def test_quiz_skips_previous_questions(self):
+        with self.app.app_context():
+            science = [question.id for question in
+                       Question.query.filter(Question.category == 1)]
+        previous = science[1:]
+        res = self.client().post('/quizzes', json={
+            'previous_questions': previous,
+            'quiz_category': {'type': 'Science', 'id': 1}})
+        data = json.loads(res.data)
+        self.assertEqual(data['question']['id'], science[0])
+
+        res = self.client().post('/quizzes', json={
+            'previous_questions': science,
+            'quiz_category': {'type': 'Science', 'id': 1}})
+        data = json.loads(res.data)
+        self.assertIsNone(data['question'])
+
+    def test_400_quiz_without_list_of_previous_questions(self):
+        res = self.client().post('/quizzes', json={'previous_questions': 5})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+    def test_play_quiz_session(self):
+        res = self.client().post('/quizzes/sessions', json={
+            'quiz_category': {'type': 'Science', 'id': 1}})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['session_id'])
+
+        played = []
+        for _ in range(data['total_questions']):
+            res = self.client().post(
+                '/quizzes/sessions/{}/next'.format(data['session_id']))
+            question = json.loads(res.data)['question']
+            self.assertEqual(question['category'], 1)
+            played.append(question['id'])
+        self.assertEqual(len(set(played)), data['total_questions'])
+
+        res = self.client().post(
+            '/quizzes/sessions/{}/next'.format(data['session_id']))
+        self.assertIsNone(json.loads(res.data)['question'])
+
+    def test_404_next_question_of_unknown_quiz_session(self):
+        res = self.client().post('/quizzes/sessions/unknown/next')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+
+    def test_search_questions(self):
+        res = self.client().post('/questions/search', json={'searchTerm': 'title'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['total_questions'])
+        self.assertTrue(all('title' in question['question'].lower()
+                            for question in data['questions']))
+
+    def test_search_questions_without_results(self):
+        res = self.client().post('/questions/search', json={'searchTerm': 'xyzzy'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_questions'], 0)
+        self.assertEqual(data['questions'], [])
+
+    def database_search(self, term):
+        # the other tests search in memory, this runs the full text index of
+        # migrations/0001_question_search.sql
+        app = create_app({'TESTING': True, 'QUERY_BUDGET': 5,
+                          'QUESTION_SEARCH': 'database'})
+        setup_db(app, self.database_path)
+        res = app.test_client().post('/questions/search', json={'searchTerm': term})
+        return app, res, json.loads(res.data)
+
+    def test_search_questions_in_database(self):
+        app, res, data = self.database_search('Tom han')
+        with app.app_context():
+            total = Question.query.filter(
+                Question.question.op('~*')(r'\mtom'),
+                Question.question.op('~*')(r'\mhan')).count()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(total)
+        self.assertEqual(data['total_questions'], total)
+        for question in data['questions']:
+            words = re.findall(r'\w+', question['question'].lower())
+            self.assertTrue(any(word.startswith('tom') for word in words))
+            self.assertTrue(any(word.startswith('han') for word in words))
+
+    def test_search_questions_in_database_matches_word_prefixes_only(self):
+        # 'itle' is inside "title", but starts no word
+        for term in ('itle', 'xyzzy'):
+            app, res, data = self.database_search(term)
+
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(data['total_questions'], 0)
+            self.assertEqual(data['questions'], [])
+
+    def test_search_backends_find_the_same_questions(self):
+        # "the" is a stop word of the english configuration, "what's" splits
+        # at the apostrophe and "wh" is only a prefix
+        with self.app.app_context():
+            for term in ('the', "what's the", 'Tom han', 'wh', 'xyzzy'):
+                for answers in (False, True):
+                    found = [self.search_all(term, answers, backend)
+                             for backend in ('database', 'memory')]
+                    self.assertEqual(found[0], found[1], (term, answers))
+                    self.assertEqual(found[0][0], len(found[0][1]))
+
+    def search_all(self, term, answers, backend):
+        # the total and the ids of every page of one search
+        ids, page = [], 1
+        while True:
+            total, questions = search_questions(term, page, answers, backend)
+            if not questions:
+                return total, set(ids)
+            ids.extend(question.id for question in questions)
+            page += 1
+
+    def test_400_search_without_term(self):
+        res = self.client().post('/questions/search', json={})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+    def test_get_categories(self):
+        res = self.client().get('/categories')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(len(data['categories']))
+        self.assertEqual(set(data['question_counts']), set(data['categories']))
+
+    def test_get_questions_by_category(self):
+        res = self.client().get('/categories/1/questions')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['current_category'], 'Science')
+        self.assertTrue(all(question['category'] == 1
+                            for question in data['questions']))
+        with self.app.app_context():
+            count = Question.query.filter(Question.category == 1).count()
+        self.assertEqual(data['total_questions'], count)
+
+    def test_question_count_follows_inserts_and_deletes(self):
+        with self.app.app_context():
+            before = Category.query.get(2).question_count
+            question = Question('Who painted the test?', 'Nobody', 2, 1)
+            question.insert()
+            self.assertEqual(Category.query.get(2).question_count, before + 1)
+            question.delete()
+            self.assertEqual(Category.query.get(2).question_count, before)
+
+    def test_404_questions_of_unknown_category(self):
+        res = self.client().get('/categories/1000/questions')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+
 
 # Make the tests conveniently executable
 if __name__ == "__main__":
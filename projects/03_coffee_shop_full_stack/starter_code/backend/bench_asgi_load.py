@@ -0,0 +1,130 @@
+'''
+Load test: tail latency of GET /drinks-detail, WSGI (src.api) vs ASGI (src.asgi)
+
+    every run starts a fresh server process with a cold JWKS key store that
+    points at a local stub key server answering after --latency seconds,
+    then fires --requests requests from --concurrency client threads
+    each client thread uses its own token, so every thread pays one verification
+
+    run from the backend directory (uvicorn is needed for the ASGI run):
+        python bench_asgi_load.py --requests 2000 --concurrency 50 --latency 0.2
+'''
+import argparse
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import Request, urlopen
+
+from jwks_stub import jwks_url, make_signing_key, mint_token, serve_jwks
+
+
+def serve(kind, port, url):
+    from src.auth import auth
+    from src.auth.jwks import JWKSKeyStore
+    auth.jwks_store = JWKSKeyStore(url)
+
+    if kind == 'wsgi':
+        from werkzeug.serving import WSGIRequestHandler, make_server
+        from src.api import app
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+
+        make_server('127.0.0.1', port, app, threaded=True,
+                    request_handler=QuietHandler).serve_forever()
+    else:
+        import uvicorn
+        from src.asgi import app
+        uvicorn.run(app, host='127.0.0.1', port=port, log_level='warning')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(port, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError('server did not start on port {}'.format(port))
+
+
+def percentile(samples, p):
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+def load(kind, args, key_server, tokens):
+    port = free_port()
+    process = subprocess.Popen([
+        sys.executable, __file__, '--serve', kind,
+        '--port', str(port), '--jwks-url', jwks_url(key_server)])
+    try:
+        wait_for(port)
+        hits_before = key_server.hits
+        endpoint = 'http://127.0.0.1:{}/drinks-detail'.format(port)
+
+        def call(i):
+            token = tokens[i % len(tokens)]
+            request = Request(endpoint,
+                              headers={'Authorization': 'Bearer ' + token})
+            start = time.perf_counter()
+            with urlopen(request) as response:
+                response.read()
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            latencies = sorted(pool.map(call, range(args.requests)))
+        elapsed = time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait()
+
+    ms = [latency * 1000 for latency in latencies]
+    print('{:<5} {:8.1f} req/s  p50 {:7.2f}  p95 {:7.2f}  p99 {:7.2f}'
+          '  max {:7.2f} ms  mean {:7.2f} ms  jwks downloads {}'.format(
+              kind, args.requests / elapsed, percentile(ms, 0.50),
+              percentile(ms, 0.95), percentile(ms, 0.99), ms[-1],
+              statistics.mean(ms), key_server.hits - hits_before))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.2,
+                        help='stub JWKS round-trip in seconds')
+    parser.add_argument('--only', choices=['wsgi', 'asgi'])
+    parser.add_argument('--serve', choices=['wsgi', 'asgi'], help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--jwks-url', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.jwks_url)
+        return
+
+    key = make_signing_key()
+    key_server = serve_jwks({'keys': [key['jwk']]}, latency=args.latency)
+    tokens = [mint_token(key, permissions=['get:drinks-detail'],
+                         subject='bench|{}'.format(i))
+              for i in range(args.concurrency)]
+
+    for kind in ('wsgi', 'asgi'):
+        if args.only in (None, kind):
+            load(kind, args, key_server, tokens)
+    key_server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+'''
+Benchmark: serializing 10k drinks with Drink.short() and Drink.long()
+
+    "before" reproduces the original methods (json.loads on every call and a
+    print of the parsed recipe in short()); "after" uses the parsed-recipe
+    cache of src.database.models.Drink
+    the first pass over fresh instances parses every recipe once, the second
+    pass over the same instances is what a cached listing pays
+
+    run from the backend directory:
+        python bench_drink_serialization.py --drinks 10000
+'''
+import argparse
+import io
+import json
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+
+from src.database.models import Drink
+
+
+def short_before(drink):
+    print(json.loads(drink.recipe))
+    short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in json.loads(drink.recipe)]
+    return {'id': drink.id, 'title': drink.title, 'recipe': short_recipe}
+
+
+def long_before(drink):
+    return {'id': drink.id, 'title': drink.title, 'recipe': json.loads(drink.recipe)}
+
+
+def serialize_all(serialize, drinks):
+    with redirect_stdout(io.StringIO()):
+        for drink in drinks:
+            serialize(drink)
+
+
+def measure(label, serialize, get_drinks):
+    drinks = get_drinks()
+    start = time.perf_counter()
+    serialize_all(serialize, drinks)
+    elapsed = time.perf_counter() - start
+
+    drinks = get_drinks()
+    tracemalloc.start()
+    serialize_all(serialize, drinks)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{label:<22} {elapsed * 1000:9.2f} ms'
+          f'  peak alloc {peak / 1024:9.1f} KiB'
+          f'  retained {retained / 1024:9.1f} KiB')
+
+
+def make_drinks(count):
+    recipe = json.dumps([
+        {'name': 'espresso', 'color': 'brown', 'parts': 1},
+        {'name': 'milk', 'color': 'white', 'parts': 3},
+        {'name': 'foam', 'color': 'grey', 'parts': 1}
+    ])
+    return [Drink(id=i, title='drink {}'.format(i), recipe=recipe)
+            for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--drinks', type=int, default=10000)
+    args = parser.parse_args()
+
+    fresh = lambda: make_drinks(args.drinks)
+    measure('short() before', short_before, fresh)
+    measure('long() before', long_before, fresh)
+    measure('short() after, cold', Drink.short, fresh)
+
+    warm = make_drinks(args.drinks)
+    for drink in warm:
+        drink.parsed_recipe()
+    measure('short() after, warm', Drink.short, lambda: warm)
+    measure('long() after, warm', Drink.long, lambda: warm)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+'''
+Benchmark: verify_decode_jwt with and without the shared JWKS key store
+
+    "before" downloads /.well-known/jwks.json on every call, like the original
+    implementation; "after" goes through src.auth.jwks.JWKSKeyStore
+
+    run from the backend directory:
+        python bench_jwks.py --requests 500 --latency 0.05
+'''
+import argparse
+import json
+import time
+from urllib.request import urlopen
+
+from jose import jwt
+
+from jwks_stub import jwks_url, make_signing_key, mint_token, serve_jwks
+from src.auth import auth
+from src.auth.jwks import JWKSKeyStore
+
+
+def verify_fetching_every_time(token, url):
+    jwks = json.loads(urlopen(url).read())
+    kid = jwt.get_unverified_header(token)['kid']
+    rsa_key = [key for key in jwks['keys'] if key['kid'] == kid][0]
+    return jwt.decode(token, rsa_key, algorithms=auth.ALGORITHMS,
+                      audience=auth.API_AUDIENCE,
+                      issuer='https://' + auth.AUTH0_DOMAIN + '/')
+
+
+def run(label, verify, token, requests):
+    start = time.perf_counter()
+    for _ in range(requests):
+        verify(token)
+    elapsed = time.perf_counter() - start
+    print(f'{label:<8} {requests / elapsed:10.1f} req/s'
+          f'  {elapsed / requests * 1000:8.3f} ms/req')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='simulated JWKS round-trip in seconds')
+    args = parser.parse_args()
+
+    key = make_signing_key()
+    server = serve_jwks({'keys': [key['jwk']]}, latency=args.latency)
+    url = jwks_url(server)
+    token = mint_token(key)
+
+    run('before', lambda t: verify_fetching_every_time(t, url),
+        token, args.requests)
+    before_hits = server.hits
+
+    auth.jwks_store = JWKSKeyStore(url)
+    run('after', auth.verify_decode_jwt, token, args.requests)
+    print(f'jwks downloads: before={before_hits}'
+          f' after={server.hits - before_hits}')
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+'''
+Benchmark: cost of get_verified_payload per request, token cache cold vs warm
+
+    "cold" clears token_cache before every call, so each request pays the
+    full RS256 verification; "warm" replays the same token against the cache
+
+    run from the backend directory:
+        python bench_token_cache.py --requests 2000
+'''
+import argparse
+import time
+
+from jwks_stub import jwks_url, make_signing_key, mint_token, serve_jwks
+from src.auth import auth
+from src.auth.jwks import JWKSKeyStore
+
+
+def run(label, token, requests, clear):
+    start = time.perf_counter()
+    for _ in range(requests):
+        if clear:
+            auth.token_cache.clear()
+        auth.get_verified_payload(token)
+    elapsed = time.perf_counter() - start
+    print(f'{label:<5} {elapsed / requests * 1e6:10.1f} us/req'
+          f'  {requests / elapsed:10.1f} req/s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    key = make_signing_key()
+    server = serve_jwks({'keys': [key['jwk']]})
+    auth.jwks_store = JWKSKeyStore(jwks_url(server))
+    token = mint_token(key)
+    # prime the key store so neither run pays for the JWKS download
+    auth.verify_decode_jwt(token)
+
+    run('cold', token, args.requests, clear=True)
+    auth.token_cache.clear()
+    auth.token_cache.hits = auth.token_cache.misses = 0
+    run('warm', token, args.requests, clear=False)
+    print('warm run token_cache', auth.token_cache.stats())
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+'''
+Local stand-in for the Auth0 tenant, used by the bench_*.py scripts
+
+    it generates an RSA signing key, serves the matching
+    /.well-known/jwks.json over http://127.0.0.1 and mints RS256 tokens
+    that src.auth.auth accepts (same issuer and audience)
+
+    EXAMPLE
+        key = make_signing_key()
+        server = serve_jwks({'keys': [key['jwk']]})
+        auth.jwks_store = JWKSKeyStore(jwks_url(server))
+        token = mint_token(key, permissions=['get:drinks-detail'])
+
+    !!NOTE requires pycryptodome (already pulled in by python-jose-cryptodome)
+'''
+import json
+import threading
+import time
+from base64 import urlsafe_b64encode
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from Crypto.PublicKey import RSA
+from jose import jwt
+
+from src.auth import auth
+
+
+def _b64_uint(value):
+    raw = value.to_bytes((value.bit_length() + 7) // 8, 'big')
+    return urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def make_signing_key(kid='bench-key'):
+    rsa = RSA.generate(2048)
+    return {
+        'kid': kid,
+        'pem': rsa.exportKey('PEM').decode('ascii'),
+        'jwk': {
+            'kty': 'RSA',
+            'kid': kid,
+            'use': 'sig',
+            'alg': 'RS256',
+            'n': _b64_uint(rsa.n),
+            'e': _b64_uint(rsa.e)
+        }
+    }
+
+
+def mint_token(key, permissions=(), expires_in=3600, subject='bench|user'):
+    now = int(time.time())
+    claims = {
+        'iss': 'https://' + auth.AUTH0_DOMAIN + '/',
+        'aud': auth.API_AUDIENCE,
+        'sub': subject,
+        'iat': now,
+        'exp': now + expires_in,
+        'permissions': list(permissions)
+    }
+    return jwt.encode(claims, key['pem'], algorithm='RS256',
+                      headers={'kid': key['kid']})
+
+
+def serve_jwks(jwks, latency=0.0):
+    '''
+    serve_jwks(jwks, latency)
+        serves jwks on a random local port from a daemon thread
+        latency (seconds) is added to every response to mimic a real round-trip
+        server.hits counts the key set downloads
+    '''
+    body = json.dumps(jwks).encode('utf-8')
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            server.hits += 1
+            if latency:
+                time.sleep(latency)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    server.hits = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def jwks_url(server):
+    host, port = server.server_address[:2]
+    return f'http://{host}:{port}/.well-known/jwks.json'
+
+
+def write_jwks_file(jwks, path):
+    with open(path, 'w') as f:
+        json.dump(jwks, f)
+    return 'file://' + path
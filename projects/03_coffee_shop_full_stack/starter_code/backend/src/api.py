@@ -1,15 +1,20 @@
 import os
-from flask import Flask, request, jsonify, abort
+from flask import Flask, request, jsonify, abort, Response
 from sqlalchemy import exc
 import json
 from flask_cors import CORS
 
-from .database.models import db_drop_and_create_all, setup_db, Drink
+from .database.models import db_drop_and_create_all, setup_db, db, Drink
+from .database.pool import pool_metrics
 from .auth.auth import AuthError, requires_auth
+from .cache import drinks_cache, etag_matches
+from .query_stats import QueryStats
 
 app = Flask(__name__)
 setup_db(app)
 CORS(app)
+# X-DB-Queries / X-DB-Time headers, slow query log and QUERY_BUDGET
+QueryStats(app)
 
 '''
 @TODO uncomment the following line to initialize the datbase
@@ -27,6 +32,9 @@ CORS(app)
     returns status code 200 and json {"success": True, "drinks": drinks} where drinks is the list of drinks
         or appropriate status code indicating reason for failure
 '''
+@app.route('/drinks', methods=['GET'])
+def get_drinks():
+    return cached_drinks_response('short', 'no-cache')
 
 
 '''
@@ -37,6 +45,34 @@ CORS(app)
     returns status code 200 and json {"success": True, "drinks": drinks} where drinks is the list of drinks
         or appropriate status code indicating reason for failure
 '''
+@app.route('/drinks-detail', methods=['GET'])
+@requires_auth('get:drinks-detail')
+def get_drinks_detail(payload):
+    return cached_drinks_response('long', 'private, no-cache')
+
+
+'''
+cached_drinks_response(kind, cache_control)
+    serves the shared body from drinks_cache with a strong ETag
+    answers 304 Not Modified when If-None-Match matches the current version,
+    without querying the database
+'''
+def cached_drinks_response(kind, cache_control):
+    body = None
+    etag = drinks_cache.current_etag(kind)
+    if etag is None:
+        etag, body = drinks_cache.get(kind)
+
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        response = Response(status=304)
+    else:
+        if body is None:
+            etag, body = drinks_cache.get(kind)
+        response = Response(body, mimetype='application/json')
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
 
 
 '''
@@ -48,6 +84,24 @@ CORS(app)
     returns status code 200 and json {"success": True, "drinks": drink} where drink an array containing only the newly created drink
         or appropriate status code indicating reason for failure
 '''
+@app.route('/drinks', methods=['POST'])
+@requires_auth('post:drinks')
+def create_drink(payload):
+    title, recipe = parse_drink_body(request.get_json(silent=True))
+    if title is None or recipe is None:
+        abort(422)
+
+    try:
+        drink = Drink(title=title, recipe=recipe)
+        drink.insert()
+    except exc.SQLAlchemyError:
+        db.session.rollback()
+        abort(422)
+
+    return jsonify({
+        'success': True,
+        'drinks': [drink.long()]
+    })
 
 
 '''
@@ -61,6 +115,31 @@ CORS(app)
     returns status code 200 and json {"success": True, "drinks": drink} where drink an array containing only the updated drink
         or appropriate status code indicating reason for failure
 '''
+@app.route('/drinks/<int:id>', methods=['PATCH'])
+@requires_auth('patch:drinks')
+def update_drink(payload, id):
+    drink = Drink.query.filter(Drink.id == id).one_or_none()
+    if drink is None:
+        abort(404)
+
+    title, recipe = parse_drink_body(request.get_json(silent=True))
+    if title is None and recipe is None:
+        abort(422)
+
+    try:
+        if title is not None:
+            drink.title = title
+        if recipe is not None:
+            drink.recipe = recipe
+        drink.update()
+    except exc.SQLAlchemyError:
+        db.session.rollback()
+        abort(422)
+
+    return jsonify({
+        'success': True,
+        'drinks': [drink.long()]
+    })
 
 
 '''
@@ -73,6 +152,64 @@ CORS(app)
     returns status code 200 and json {"success": True, "delete": id} where id is the id of the deleted record
         or appropriate status code indicating reason for failure
 '''
+@app.route('/drinks/<int:id>', methods=['DELETE'])
+@requires_auth('delete:drinks')
+def delete_drink(payload, id):
+    drink = Drink.query.filter(Drink.id == id).one_or_none()
+    if drink is None:
+        abort(404)
+
+    try:
+        drink.delete()
+    except exc.SQLAlchemyError:
+        db.session.rollback()
+        abort(422)
+
+    return jsonify({
+        'success': True,
+        'delete': id
+    })
+
+
+'''
+GET /metrics/pool
+    the connection pool metrics of this worker, see database/pool.py
+    returns status code 200 and json {"success": True, "pool": metrics}
+'''
+@app.route('/metrics/pool', methods=['GET'])
+def get_pool_metrics():
+    return jsonify({
+        'success': True,
+        'pool': pool_metrics(db.engine.pool)
+    })
+
+
+'''
+parse_drink_body(body)
+    returns (title, recipe) from a POST/PATCH json body
+    recipe is returned as the json string stored in Drink.recipe,
+    a single ingredient object is wrapped in a list
+    a missing or malformed field is returned as None
+'''
+def parse_drink_body(body):
+    if not isinstance(body, dict):
+        return None, None
+
+    title = body.get('title')
+    if not isinstance(title, str) or not title:
+        title = None
+
+    recipe = body.get('recipe')
+    if isinstance(recipe, dict):
+        recipe = [recipe]
+    if isinstance(recipe, list) and recipe and all(
+            isinstance(r, dict) and {'name', 'color', 'parts'} <= r.keys()
+            for r in recipe):
+        recipe = json.dumps(recipe)
+    else:
+        recipe = None
+
+    return title, recipe
 
 
 ## Error Handling
@@ -102,9 +239,42 @@ def unprocessable(error):
 @TODO implement error handler for 404
     error handler should conform to general task above 
 '''
+@app.errorhandler(404)
+def not_found(error):
+    return jsonify({
+                    "success": False, 
+                    "error": 404,
+                    "message": "resource not found"
+                    }), 404
+
+
+@app.errorhandler(400)
+def bad_request(error):
+    return jsonify({
+                    "success": False, 
+                    "error": 400,
+                    "message": "bad request"
+                    }), 400
+
+
+@app.errorhandler(405)
+def method_not_allowed(error):
+    return jsonify({
+                    "success": False, 
+                    "error": 405,
+                    "message": "method not allowed"
+                    }), 405
 
 
 '''
 @TODO implement error handler for AuthError
     error handler should conform to general task above 
 '''
+@app.errorhandler(AuthError)
+def auth_error(error):
+    return jsonify({
+                    "success": False, 
+                    "error": error.status_code,
+                    "message": error.error['description']
+                    }), error.status_code
+
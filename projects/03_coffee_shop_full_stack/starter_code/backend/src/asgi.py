@@ -0,0 +1,202 @@
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from sqlalchemy import exc
+
+from .api import app as flask_app, parse_drink_body
+from .database.models import db, Drink
+from .database.pool import pool_metrics
+from .auth.auth import AuthError, requires_auth_async
+from .cache import drinks_cache, etag_matches
+
+'''
+ASGI entry point
+serves the same routes as ./api.py
+
+    the auth path never blocks the event loop: a missing signing key is fetched
+    in the background and concurrent cold requests share one in-flight fetch
+    database work runs in the threadpool, inside the flask app context so the
+    Drink model and session of ./api.py are reused as is
+
+    run it with
+        uvicorn src.asgi:app
+'''
+
+
+'''
+run_db(f, *args)
+    runs f in the threadpool within the flask app context
+    the session is removed when the app context is torn down
+'''
+async def run_db(f, *args):
+    def call():
+        with flask_app.app_context():
+            return f(*args)
+    return await run_in_threadpool(call)
+
+
+def get_drink_or_404(id):
+    drink = Drink.query.filter(Drink.id == id).one_or_none()
+    if drink is None:
+        raise HTTPException(404)
+    return drink
+
+
+async def read_drink_body(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        body = None
+    return parse_drink_body(body)
+
+
+async def get_drinks(request):
+    return await cached_drinks_response(request, 'short', 'no-cache')
+
+
+@requires_auth_async('get:drinks-detail')
+async def get_drinks_detail(payload, request):
+    return await cached_drinks_response(request, 'long', 'private, no-cache')
+
+
+'''
+cached_drinks_response(request, kind, cache_control)
+    same as in ./api.py: a 304 is answered from memory, a cache miss
+    rebuilds the shared body in the threadpool
+'''
+async def cached_drinks_response(request, kind, cache_control):
+    body = None
+    etag = drinks_cache.current_etag(kind)
+    if etag is None:
+        etag, body = await run_db(drinks_cache.get, kind)
+
+    headers = {'ETag': '"{}"'.format(etag), 'Cache-Control': cache_control}
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        return Response(status_code=304, headers=headers)
+
+    if body is None:
+        etag, body = await run_db(drinks_cache.get, kind)
+        headers['ETag'] = '"{}"'.format(etag)
+    return Response(body, media_type='application/json', headers=headers)
+
+
+@requires_auth_async('post:drinks')
+async def create_drink(payload, request):
+    title, recipe = await read_drink_body(request)
+    if title is None or recipe is None:
+        raise HTTPException(422)
+
+    def insert():
+        try:
+            drink = Drink(title=title, recipe=recipe)
+            drink.insert()
+            return drink.long()
+        except exc.SQLAlchemyError:
+            db.session.rollback()
+            raise HTTPException(422)
+
+    return JSONResponse({
+        'success': True,
+        'drinks': [await run_db(insert)]
+    })
+
+
+@requires_auth_async('patch:drinks')
+async def update_drink(payload, request):
+    id = request.path_params['id']
+    title, recipe = await read_drink_body(request)
+
+    def update():
+        drink = get_drink_or_404(id)
+        if title is None and recipe is None:
+            raise HTTPException(422)
+        try:
+            if title is not None:
+                drink.title = title
+            if recipe is not None:
+                drink.recipe = recipe
+            drink.update()
+            return drink.long()
+        except exc.SQLAlchemyError:
+            db.session.rollback()
+            raise HTTPException(422)
+
+    return JSONResponse({
+        'success': True,
+        'drinks': [await run_db(update)]
+    })
+
+
+@requires_auth_async('delete:drinks')
+async def delete_drink(payload, request):
+    id = request.path_params['id']
+
+    def delete():
+        drink = get_drink_or_404(id)
+        try:
+            drink.delete()
+        except exc.SQLAlchemyError:
+            db.session.rollback()
+            raise HTTPException(422)
+
+    await run_db(delete)
+    return JSONResponse({
+        'success': True,
+        'delete': id
+    })
+
+
+async def get_pool_metrics(request):
+    return JSONResponse({
+        'success': True,
+        'pool': pool_metrics(db.engine.pool)
+    })
+
+
+## Error Handling
+ERROR_MESSAGES = {
+    400: 'bad request',
+    404: 'resource not found',
+    405: 'method not allowed',
+    422: 'unprocessable'
+}
+
+
+async def http_error(request, error):
+    return JSONResponse({
+        'success': False,
+        'error': error.status_code,
+        'message': ERROR_MESSAGES.get(error.status_code, error.detail)
+    }, status_code=error.status_code)
+
+
+async def auth_error(request, error):
+    return JSONResponse({
+        'success': False,
+        'error': error.status_code,
+        'message': error.error['description']
+    }, status_code=error.status_code)
+
+
+app = Starlette(
+    routes=[
+        Route('/drinks', get_drinks, methods=['GET']),
+        Route('/drinks-detail', get_drinks_detail, methods=['GET']),
+        Route('/drinks', create_drink, methods=['POST']),
+        Route('/drinks/{id:int}', update_drink, methods=['PATCH']),
+        Route('/drinks/{id:int}', delete_drink, methods=['DELETE']),
+        Route('/metrics/pool', get_pool_metrics, methods=['GET']),
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_headers=['*'],
+                   allow_methods=['*'])
+    ],
+    exception_handlers={
+        HTTPException: http_error,
+        AuthError: auth_error
+    }
+)
@@ -2,13 +2,29 @@ import json
 from flask import request, _request_ctx_stack
 from functools import wraps
 from jose import jwt
-from urllib.request import urlopen
+
+from .jwks import JWKSKeyStore
+from .token_cache import VerifiedTokenCache
 
 
 AUTH0_DOMAIN = 'udacity-fsnd.auth0.com'
 ALGORITHMS = ['RS256']
 API_AUDIENCE = 'dev'
 
+'''
+jwks_store
+    the Auth0 signing keys, fetched once and shared by every request
+    it is refreshed in the background, see ./jwks.py
+'''
+jwks_store = JWKSKeyStore(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+
+'''
+token_cache
+    decoded payloads of already verified tokens, keyed by token digest
+    see ./token_cache.py
+'''
+token_cache = VerifiedTokenCache()
+
 ## AuthError Exception
 '''
 AuthError Exception
@@ -31,7 +47,41 @@ class AuthError(Exception):
     return the token part of the header
 '''
 def get_token_auth_header():
-   raise Exception('Not Implemented')
+    return parse_auth_header(request.headers.get('Authorization', None))
+
+'''
+parse_auth_header(auth)
+    the framework independent part of get_token_auth_header
+    returns the token from an Authorization header value
+'''
+def parse_auth_header(auth):
+    if not auth:
+        raise AuthError({
+            'code': 'authorization_header_missing',
+            'description': 'Authorization header is expected.'
+        }, 401)
+
+    parts = auth.split()
+    if not parts or parts[0].lower() != 'bearer':
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization header must start with "Bearer".'
+        }, 401)
+
+    elif len(parts) == 1:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Token not found.'
+        }, 401)
+
+    elif len(parts) > 2:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization header must be bearer token.'
+        }, 401)
+
+    token = parts[1]
+    return token
 
 '''
 @TODO implement check_permissions(permission, payload) method
@@ -43,9 +93,60 @@ def get_token_auth_header():
         !!NOTE check your RBAC settings in Auth0
     it should raise an AuthError if the requested permission string is not in the payload permissions array
     return true otherwise
+
+    permission may also be a compiled PermissionRequirement
+    granted is the payload's permissions as a frozenset, when the caller already has it
+'''
+def check_permissions(permission, payload, granted=None):
+    if granted is None:
+        if 'permissions' not in payload:
+            raise AuthError({
+                'code': 'invalid_claims',
+                'description': 'Permissions not included in JWT.'
+            }, 400)
+        granted = frozenset(payload['permissions'])
+
+    if not isinstance(permission, PermissionRequirement):
+        permission = PermissionRequirement([permission])
+
+    if not permission.satisfied_by(granted):
+        raise AuthError({
+            'code': 'unauthorized',
+            'description': 'Permission not found.'
+        }, 403)
+    return True
+
+'''
+PermissionRequirement
+the permissions a route needs, compiled once when the route is decorated
+
+    all-of by default: every permission must be granted
+    any_of=True: at least one of them must be granted
+    an empty requirement only needs the permissions claim to be present
 '''
-def check_permissions(permission, payload):
-    raise Exception('Not Implemented')
+class PermissionRequirement:
+    def __init__(self, permissions, any_of=False):
+        self.permissions = frozenset(p for p in permissions if p)
+        self.any_of = any_of
+
+    def satisfied_by(self, granted):
+        if not self.permissions:
+            return True
+        if self.any_of:
+            return not self.permissions.isdisjoint(granted)
+        return self.permissions <= granted
+
+    def __repr__(self):
+        mode = 'any_of' if self.any_of else 'all_of'
+        return '{}({})'.format(mode, sorted(self.permissions))
+
+'''
+ROUTE_PERMISSIONS
+    registry of every function decorated with @requires_auth and the
+    PermissionRequirement it declares, filled in at import time
+    keyed by '<module>.<function name>'
+'''
+ROUTE_PERMISSIONS = {}
 
 '''
 @TODO implement verify_decode_jwt(token) method
@@ -54,6 +155,7 @@ def check_permissions(permission, payload):
 
     it should be an Auth0 token with key id (kid)
     it should verify the token using Auth0 /.well-known/jwks.json
+        the key set is cached by jwks_store instead of being fetched on every call
     it should decode the payload from the token
     it should validate the claims
     return the decoded payload
@@ -61,7 +163,96 @@ def check_permissions(permission, payload):
     !!NOTE urlopen has a common certificate error described here: https://stackoverflow.com/questions/50236117/scraping-ssl-certificate-verify-failed-error-for-http-en-wikipedia-org
 '''
 def verify_decode_jwt(token):
-    raise Exception('Not Implemented')
+    rsa_key = jwks_store.get_key(get_unverified_kid(token))
+    return decode_jwt(token, rsa_key)
+
+'''
+verify_decode_jwt_async(token)
+    same as verify_decode_jwt, for ASGI handlers
+    a missing key is fetched without blocking the event loop and concurrent
+    callers share the same in-flight fetch, see JWKSKeyStore.get_key_async
+'''
+async def verify_decode_jwt_async(token):
+    rsa_key = await jwks_store.get_key_async(get_unverified_kid(token))
+    return decode_jwt(token, rsa_key)
+
+def get_unverified_kid(token):
+    try:
+        unverified_header = jwt.get_unverified_header(token)
+    except jwt.JWTError:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to parse authentication token.'
+        }, 401)
+    if 'kid' not in unverified_header:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization malformed.'
+        }, 401)
+    return unverified_header['kid']
+
+'''
+decode_jwt(token, rsa_key)
+    verifies the signature and claims of token against rsa_key
+    return the decoded payload
+'''
+def decode_jwt(token, rsa_key):
+    if rsa_key:
+        try:
+            payload = jwt.decode(
+                token,
+                rsa_key,
+                algorithms=ALGORITHMS,
+                audience=API_AUDIENCE,
+                issuer='https://' + AUTH0_DOMAIN + '/'
+            )
+
+            return payload
+
+        except jwt.ExpiredSignatureError:
+            raise AuthError({
+                'code': 'token_expired',
+                'description': 'Token expired.'
+            }, 401)
+
+        except jwt.JWTClaimsError:
+            raise AuthError({
+                'code': 'invalid_claims',
+                'description': 'Incorrect claims. Please, check the audience and issuer.'
+            }, 401)
+        except Exception:
+            raise AuthError({
+                'code': 'invalid_header',
+                'description': 'Unable to parse authentication token.'
+            }, 400)
+    raise AuthError({
+                'code': 'invalid_header',
+                'description': 'Unable to find the appropriate key.'
+            }, 400)
+
+'''
+get_verified_token(token)
+    returns (payload, permissions) for token, permissions being a frozenset
+    (or None if the payload has no permissions claim)
+    a token that was already verified is served from token_cache until its exp claim
+    otherwise it is verified with verify_decode_jwt and cached
+'''
+def get_verified_token(token):
+    entry = token_cache.get_entry(token)
+    if entry is None:
+        payload = verify_decode_jwt(token)
+        entry = payload, token_cache.put(token, payload)
+    return entry
+
+def get_verified_payload(token):
+    return get_verified_token(token)[0]
+
+async def get_verified_token_async(token):
+    entry = token_cache.get_entry(token)
+    if entry is None:
+        payload = await verify_decode_jwt_async(token)
+        entry = payload, token_cache.put(token, payload)
+    return entry
 
 '''
 @TODO implement @requires_auth(permission) decorator method
@@ -70,17 +261,52 @@ def verify_decode_jwt(token):
 
     it should use the get_token_auth_header method to get the token
     it should use the verify_decode_jwt method to decode the jwt
+        (through get_verified_payload, so repeated tokens skip the signature check)
     it should use the check_permissions method validate claims and check the requested permission
     return the decorator which passes the decoded payload to the decorated method
+
+    several permissions may be given, all of them are required unless any_of=True
+        EXAMPLE
+            @requires_auth('patch:drinks', 'get:drinks-detail')
+            @requires_auth('patch:drinks', 'delete:drinks', any_of=True)
 '''
-def requires_auth(permission=''):
+def requires_auth(permission='', *permissions, any_of=False):
+    requirement = PermissionRequirement((permission,) + permissions, any_of=any_of)
+
     def requires_auth_decorator(f):
+        ROUTE_PERMISSIONS['{}.{}'.format(f.__module__, f.__name__)] = requirement
+
         @wraps(f)
         def wrapper(*args, **kwargs):
             token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
-            check_permissions(permission, payload)
+            payload, granted = get_verified_token(token)
+            check_permissions(requirement, payload, granted)
             return f(payload, *args, **kwargs)
 
         return wrapper
-    return requires_auth_decorator
\ No newline at end of file
+    return requires_auth_decorator
+
+'''
+requires_auth_async(permission)
+    the @requires_auth decorator for ASGI handlers taking a starlette-style request
+
+    EXAMPLE
+        @requires_auth_async('get:drinks-detail')
+        async def get_drinks_detail(payload, request):
+            ...
+'''
+def requires_auth_async(permission='', *permissions, any_of=False):
+    requirement = PermissionRequirement((permission,) + permissions, any_of=any_of)
+
+    def requires_auth_decorator(f):
+        ROUTE_PERMISSIONS['{}.{}'.format(f.__module__, f.__name__)] = requirement
+
+        @wraps(f)
+        async def wrapper(request, *args, **kwargs):
+            token = parse_auth_header(request.headers.get('Authorization', None))
+            payload, granted = await get_verified_token_async(token)
+            check_permissions(requirement, payload, granted)
+            return await f(payload, request, *args, **kwargs)
+
+        return wrapper
+    return requires_auth_decorator
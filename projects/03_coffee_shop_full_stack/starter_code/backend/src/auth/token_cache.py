@@ -0,0 +1,103 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+'''
+VerifiedTokenCache
+A bounded LRU of tokens that already passed signature verification
+
+    entries are keyed by the sha256 digest of the raw token, so the cache never
+    holds bearer tokens themselves
+    an entry expires at the token's exp claim (capped by max_age seconds)
+    the payload's permissions claim is stored next to it as a frozenset,
+    so permission checks on a hit are set operations
+    once maxsize entries are held the least recently used one is evicted,
+    which bounds the memory the cache can take
+    hits and misses are counted, see stats()
+
+    EXAMPLE
+        payload = token_cache.get(token)
+        if payload is None:
+            payload = verify_decode_jwt(token)
+            token_cache.put(token, payload)
+'''
+class VerifiedTokenCache:
+    def __init__(self, maxsize=1024, max_age=3600):
+        self.maxsize = maxsize
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(token):
+        if isinstance(token, str):
+            token = token.encode('utf-8')
+        return hashlib.sha256(token).digest()
+
+    '''
+    get(token)
+        returns the cached payload, or None on a miss or an expired entry
+    '''
+    def get(self, token):
+        entry = self.get_entry(token)
+        return entry[0] if entry else None
+
+    '''
+    get_entry(token)
+        returns (payload, permissions) where permissions is the frozenset of
+        the permissions claim (None if the claim is missing),
+        or None on a miss or an expired entry
+    '''
+    def get_entry(self, token):
+        key = self.digest(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    '''
+    put(token, payload)
+        caches a verified payload until its exp claim
+        payloads without exp are not cached
+        returns the permissions frozenset stored with the payload
+    '''
+    def put(self, token, payload):
+        permissions = None
+        if 'permissions' in payload:
+            permissions = frozenset(payload['permissions'])
+        if 'exp' not in payload:
+            return permissions
+        expires_at = min(payload['exp'], time.time() + self.max_age)
+        key = self.digest(token)
+        with self._lock:
+            self._entries[key] = (expires_at, payload, permissions)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return permissions
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._entries),
+            'maxsize': self.maxsize
+        }
@@ -0,0 +1,102 @@
+import json
+import threading
+import time
+
+from .database.models import Drink, drinks_version
+
+
+'''
+DrinksResponseCache
+the serialized /drinks and /drinks-detail bodies, shared by every request
+
+    a body is built once per drinks_version and reused until the next
+    Drink.insert(), update() or delete(), which bumps the version
+    the etag is derived from the version alone, so a conditional GET
+    can be answered with a 304 without touching the database
+
+    !!NOTE the version lives in this process; with several workers a write in
+    one of them is seen by the others only once their entry is older than
+    max_age seconds
+'''
+class DrinksResponseCache:
+    SERIALIZERS = {
+        'short': Drink.short,
+        'long': Drink.long
+    }
+
+    def __init__(self, max_age=5):
+        self.max_age = max_age
+        self.builds = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    '''
+    current_etag(kind)
+        returns the etag of the cached body if it is still valid, else None
+        never queries the database
+    '''
+    def current_etag(self, kind):
+        entry = self._entries.get(kind)
+        if entry and self._is_fresh(entry):
+            return entry[1]
+        return None
+
+    '''
+    get(kind)
+        returns (etag, body) for kind ('short' or 'long'), body being utf-8 json
+        must be called within the flask app context when the body is rebuilt
+    '''
+    def get(self, kind):
+        entry = self._entries.get(kind)
+        if entry and self._is_fresh(entry):
+            return entry[1], entry[2]
+
+        with self._lock:
+            entry = self._entries.get(kind)
+            if entry and self._is_fresh(entry):
+                return entry[1], entry[2]
+
+            # read the version first: a write racing the query only makes the
+            # entry stale sooner, never labels new data with an old version
+            version = drinks_version.value
+            serialize = self.SERIALIZERS[kind]
+            drinks = Drink.query.order_by(Drink.id).all()
+            body = json.dumps({
+                'success': True,
+                'drinks': [serialize(drink) for drink in drinks]
+            }).encode('utf-8')
+            etag = drinks_version.etag(version) + '-' + kind
+            self._entries[kind] = (version, etag, body, time.monotonic())
+            self.builds += 1
+            return etag, body
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _is_fresh(self, entry):
+        return (entry[0] == drinks_version.value and
+                (self.max_age is None or
+                 time.monotonic() - entry[3] < self.max_age))
+
+
+drinks_cache = DrinksResponseCache()
+
+
+'''
+etag_matches(if_none_match, etag)
+    True if the raw If-None-Match header value matches etag
+    weak comparison, as RFC 7232 asks for If-None-Match
+'''
+def etag_matches(if_none_match, etag):
+    if not if_none_match or not etag:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return True
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate.strip('"') == etag:
+            return True
+    return False
@@ -1,14 +1,46 @@
 import os
-from sqlalchemy import Column, String, Integer
+import threading
+import uuid
+from sqlalchemy import Column, String, Integer, event
 from flask_sqlalchemy import SQLAlchemy
 import json
 
+from .pool import engine_options
+
 database_filename = "database.db"
 project_dir = os.path.dirname(os.path.abspath(__file__))
 database_path = "sqlite:///{}".format(os.path.join(project_dir, database_filename))
 
 db = SQLAlchemy()
 
+'''
+DataVersion
+a counter bumped by every write through the Drink model methods
+
+    the etag is unique to this process (epoch) and version, so an etag
+    handed out by another worker or before a restart never matches
+    EXAMPLE
+        drinks_version.value   -> 3
+        drinks_version.etag()  -> '5f0c...-3'
+'''
+class DataVersion:
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def bump(self):
+        with self._lock:
+            self.value += 1
+            return self.value
+
+    def etag(self, version=None):
+        if version is None:
+            version = self.value
+        return '{}-{}'.format(self.epoch, version)
+
+drinks_version = DataVersion()
+
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
@@ -16,6 +48,7 @@ setup_db(app)
 def setup_db(app):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options()
     db.app = app
     db.init_app(app)
 
@@ -28,6 +61,7 @@ db_drop_and_create_all()
 def db_drop_and_create_all():
     db.drop_all()
     db.create_all()
+    drinks_version.bump()
 
 '''
 Drink
@@ -42,17 +76,33 @@ class Drink(db.Model):
     # the required datatype is [{'color': string, 'name':string, 'parts':number}]
     recipe =  Column(String(180), nullable=False)
 
+    # (raw recipe, parsed recipe, short projection), see parsed_recipe()
+    _recipe_cache = None
+
+    '''
+    parsed_recipe()
+        returns (recipe, short_recipe) parsed from the recipe json blob
+        the result is cached on the instance and recomputed only when recipe changes,
+        so serializing the same drink again does not re-parse the blob
+        !!NOTE the returned lists are shared, do not mutate them
+    '''
+    def parsed_recipe(self):
+        cache = self._recipe_cache
+        if cache is None or cache[0] != self.recipe:
+            recipe = json.loads(self.recipe)
+            short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in recipe]
+            cache = self._recipe_cache = (self.recipe, recipe, short_recipe)
+        return cache[1], cache[2]
+
     '''
     short()
         short form representation of the Drink model
     '''
     def short(self):
-        print(json.loads(self.recipe))
-        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in json.loads(self.recipe)]
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': short_recipe
+            'recipe': self.parsed_recipe()[1]
         }
 
     '''
@@ -63,9 +113,14 @@ class Drink(db.Model):
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': json.loads(self.recipe)
+            'recipe': self.parsed_recipe()[0]
         }
 
+    '''
+    insert(), update() and delete() bump drinks_version after the commit,
+    which invalidates the cached /drinks responses (see ../cache.py)
+    '''
+
     '''
     insert()
         inserts a new model into a database
@@ -78,6 +133,7 @@ class Drink(db.Model):
     def insert(self):
         db.session.add(self)
         db.session.commit()
+        drinks_version.bump()
 
     '''
     delete()
@@ -90,6 +146,7 @@ class Drink(db.Model):
     def delete(self):
         db.session.delete(self)
         db.session.commit()
+        drinks_version.bump()
 
     '''
     update()
@@ -102,6 +159,15 @@ class Drink(db.Model):
     '''
     def update(self):
         db.session.commit()
+        drinks_version.bump()
 
     def __repr__(self):
-        return json.dumps(self.short())
\ No newline at end of file
+        return json.dumps(self.short())
+
+
+'''
+drop the parsed recipe cache as soon as a new recipe is assigned
+'''
+@event.listens_for(Drink.recipe, 'set')
+def invalidate_recipe_cache(target, value, oldvalue, initiator):
+    target._recipe_cache = None
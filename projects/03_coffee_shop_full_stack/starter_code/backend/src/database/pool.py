@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+from collections import deque
+
+from sqlalchemy.pool import NullPool
+
+'''
+Connection metrics of the coffee shop API, see models.setup_db.
+
+    engine_options()
+        the create_engine() options for SQLALCHEMY_ENGINE_OPTIONS. The
+        database is a SQLite file, which SQLAlchemy 1.3 opens with a
+        NullPool: every checkout opens the file and every checkin closes
+        it, so there is nothing to size or recycle
+
+    pool_metrics(pool)
+        the checkouts of the pool and the time spent opening the file,
+        served at /metrics/pool by the Flask and the ASGI app
+'''
+
+
+def engine_options():
+    return {'poolclass': MeteredNullPool}
+
+
+'''
+PoolStats
+counters of one pool, updated on every checkout and checkin
+
+    the latency of a checkout is the time spent opening the file, the last
+    LATENCIES of which are kept for percentiles
+'''
+class PoolStats:
+    LATENCIES = 1000
+
+    def __init__(self):
+        self.in_use = 0
+        self.checkouts = 0
+        self.failures = 0
+        self.latencies = deque(maxlen=self.LATENCIES)
+        self._lock = threading.Lock()
+
+    def checked_out(self, latency):
+        with self._lock:
+            self.in_use += 1
+            self.checkouts += 1
+            self.latencies.append(latency)
+
+    def failed(self, latency):
+        with self._lock:
+            self.failures += 1
+            self.latencies.append(latency)
+
+    def checked_in(self):
+        with self._lock:
+            self.in_use -= 1
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            counts = {
+                'in_use': self.in_use,
+                'checkouts': self.checkouts,
+                'failures': self.failures
+            }
+
+        def at(fraction):
+            if not latencies:
+                return 0.0
+            index = min(len(latencies) - 1, int(len(latencies) * fraction))
+            return round(latencies[index] * 1000, 3)
+
+        counts['checkout_ms'] = {
+            'p50': at(0.50),
+            'p99': at(0.99),
+            'max': at(1.0)
+        }
+        return counts
+
+
+'''
+MeteredNullPool
+a NullPool keeping a PoolStats in its stats attribute
+'''
+class MeteredNullPool(NullPool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            self.stats.failed(time.perf_counter() - start)
+            raise
+        self.stats.checked_out(time.perf_counter() - start)
+        return connection
+
+    def _do_return_conn(self, connection):
+        try:
+            super()._do_return_conn(connection)
+        finally:
+            self.stats.checked_in()
+
+
+'''
+pool_metrics(pool)
+    the PoolStats of a MeteredNullPool, for this process only
+    EXAMPLE
+        {"pid": 4242, "in_use": 1, "checkouts": 1530, "failures": 0,
+         "checkout_ms": {"p50": 0.05, "p99": 0.4, "max": 3.1}}
+'''
+def pool_metrics(pool):
+    metrics = {'pid': os.getpid()}
+    metrics.update(pool.stats.snapshot())
+    return metrics
@@ -1,6 +1,7 @@
 import os
-from flask import Flask
-from models import setup_db
+from flask import Flask, jsonify
+from models import setup_db, db
+from pool import pool_metrics
 
 def create_app(test_config=None):
 
@@ -19,6 +20,10 @@ def create_app(test_config=None):
     def be_cool():
         return "Be cool, man, be coooool! You're almost a FSND grad!"
 
+    @app.route('/metrics/pool')
+    def get_pool_metrics():
+        return jsonify(pool_metrics(db.engine.pool))
+
     return app
 
 app = create_app()
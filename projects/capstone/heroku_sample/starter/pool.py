@@ -0,0 +1,171 @@
+import os
+import threading
+import time
+from collections import deque
+
+from sqlalchemy.pool import QueuePool
+
+'''
+Connection pool settings and metrics of the Heroku sample, see
+models.setup_db.
+
+    engine_options()
+        the create_engine() options for SQLALCHEMY_ENGINE_OPTIONS, read from
+        the environment:
+
+        DB_POOL_SIZE        connections kept open (5)
+        DB_MAX_OVERFLOW     extra connections opened under load (10)
+        DB_POOL_TIMEOUT     seconds to wait for a free connection (30)
+        DB_POOL_RECYCLE     seconds before a connection is reopened (1800)
+        DB_POOL_PRE_PING    test connections before use (true)
+
+        each worker process holds up to DB_POOL_SIZE + DB_MAX_OVERFLOW
+        connections: keep dynos * workers * that sum under the connection
+        limit of the Heroku Postgres plan
+
+    pool_metrics(pool)
+        the checkout counters of the pool, served at /metrics/pool
+    EXAMPLE
+        heroku config:set DB_POOL_SIZE=4 DB_MAX_OVERFLOW=2
+'''
+
+DEFAULTS = {
+    'pool_size': 5,
+    'max_overflow': 10,
+    'pool_timeout': 30,
+    'pool_recycle': 1800,
+    'pool_pre_ping': True
+}
+
+
+def flag(value):
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+ENVIRONMENT = {
+    'pool_size': ('DB_POOL_SIZE', int),
+    'max_overflow': ('DB_MAX_OVERFLOW', int),
+    'pool_timeout': ('DB_POOL_TIMEOUT', float),
+    'pool_recycle': ('DB_POOL_RECYCLE', int),
+    'pool_pre_ping': ('DB_POOL_PRE_PING', flag)
+}
+
+
+def engine_options(environ=os.environ):
+    options = {'poolclass': MeteredQueuePool}
+    for name, (variable, parse) in ENVIRONMENT.items():
+        value = environ.get(variable)
+        options[name] = DEFAULTS[name] if value in (None, '') else parse(value)
+    return options
+
+
+'''
+PoolStats
+counters of one pool, updated on every checkout and checkin
+
+    a checkout waits when every connection is in use and no overflow
+    connection can be opened; its latency is the time spent getting the
+    connection, the last LATENCIES of which are kept for percentiles
+'''
+class PoolStats:
+    LATENCIES = 1000
+
+    def __init__(self):
+        self.in_use = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.failures = 0
+        self.latencies = deque(maxlen=self.LATENCIES)
+        self._lock = threading.Lock()
+
+    def checked_out(self, waited, latency):
+        with self._lock:
+            self.in_use += 1
+            self.checkouts += 1
+            self.waits += waited
+            self.latencies.append(latency)
+
+    def failed(self, waited, latency):
+        with self._lock:
+            self.failures += 1
+            self.waits += waited
+            self.latencies.append(latency)
+
+    def checked_in(self):
+        with self._lock:
+            self.in_use -= 1
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            counts = {
+                'in_use': self.in_use,
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'failures': self.failures
+            }
+
+        def at(fraction):
+            if not latencies:
+                return 0.0
+            index = min(len(latencies) - 1, int(len(latencies) * fraction))
+            return round(latencies[index] * 1000, 3)
+
+        counts['checkout_ms'] = {
+            'p50': at(0.50),
+            'p99': at(0.99),
+            'max': at(1.0)
+        }
+        return counts
+
+
+'''
+MeteredQueuePool
+a QueuePool keeping a PoolStats in its stats attribute
+'''
+class MeteredQueuePool(QueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _would_wait(self):
+        return (self._pool.qsize() == 0 and self._max_overflow > -1
+                and self._overflow >= self._max_overflow)
+
+    def _do_get(self):
+        waited = self._would_wait()
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            self.stats.failed(waited, time.perf_counter() - start)
+            raise
+        self.stats.checked_out(waited, time.perf_counter() - start)
+        return connection
+
+    def _do_return_conn(self, connection):
+        try:
+            super()._do_return_conn(connection)
+        finally:
+            self.stats.checked_in()
+
+
+'''
+pool_metrics(pool)
+    the PoolStats of a MeteredQueuePool with its current size, for this
+    process only
+    EXAMPLE
+        {"pid": 4242, "size": 5, "max_overflow": 10, "idle": 3,
+         "overflow": 0, "in_use": 2, "checkouts": 1530, "waits": 0,
+         "failures": 0, "checkout_ms": {"p50": 0.004, "p99": 0.41, "max": 12.8}}
+'''
+def pool_metrics(pool):
+    metrics = {
+        'pid': os.getpid(),
+        'size': pool.size(),
+        'max_overflow': pool._max_overflow,
+        'idle': pool.checkedin(),
+        'overflow': max(pool.overflow(), 0)
+    }
+    metrics.update(pool.stats.snapshot())
+    return metrics